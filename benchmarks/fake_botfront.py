@@ -0,0 +1,133 @@
+import asyncio
+import gzip
+import json
+import random
+import re
+from collections import Counter
+from threading import Event, Thread
+
+from aiohttp import web
+
+# tracker store fields of a query, with their alias, arguments and selection
+FIELD = re.compile(
+    r"(?<!query )(?<!mutation )(?:(\w+)\s*:\s*)?"
+    r"(trackerStore|insertTrackerStore|updateTrackerStore)\s*"
+    r"\(([^)]*)\)\s*\{([^}]*)\}"
+)
+ARGUMENT = re.compile(r"(\w+)\s*:\s*\$(\w+)")
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class FakeBotfront:
+    """In-process stand-in for the Botfront GraphQL API used by
+    `BotfrontTrackerStore`: tracker queries, inserts and updates, including
+    aliased bulk operations.
+
+    Every request waits `latency` seconds, and fails with an HTTP 500 with
+    probability `error_rate`. Trackers are kept in memory, `requests`
+    counts the requests per field."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.trackers = {}
+        self.requests = Counter()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._loop = asyncio.new_event_loop()
+        self._started = Event()
+        self._runner = None
+        self.port = None
+        Thread(target=self._run, daemon=True).start()
+        self._started.wait(10)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/graphql"
+
+    def _fetch(self, args, selection):
+        stored = self.trackers.get(args.get("senderId"))
+        if stored is None:
+            return None
+        events = stored["events"]
+        result = {
+            "lastIndex": len(events) - 1,
+            "lastTimestamp": events[-1]["timestamp"] if events else None,
+        }
+        if "tracker" in selection.split():
+            after = args.get("after")
+            new_events = events[after + 1 :] if after is not None else events
+            if args.get("maxEvents"):
+                new_events = new_events[-args["maxEvents"] :]
+            result["tracker"] = {**stored["summary"], "events": new_events}
+        return result
+
+    def _write(self, args, insert):
+        tracker = dict(args.get("tracker") or {})
+        events = tracker.pop("events", None) or []
+        stored = self.trackers.get(args["senderId"])
+        if insert or stored is None:
+            stored = self.trackers[args["senderId"]] = {"summary": {}, "events": []}
+        stored["summary"].update(tracker)
+        stored["events"].extend(events)
+        return {
+            "lastIndex": len(stored["events"]) - 1,
+            "lastTimestamp": stored["events"][-1]["timestamp"]
+            if stored["events"]
+            else None,
+        }
+
+    def execute(self, query, variables):
+        data = {}
+        for alias, field, arguments, selection in FIELD.findall(query):
+            args = {
+                name: variables.get(variable)
+                for name, variable in ARGUMENT.findall(arguments)
+            }
+            self.requests[field] += 1
+            if field == "trackerStore":
+                result = self._fetch(args, selection)
+            else:
+                result = self._write(args, field == "insertTrackerStore")
+            data[alias or field] = result
+        return {"data": data}
+
+    async def _handle(self, request):
+        body = await request.read()
+        # bytes on the wire, the body may have been decompressed by aiohttp
+        self.bytes_received += request.content_length or len(body)
+        encoding = request.headers.get("Content-Encoding", "")
+        if "gzip" in encoding and body.startswith(GZIP_MAGIC):
+            # sent with `gzip_min_bytes`
+            body = gzip.decompress(body)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._random.random() < self.error_rate:
+            self.requests["errors"] += 1
+            return web.Response(status=500, text="fake error")
+        payload = json.loads(body)
+        response = json.dumps(
+            self.execute(payload["query"], payload.get("variables") or {})
+        )
+        self.bytes_sent += len(response)
+        return web.Response(text=response, content_type="application/json")
+
+    async def _start(self):
+        app = web.Application(client_max_size=64 * 1024 ** 2)
+        app.router.add_post("/graphql", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start())
+        self._started.set()
+        self._loop.run_forever()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,156 @@
+"""Benchmark of `BotfrontTrackerStore` against an in-process fake Botfront.
+
+Runs concurrent synthetic conversations through the async retrieve/save
+path and reports latency percentiles, throughput, GraphQL requests and
+memory growth. Store options are passed as `--option key=value`:
+
+    python -m benchmarks.tracker_store --conversations 200 --turns 30 \\
+        --latency-ms 20 --option write_behind=false --option version_probe=true
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import time
+from typing import Text, Any, Dict, List
+
+from rasa.core.domain import Domain
+from rasa.core.events import ActionExecuted, BotUttered, UserUttered
+from rasa.core.trackers import DialogueStateTracker
+
+from benchmarks.fake_botfront import FakeBotfront
+from rasa_addons.core.tracker_stores.botfront import BotfrontTrackerStore
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # peak instead of current resident size, in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def turn_events(turn: int) -> List[Any]:
+    text = f"message {turn}"
+    parse_data = {
+        "intent": {"name": "greet", "confidence": 1.0},
+        "entities": [],
+        "text": text,
+    }
+    return [
+        UserUttered(text, parse_data["intent"], [], parse_data),
+        ActionExecuted("utter_greet", policy="policy_0_MemoizationPolicy"),
+        BotUttered(f"reply {turn}", {"buttons": None}),
+        ActionExecuted("action_listen", policy="policy_0_MemoizationPolicy"),
+    ]
+
+
+async def run_conversation(
+    store: BotfrontTrackerStore,
+    domain: Domain,
+    sender_id: Text,
+    turns: int,
+    latencies: Dict[Text, List[float]],
+) -> None:
+    for turn in range(turns):
+        start = time.perf_counter()
+        tracker = await store.retrieve_async(sender_id)
+        latencies["retrieve"].append(time.perf_counter() - start)
+        if tracker is None:
+            tracker = DialogueStateTracker(sender_id, domain.slots)
+        for event in turn_events(turn):
+            tracker.update(event)
+        start = time.perf_counter()
+        await store.save_async(tracker)
+        latencies["save"].append(time.perf_counter() - start)
+
+
+async def run(args, options: Dict[Text, Any]) -> Dict[Text, Any]:
+    server = FakeBotfront(args.latency_ms / 1000, args.error_rate, seed=args.seed)
+    domain = Domain.empty()
+    store = BotfrontTrackerStore(domain, server.url, **options)
+    latencies = {"retrieve": [], "save": []}
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[
+            run_conversation(store, domain, f"user{i}", args.turns, latencies)
+            for i in range(args.conversations)
+        ]
+    )
+    elapsed = time.perf_counter() - start
+    rss_after = rss_bytes()
+    await store.close()
+    server.stop()
+    # events saved by the store but not stored by Botfront, e.g. lost writes
+    expected_events = args.turns * len(turn_events(0))
+    missing_events = sum(
+        expected_events - len(server.trackers.get(f"user{i}", {}).get("events", []))
+        for i in range(args.conversations)
+    )
+
+    def summary(values):
+        return {
+            "p50_ms": percentile(values, 0.5) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": max(values, default=0) * 1000,
+        }
+
+    turns = args.conversations * args.turns
+    return {
+        "conversations": args.conversations,
+        "turns": turns,
+        "seconds": elapsed,
+        "turns_per_second": turns / elapsed if elapsed else 0,
+        "retrieve": summary(latencies["retrieve"]),
+        "save": summary(latencies["save"]),
+        "requests": dict(server.requests),
+        "missing_events": missing_events,
+        "bytes_sent_to_botfront": server.bytes_received,
+        "bytes_received_from_botfront": server.bytes_sent,
+        "rss_growth_mb": (rss_after - rss_before) / 1024 ** 2,
+        "store": store.stats(),
+    }
+
+
+def parse_options(values: List[Text]) -> Dict[Text, Any]:
+    options = {}
+    for value in values:
+        key, _, raw = value.partition("=")
+        try:
+            options[key] = json.loads(raw)
+        except ValueError:
+            options[key] = raw
+    return options
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--option", action="append", default=[], help="store option, key=value"
+    )
+    args = parser.parse_args(argv)
+    os.environ.setdefault("BF_PROJECT_ID", "benchmark")
+
+    loop = asyncio.get_event_loop()
+    report = loop.run_until_complete(run(args, parse_options(args.option)))
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -337,6 +337,15 @@ class ActionBotfrontForm(Action):
         logger.debug(f"Failed to extract requested slot '{slot_to_fill}'")
         return {}
 
+    def post_validation_template(self, slot, valid: bool) -> Optional[Text]:
+        if (
+            valid
+            and self.get_field_for_slot(slot, "utter_on_new_valid_slot", False) is False
+        ):
+            return None
+        valid = "valid" if valid else "invalid"
+        return f"utter_{valid}_{slot}"
+
     async def utter_post_validation(
         self,
         slot,
@@ -347,21 +356,51 @@ class ActionBotfrontForm(Action):
         tracker: "DialogueStateTracker",
         domain: "Domain",
     ) -> List[Event]:
-        if (
-            valid
-            and self.get_field_for_slot(slot, "utter_on_new_valid_slot", False) is False
-        ):
+        template_name = self.post_validation_template(slot, valid)
+        if template_name is None:
             return []
-        valid = "valid" if valid else "invalid"
 
         # so utter_(in)valid_slot supports {slot} template replacements
         temp_tracker = tracker.copy()
         temp_tracker.slots[slot].value = value
         template = await nlg.generate(
-            f"utter_{valid}_{slot}", temp_tracker, output_channel.name(),
+            template_name, temp_tracker, output_channel.name(),
         )
         return [create_bot_utterance(template)]
 
+    async def utter_post_validations(
+        self,
+        utterances: List[Tuple[Text, Any, bool]],
+        output_channel: "OutputChannel",
+        nlg: "NaturalLanguageGenerator",
+        tracker: "DialogueStateTracker",
+        domain: "Domain",
+    ) -> List[List[Event]]:
+        """`utter_post_validation` for several (slot, value, valid) at once.
+        The GraphQL NLG resolves all the templates in a single request, with
+        the values of all these slots."""
+
+        if len(utterances) < 2 or not hasattr(nlg, "generate_many"):
+            return [
+                await self.utter_post_validation(
+                    slot, value, valid, output_channel, nlg, tracker, domain
+                )
+                for slot, value, valid in utterances
+            ]
+
+        temp_tracker = tracker.copy()
+        for slot, value, _ in utterances:
+            temp_tracker.slots[slot].value = value
+        templates = await nlg.generate_many(
+            [
+                self.post_validation_template(slot, valid)
+                for slot, _, valid in utterances
+            ],
+            temp_tracker,
+            output_channel.name(),
+        )
+        return [[create_bot_utterance(template)] for template in templates]
+
     async def validate_slots(
         self,
         slot_dict: Dict[Text, Any],
@@ -371,6 +410,8 @@ class ActionBotfrontForm(Action):
         domain: "Domain",
     ) -> List[Event]:
         events = []
+        # (index in events, (slot, value, valid)) of the slots to utter about
+        utterances = []
         for slot, value in list(slot_dict.items()):
             validation_rule = self.get_field_for_slot(slot, "validation")
             validated = validate_with_rule(value, validation_rule)
@@ -386,10 +427,19 @@ class ActionBotfrontForm(Action):
                 and tracker.events[-1].key == slot
                 and tracker.events[-1].value == value
             ):
-                events += await self.utter_post_validation(
-                    slot, value, validated, output_channel, nlg, tracker, domain
-                )
+                if self.post_validation_template(slot, validated) is not None:
+                    utterances.append((len(events), (slot, value, validated)))
 
+        uttered = await self.utter_post_validations(
+            [utterance for _, utterance in utterances],
+            output_channel,
+            nlg,
+            tracker,
+            domain,
+        )
+        # each utterance follows the SlotSet of its slot
+        for (index, _), utterance_events in reversed(list(zip(utterances, uttered))):
+            events[index:index] = utterance_events
         return events
 
     async def validate(
@@ -1,11 +1,11 @@
 import logging
 
-from sgqlc.endpoint.http import HTTPEndpoint
 import urllib.error
 import os
 
+from rasa_addons.core.graphql_endpoint import HTTPEndpoint
+
 logger = logging.getLogger(__name__)
-logging.getLogger("sgqlc.endpoint.http").setLevel(logging.WARNING)
 
 SUBMIT_FORM = """
 mutation(
@@ -25,8 +25,8 @@ def submit_form_to_botfront(tracker,) -> None:
     project_id = os.environ.get("BF_PROJECT_ID")
     bf_url = os.environ.get("BF_URL", "server")
     api_key = os.environ.get("API_KEY")
-    headers = [{"Authorization": api_key}] if api_key else []
-    endpoint = HTTPEndpoint(bf_url, *headers)
+    headers = {"Authorization": api_key} if api_key else {}
+    endpoint = HTTPEndpoint(bf_url, headers)
 
     try:
         response = endpoint(
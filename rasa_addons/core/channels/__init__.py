@@ -1,5 +1,6 @@
 from rasa_addons.core.channels.facebook_messenger import FBMessengerInput
+from rasa_addons.core.channels.metrics import MetricsInput
 from rasa_addons.core.channels.rest import BotfrontRestInput
 from rasa_addons.core.channels.rest_plus import BotfrontRestPlusInput
 from rasa_addons.core.channels.webchat import WebchatInput
-from rasa_addons.core.channels.webchat_plus import WebchatPlusInput
\ No newline at end of file
+from rasa_addons.core.channels.webchat_plus import WebchatPlusInput
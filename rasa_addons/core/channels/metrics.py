@@ -0,0 +1,57 @@
+import inspect
+import logging
+from typing import Text, Any, Dict, Optional, Callable, Awaitable
+
+from rasa.core.channels.channel import InputChannel, UserMessage
+from sanic import Blueprint, response
+from sanic.request import Request
+from sanic.response import HTTPResponse
+
+from rasa_addons.core.metrics import CONTENT_TYPE, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsInput(InputChannel):
+    """Serves the metrics of the process (e.g. of `BotfrontTrackerStore`) at
+    `/metrics` in the Prometheus text format. When a `token` is set in the
+    credentials, scrapers must send it as a bearer token."""
+
+    @classmethod
+    def name(cls) -> Text:
+        return "metrics"
+
+    @classmethod
+    def from_credentials(cls, credentials: Optional[Dict[Text, Any]]) -> InputChannel:
+        credentials = credentials or {}
+        return cls(credentials.get("token"))
+
+    def __init__(self, token: Optional[Text] = None) -> None:
+        self.token = token
+
+    def url_prefix(self) -> Text:
+        # served at /metrics instead of under /webhooks
+        return "/metrics"
+
+    def _is_authorized(self, request: Request) -> bool:
+        if not self.token:
+            return True
+        return request.headers.get("Authorization") == f"Bearer {self.token}"
+
+    def blueprint(
+        self, on_new_message: Callable[[UserMessage], Awaitable[None]]
+    ) -> Blueprint:
+        metrics_webhook = Blueprint(
+            "metrics_webhook_{}".format(type(self).__name__),
+            inspect.getmodule(self).__name__,
+        )
+
+        @metrics_webhook.route("", methods=["GET"])
+        async def metrics(request: Request) -> HTTPResponse:
+            if not self._is_authorized(request):
+                return response.text("unauthorized", status=401)
+            return response.raw(
+                REGISTRY.exposition().encode("utf-8"), content_type=CONTENT_TYPE
+            )
+
+        return metrics_webhook
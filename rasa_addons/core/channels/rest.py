@@ -10,6 +10,9 @@ from typing import Text, List, Dict, Any, Optional, Callable, Iterable, Awaitabl
 from rasa.core import utils
 from sanic.response import HTTPResponse
 
+from rasa_addons.core.graphql_endpoint import close_on_server_stop
+from rasa_addons.core.tracker_stores.botfront import warm_trackers
+
 logger = logging.getLogger(__name__)
 
 
@@ -142,6 +145,7 @@ class BotfrontRestInput(RestInput):
             "custom_webhook_{}".format(type(self).__name__),
             inspect.getmodule(self).__name__,
         )
+        on_new_message = warm_trackers(custom_webhook, on_new_message)
 
         # noinspection PyUnusedLocal
         @custom_webhook.route("/", methods=["GET"])
@@ -190,4 +194,5 @@ class BotfrontRestInput(RestInput):
                     )
                 return response.json(collector.messages)
 
+        close_on_server_stop(custom_webhook)
         return custom_webhook
@@ -18,6 +18,8 @@ from sanic.response import HTTPResponse
 from rasa_addons.core.channels.rest import BotfrontRestInput, BotfrontRestOutput
 from rasa.utils.endpoints import EndpointConfig
 from rasa_addons.core.channels.graphql import get_config_via_graphql
+from rasa_addons.core.graphql_endpoint import close_on_server_stop
+from rasa_addons.core.tracker_stores.botfront import warm_trackers
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +40,7 @@ class BotfrontRestPlusInput(BotfrontRestInput):
             "custom_webhook_{}".format(type(self).__name__),
             inspect.getmodule(self).__name__,
         )
+        on_new_message = warm_trackers(custom_webhook, on_new_message)
 
         # noinspection PyUnusedLocal
         @custom_webhook.route("/", methods=["GET"])
@@ -101,4 +104,5 @@ class BotfrontRestPlusInput(BotfrontRestInput):
                     )
                 return response.json(collector.messages)
 
+        close_on_server_stop(custom_webhook)
         return custom_webhook
@@ -12,6 +12,9 @@ from typing import Text, List, Dict, Any, Optional, Callable, Iterable, Awaitabl
 from rasa.core.channels.channel import UserMessage, InputChannel
 from rasa.core.channels.socketio import SocketIOInput, SocketIOOutput, SocketBlueprint
 
+from rasa_addons.core.graphql_endpoint import close_on_server_stop
+from rasa_addons.core.tracker_stores.botfront import warm_trackers
+
 logger = logging.getLogger(__name__)
 
 
@@ -183,6 +186,7 @@ class WebchatInput(SocketIOInput):
         socketio_webhook = SocketBlueprint(
             sio, self.socketio_path, "socketio_webhook", __name__
         )
+        on_new_message = warm_trackers(socketio_webhook, on_new_message)
 
         # make sio object static to use in get_output_channel
         self.sio = sio
@@ -237,4 +241,5 @@ class WebchatInput(SocketIOInput):
             )
             await on_new_message(message)
 
+        close_on_server_stop(socketio_webhook)
         return socketio_webhook
@@ -16,6 +16,8 @@ from rasa.core.channels.channel import InputChannel
 from rasa_addons.core.channels.webchat import WebchatOutput
 from rasa_addons.core.channels.webchat import WebchatInput
 from rasa_addons.core.channels.graphql import get_config_via_graphql
+from rasa_addons.core.graphql_endpoint import close_on_server_stop
+from rasa_addons.core.tracker_stores.botfront import warm_trackers
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +69,7 @@ class WebchatPlusInput(WebchatInput):
         socketio_webhook = SocketBlueprint(
             sio, self.socketio_path, "socketio_webhook", __name__
         )
+        on_new_message = warm_trackers(socketio_webhook, on_new_message)
 
         # make sio object static to use in get_output_channel
         self.sio = sio
@@ -135,4 +138,5 @@ class WebchatPlusInput(WebchatInput):
             )
             await on_new_message(message)
 
+        close_on_server_stop(socketio_webhook)
         return socketio_webhook
@@ -0,0 +1,138 @@
+import gzip
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Text, Any, Callable, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# compression level of request bodies, favoring speed over size
+GZIP_LEVEL = 5
+
+
+def _default(obj: Any) -> Any:
+    # numpy scalars and arrays, e.g. intent confidences
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(
+        obj, separators=(",", ":"), ensure_ascii=False, default=_default
+    ).encode("utf-8")
+
+
+class Codec:
+    """A JSON implementation: `dumps` returns utf-8 bytes, `loads` takes
+    bytes or text. Values it cannot encode (e.g. integers over 64 bits for
+    orjson) fall back to the standard library."""
+
+    def __init__(
+        self,
+        name: Text,
+        dumps: Callable[[Any], bytes],
+        loads: Callable[[Union[bytes, Text]], Any],
+    ) -> None:
+        self.name = name
+        self._dumps = dumps
+        self.loads = loads
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return self._dumps(obj)
+        except (TypeError, OverflowError, ValueError):
+            if self._dumps is _json_dumps:
+                raise
+            return _json_dumps(obj)
+
+    def __repr__(self):
+        return f"Codec({self.name})"
+
+
+CODECS = OrderedDict()  # fastest first
+
+try:
+    import orjson
+
+    CODECS["orjson"] = Codec(
+        "orjson",
+        lambda obj: orjson.dumps(
+            obj, default=_default, option=orjson.OPT_NON_STR_KEYS
+        ),
+        orjson.loads,
+    )
+except ImportError:
+    pass
+
+try:
+    import ujson
+
+    CODECS["ujson"] = Codec(
+        "ujson",
+        lambda obj: ujson.dumps(obj, ensure_ascii=False).encode("utf-8"),
+        ujson.loads,
+    )
+except ImportError:
+    pass
+
+CODECS["json"] = Codec("json", _json_dumps, json.loads)
+
+_codec = next(iter(CODECS.values()))
+
+
+def available_codecs() -> List[Text]:
+    return list(CODECS)
+
+
+def get_codec() -> Codec:
+    return _codec
+
+
+def use_codec(name: Text) -> Codec:
+    """Select the JSON implementation used by `dumps` and `loads`, by default
+    the fastest one installed or the one set in `BF_JSON_CODEC`."""
+
+    global _codec
+    if name not in CODECS:
+        raise ValueError(
+            f"JSON codec {name} is not available, use one of {available_codecs()}"
+        )
+    _codec = CODECS[name]
+    return _codec
+
+
+if os.environ.get("BF_JSON_CODEC"):
+    try:
+        use_codec(os.environ["BF_JSON_CODEC"])
+    except ValueError as e:
+        logger.warning(str(e))
+
+
+def dumps(obj: Any) -> bytes:
+    return _codec.dumps(obj)
+
+
+def loads(data: Union[bytes, Text]) -> Any:
+    return _codec.loads(data)
+
+
+def encode_body(
+    obj: Any, gzip_min_bytes: Optional[int] = None
+) -> Tuple[bytes, Dict[Text, Text]]:
+    """Encode a request body, gzipped if it is at least `gzip_min_bytes` long
+    (e.g. a long tracker). Returns the body and its headers."""
+
+    data = dumps(obj)
+    headers = {"Content-Type": "application/json"}
+    if gzip_min_bytes is not None and len(data) >= gzip_min_bytes:
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return data, headers
+
+
+def decode_body(data: bytes, content_encoding: Optional[Text] = None) -> Any:
+    if content_encoding and "gzip" in content_encoding:
+        data = gzip.decompress(data)
+    return loads(data)
@@ -0,0 +1,77 @@
+import asyncio
+from typing import Any, Callable, Awaitable, Hashable
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing a key.
+
+    While a call for a key is running, other callers for the same key wait for
+    its result instead of starting their own. The call is shielded, so one
+    caller being cancelled does not cancel it for the others."""
+
+    def __init__(self) -> None:
+        self._calls = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+
+            def forget(done):
+                if self._calls.get(key) is done:
+                    del self._calls[key]
+
+            future.add_done_callback(forget)
+        return await asyncio.shield(future)
+
+
+class _KeyedLockContext:
+    def __init__(self, keyed_lock: "KeyedLock", key: Hashable) -> None:
+        self._keyed_lock = keyed_lock
+        self._key = key
+
+    async def __aenter__(self):
+        locks = self._keyed_lock._locks
+        lock, users = locks.get(self._key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        locks[self._key] = (lock, users + 1)
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._release_user()
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        lock, _ = self._keyed_lock._locks[self._key]
+        lock.release()
+        self._release_user()
+
+    def _release_user(self):
+        locks = self._keyed_lock._locks
+        lock, users = locks[self._key]
+        if users == 1:
+            del locks[self._key]
+        else:
+            locks[self._key] = (lock, users - 1)
+
+
+class KeyedLock:
+    """One asyncio lock per key, dropped once nobody holds or waits for it.
+
+        async with keyed_lock(sender_id):
+            ...
+    """
+
+    def __init__(self) -> None:
+        self._locks = {}
+
+    def __call__(self, key: Hashable) -> _KeyedLockContext:
+        return _KeyedLockContext(self, key)
+
+    def __len__(self) -> int:
+        return len(self._locks)
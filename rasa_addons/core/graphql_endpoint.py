@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import urllib.error
+import urllib.request
+import weakref
+from typing import Text, Any, Callable, Dict, Optional
+
+import aiohttp
+
+from rasa_addons.core import codec
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_SIZE = 100
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+
+# every async endpoint, to close their sessions when the server stops
+_async_endpoints = weakref.WeakSet()
+
+
+def graphql_body(
+    query: Text, variables: Optional[Dict[Text, Any]], operation_name: Optional[Text]
+) -> Dict[Text, Any]:
+    body = {"query": query, "variables": variables or {}}
+    if operation_name:
+        body["operationName"] = operation_name
+    return body
+
+
+def _error_response(message: Text) -> Dict[Text, Any]:
+    return {"data": None, "errors": [{"message": message}]}
+
+
+class HTTPEndpoint:
+    """Drop-in for sgqlc's ``HTTPEndpoint``, encoding with the fast JSON codec
+    of `rasa_addons.core.codec` instead of the standard library.
+
+    Request bodies of at least `gzip_min_bytes` are gzipped, and so can the
+    responses be. HTTP errors are returned as GraphQL errors like sgqlc
+    does, other transport errors raise ``urllib.error.URLError``.
+    `on_transfer` is called with the bytes sent and received."""
+
+    def __init__(
+        self,
+        url: Text,
+        base_headers: Optional[Dict[Text, Text]] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        gzip_min_bytes: Optional[int] = None,
+        on_transfer: Optional[Callable[[int, int], None]] = None,
+    ) -> None:
+        self.url = url
+        self.base_headers = base_headers or {}
+        self.timeout = timeout
+        self.gzip_min_bytes = gzip_min_bytes
+        self.on_transfer = on_transfer
+
+    def __call__(
+        self,
+        query: Text,
+        variables: Optional[Dict[Text, Any]] = None,
+        operation_name: Optional[Text] = None,
+        extra_headers: Optional[Dict[Text, Text]] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[Text, Any]:
+        data, headers = codec.encode_body(
+            graphql_body(query, variables, operation_name), self.gzip_min_bytes
+        )
+        request = urllib.request.Request(
+            self.url,
+            data=data,
+            headers={
+                **self.base_headers,
+                **headers,
+                "Accept-Encoding": "gzip",
+                **(extra_headers or {}),
+            },
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as f:
+                content = f.read()
+                content_encoding = f.headers.get("Content-Encoding")
+        except urllib.error.HTTPError as e:
+            try:
+                response = codec.decode_body(
+                    e.read(), e.headers.get("Content-Encoding")
+                )
+            except (ValueError, OSError):
+                response = None
+            if isinstance(response, dict) and response.get("errors"):
+                return response
+            return _error_response(f"HTTP {e.code}: {e.reason}")
+        if self.on_transfer is not None:
+            self.on_transfer(len(data), len(content))
+        try:
+            return codec.decode_body(content, content_encoding) or {}
+        except (ValueError, OSError) as e:
+            return _error_response(f"Invalid JSON response: {e}")
+
+    def __str__(self):
+        return "%s(url=%s, timeout=%s)" % (
+            self.__class__.__name__,
+            self.url,
+            self.timeout,
+        )
+
+
+class AsyncHTTPEndpoint:
+    """Asynchronous counterpart of `HTTPEndpoint`.
+
+    All requests share one ``aiohttp`` session with a pooled keep-alive
+    connector, so GraphQL calls never block the event loop and do not pay
+    a new TCP handshake each time. Transport errors are raised as
+    ``urllib.error.URLError`` to match the synchronous endpoint."""
+
+    def __init__(
+        self,
+        url: Text,
+        base_headers: Optional[Dict[Text, Text]] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+        gzip_min_bytes: Optional[int] = None,
+        on_transfer: Optional[Callable[[int, int], None]] = None,
+    ) -> None:
+        self.url = url
+        self.base_headers = base_headers or {}
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.gzip_min_bytes = gzip_min_bytes
+        self.on_transfer = on_transfer
+        self._session = None
+        self._loop = None
+        _async_endpoints.add(self)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_event_loop()
+        # sessions are bound to the loop they were created in
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size, keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.base_headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._loop = loop
+        return self._session
+
+    async def __call__(
+        self,
+        query: Text,
+        variables: Optional[Dict[Text, Any]] = None,
+        operation_name: Optional[Text] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[Text, Any]:
+        data, headers = codec.encode_body(
+            graphql_body(query, variables, operation_name), self.gzip_min_bytes
+        )
+        request_timeout = (
+            aiohttp.ClientTimeout(total=timeout) if timeout is not None else None
+        )
+
+        try:
+            async with self._get_session().post(
+                self.url, data=data, headers=headers, timeout=request_timeout
+            ) as resp:
+                content = await resp.read()
+                if self.on_transfer is not None:
+                    self.on_transfer(len(data), len(content))
+                try:
+                    # already decompressed by aiohttp
+                    response = codec.loads(content)
+                except ValueError:
+                    response = None
+                if resp.status >= 400 and not (response or {}).get("errors"):
+                    return _error_response(f"HTTP {resp.status}: {resp.reason}")
+                return response or {}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise urllib.error.URLError(str(e) or e.__class__.__name__)
+
+    async def close(self) -> None:
+        # a session of another loop cannot be closed from this one
+        if (
+            self._session is not None
+            and not self._session.closed
+            and self._loop is asyncio.get_event_loop()
+        ):
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    def __str__(self):
+        return "%s(url=%s, timeout=%s, pool_size=%s)" % (
+            self.__class__.__name__,
+            self.url,
+            self.timeout,
+            self.pool_size,
+        )
+
+
+async def close_all() -> None:
+    """Close the sessions of every `AsyncHTTPEndpoint`."""
+
+    for endpoint in list(_async_endpoints):
+        await endpoint.close()
+
+
+def close_on_server_stop(blueprint) -> None:
+    """Close the endpoint sessions when the server running `blueprint` (a
+    Sanic blueprint, e.g. of an input channel) stops."""
+
+    @blueprint.listener("after_server_stop")
+    async def close_endpoints(app, loop):
+        await close_all()
@@ -0,0 +1,250 @@
+import math
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from threading import Lock
+from typing import Text, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+Sample = Tuple[Text, Dict[Text, Text], float]
+
+
+class _CounterValue:
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> List[Sample]:
+        return [("", {}, self.value)]
+
+
+class _GaugeValue(_CounterValue):
+    def __init__(self) -> None:
+        super().__init__()
+        self._function = None
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Compute the value when collected instead, e.g. a cache size."""
+
+        self._function = function
+
+    def samples(self) -> List[Sample]:
+        value = self._function() if self._function is not None else self.value
+        return [("", {}, value)]
+
+
+class _Timer:
+    __slots__ = ("_observe", "_start")
+
+    def __init__(self, observe: Callable[[float], None]) -> None:
+        self._observe = observe
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._observe(time.perf_counter() - self._start)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self) -> _Timer:
+        """Context manager observing the time spent in its block."""
+
+        return _Timer(self.observe)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        samples, cumulative = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            samples.append(("_bucket", {"le": _format_value(bound)}, cumulative))
+        samples.append(("_sum", {}, total))
+        samples.append(("_count", {}, cumulative))
+        return samples
+
+
+class _Metric:
+    """A metric family: one value per combination of label values.
+
+    The value of a combination is created on first use of `labels`, and can
+    be kept by the caller to skip the lookup on hot paths. Metrics without
+    labels forward `inc`, `set`, `observe` etc. to their only value."""
+
+    kind = "untyped"
+
+    def __init__(
+        self, name: Text, documentation: Text, labels: Iterable[Text] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = Lock()
+        if not self.label_names:
+            self._default = self.labels()
+
+    def _new_value(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: Any) -> Any:
+        value = self._values.get(values)
+        if value is None:
+            values = tuple(str(v) for v in values)
+            if len(values) != len(self.label_names):
+                raise ValueError(
+                    f"{self.name} expects labels {self.label_names}, got {values}"
+                )
+            with self._lock:
+                value = self._values.setdefault(values, self._new_value())
+        return value
+
+    def __getattr__(self, name: Text) -> Any:
+        # `inc`, `observe` etc. of metrics without labels
+        if name.startswith("_") or self.label_names:
+            raise AttributeError(name)
+        return getattr(self._default, name)
+
+    def collect(self) -> List[Sample]:
+        samples = []
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            labels = dict(zip(self.label_names, label_values))
+            for suffix, extra_labels, sample in value.samples():
+                samples.append((self.name + suffix, {**labels, **extra_labels}, sample))
+        return samples
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_value(self) -> _CounterValue:
+        return _CounterValue()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_value(self) -> _GaugeValue:
+        return _GaugeValue()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: Text,
+        documentation: Text,
+        labels: Iterable[Text] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels)
+
+    def _new_value(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+
+def _format_value(value: float) -> Text:
+    if math.isnan(value):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: Text) -> Text:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """Metrics of the process, exposed in the Prometheus text format.
+
+    Metrics are registered once by name: registering a name again returns
+    the existing metric, so that several instances of a component (e.g.
+    tracker stores) share their metrics."""
+
+    def __init__(self) -> None:
+        self._metrics = OrderedDict()
+        self._lock = Lock()
+
+    def _register(self, cls, name: Text, *args, **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(
+        self, name: Text, documentation: Text, labels: Iterable[Text] = ()
+    ) -> Counter:
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(
+        self, name: Text, documentation: Text, labels: Iterable[Text] = ()
+    ) -> Gauge:
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(
+        self,
+        name: Text,
+        documentation: Text,
+        labels: Iterable[Text] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labels, buckets)
+
+    def get(self, name: Text) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def exposition(self) -> Text:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.collect():
+                if labels:
+                    label_text = ",".join(
+                        f'{k}="{_escape(v)}"' for k, v in labels.items()
+                    )
+                    name = f"{name}{{{label_text}}}"
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+import urllib.error
+from collections import OrderedDict
+from typing import Text, Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from rasa_addons.core import codec
+from rasa_addons.core.concurrency import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1000
+
+
+class ResponseCache:
+    """LRU cache of NLG responses, fresh for `ttl` seconds.
+
+    Once expired, an entry is still served for `stale_ttl` seconds while it
+    is refreshed in the background (stale-while-revalidate). Concurrent
+    misses of a key share one request. Responses are kept encoded, so
+    every hit returns a copy the caller can modify."""
+
+    def __init__(
+        self,
+        ttl: float,
+        stale_ttl: float = 0,
+        max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (encoded response, fetched at)
+        self._requests = SingleFlight()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, key: Hashable, response: Any) -> bytes:
+        encoded = codec.dumps(response)
+        self._entries[key] = (encoded, time.time())
+        self._entries.move_to_end(key)
+        while self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return encoded
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> bytes:
+        return self._store(key, await fetch())
+
+    async def _refresh(self, key: Hashable, response: Awaitable[Any]) -> None:
+        try:
+            await self._requests.do(key, lambda: self._fetch(key, lambda: response))
+        except urllib.error.URLError as e:
+            # the stale response is served until it can be refreshed
+            logger.debug(f"Could not refresh NLG response {key}: {e.reason}")
+        except Exception as e:
+            # e.g. an invalid response, nobody is awaiting the refresh
+            logger.error(f"Could not refresh NLG response {key}: {e}")
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached response for `key`, or the one `fetch` returns.
+        Errors raised by `fetch` are not cached.
+
+        A stale response is refreshed with the awaitable `fetch` returns when
+        it is looked up, so `fetch` must build its request when called: the
+        state `key` was computed from may have changed once it is awaited."""
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            encoded, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return codec.loads(encoded)
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                if not self._requests.in_flight(key):
+                    asyncio.ensure_future(self._refresh(key, fetch()))
+                return codec.loads(encoded)
+            del self._entries[key]
+        self.misses += 1
+        encoded = await self._requests.do(key, lambda: self._fetch(key, fetch))
+        return codec.loads(encoded)
+
+    def lookup(self, key: Hashable) -> Optional[Any]:
+        """The fresh cached response for `key`, if any."""
+
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry[1] >= self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return codec.loads(entry[0])
+
+    def put(self, key: Hashable, response: Any) -> None:
+        self._store(key, response)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[Text, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
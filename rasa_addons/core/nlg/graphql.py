@@ -1,5 +1,8 @@
+import asyncio
 import logging
-from typing import Text, Any, Dict, Optional, List
+from functools import lru_cache
+from itertools import islice
+from typing import Text, Any, Callable, Dict, Optional, List, Tuple, Union
 
 from rasa.core.constants import DEFAULT_REQUEST_TIMEOUT
 from rasa.core.nlg.generator import NaturalLanguageGenerator
@@ -8,10 +11,26 @@ from rasa.utils.endpoints import EndpointConfig
 import os
 import urllib.error
 
+from rasa_addons.core import codec
+from rasa_addons.core.graphql_endpoint import AsyncHTTPEndpoint, DEFAULT_POOL_SIZE
+from rasa_addons.core.nlg.cache import DEFAULT_MAX_ENTRIES, ResponseCache
+
 logger = logging.getLogger(__name__)
 
+# tracker fields sent with the `slim` payload, enough for the responses using
+# slots, the latest message or the language
+SLIM_TRACKER_FIELDS = [
+    "sender_id",
+    "slots",
+    "latest_message",
+    "latest_event_time",
+    "latest_input_channel",
+    "paused",
+    "active_form",
+]
+DEFAULT_SLIM_EVENTS = 10
 
-NLG_QUERY = """
+CAROUSEL_FRAGMENT = """
 fragment CarouselElementFields on CarouselElement {
     title
     subtitle
@@ -19,7 +38,21 @@ fragment CarouselElementFields on CarouselElement {
     default_action { title, type, ...on WebUrlButton { url }, ...on PostbackButton { payload } }
     buttons { title, type, ...on WebUrlButton { url }, ...on PostbackButton { payload } }
 }
-query(
+"""
+
+RESPONSE_FIELDS = """{
+        metadata
+        ...on TextPayload { text }
+        ...on QuickRepliesPayload { text, quick_replies { title, type, ...on WebUrlButton { url }, ...on PostbackButton { payload } } }
+        ...on TextWithButtonsPayload { text, buttons { title, type, ...on WebUrlButton { url }, ...on PostbackButton { payload } } }
+        ...on ImagePayload { text, image }
+        ...on CarouselPayload { template_type, elements { ...CarouselElementFields } }
+        ...on CustomPayload { customText: text, customImage: image, customQuickReplies: quick_replies, customButtons: buttons, customElements: elements, custom, customAttachment: attachment }
+    }"""
+
+NLG_QUERY = (
+    CAROUSEL_FRAGMENT
+    + """query(
     $template: String!
     $arguments: Any
     $tracker: ConversationInput
@@ -30,17 +63,29 @@ query(
         arguments: $arguments
         tracker: $tracker
         channel: $channel
-    ) {
-        metadata
-        ...on TextPayload { text }
-        ...on QuickRepliesPayload { text, quick_replies { title, type, ...on WebUrlButton { url }, ...on PostbackButton { payload } } }
-        ...on TextWithButtonsPayload { text, buttons { title, type, ...on WebUrlButton { url }, ...on PostbackButton { payload } } }
-        ...on ImagePayload { text, image }
-        ...on CarouselPayload { template_type, elements { ...CarouselElementFields } }
-        ...on CustomPayload { customText: text, customImage: image, customQuickReplies: quick_replies, customButtons: buttons, customElements: elements, custom, customAttachment: attachment }
-    }
+    ) %s
 }
 """
+    % RESPONSE_FIELDS
+)
+
+
+def batch_nlg_query(count):
+    """Query resolving several templates at once, one alias (t0, t1...) per
+    template, sharing the tracker and channel variables."""
+
+    variables = ["$tracker: ConversationInput", "$channel: NlgRequestChannel"]
+    fields = []
+    for i in range(count):
+        variables += [f"$template{i}: String!", f"$arguments{i}: Any"]
+        fields.append(
+            f"t{i}: getResponse(template: $template{i}, arguments: $arguments{i}, "
+            f"tracker: $tracker, channel: $channel) {RESPONSE_FIELDS}"
+        )
+    query = "query batchGetResponses(\n    {}\n) {{\n    {}\n}}\n".format(
+        "\n    ".join(variables), "\n    ".join(fields)
+    )
+    return CAROUSEL_FRAGMENT + query
 
 
 def nlg_response_format_spec():
@@ -59,6 +104,72 @@ def nlg_response_format_spec():
     }
 
 
+_JSON_TYPES = {
+    "string": str,
+    "null": type(None),
+    "array": list,
+    "object": dict,
+    "boolean": bool,
+    "number": (int, float),
+    "integer": int,
+}
+
+
+def compile_schema_check(schema: Dict[Text, Any]) -> Callable[[Any], bool]:
+    """Compile a JSON schema using only `type`, `properties` and `items` into
+    a function telling whether a value is valid, without going through
+    jsonschema. Schemas using other keywords are never considered valid, so
+    that jsonschema decides."""
+
+    if set(schema) - {"type", "properties", "items"}:
+        return lambda value: False
+
+    types = schema.get("type")
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        python_types = tuple(_JSON_TYPES[t] for t in types)
+        # booleans are ints in python, but not numbers in JSON
+        exclude_bool = "boolean" not in types
+    properties = [
+        (name, compile_schema_check(subschema))
+        for name, subschema in schema.get("properties", {}).items()
+    ]
+    items = schema.get("items")
+    if items is not None:
+        items = compile_schema_check(items)
+
+    def check(value: Any) -> bool:
+        if types is not None:
+            if not isinstance(value, python_types):
+                return False
+            if exclude_bool and isinstance(value, bool):
+                return False
+        if properties and isinstance(value, dict):
+            for name, check_property in properties:
+                if name in value and not check_property(value[name]):
+                    return False
+        if items is not None and isinstance(value, list):
+            return all(items(item) for item in value)
+        return True
+
+    return check
+
+
+# the response schema is checked on every utterance, compiled once
+is_valid_response = compile_schema_check(nlg_response_format_spec())
+
+
+@lru_cache(maxsize=None)
+def response_validator():
+    """jsonschema validator of `nlg_response_format_spec`, used to report the
+    errors of the responses the fast check rejects."""
+
+    from jsonschema.validators import validator_for
+
+    spec = nlg_response_format_spec()
+    return validator_for(spec)(spec)
+
+
 def nlg_request_format_spec():
     """Expected request schema for requests sent to an NLG endpoint."""
 
@@ -83,15 +194,45 @@ def nlg_request_format_spec():
     }
 
 
+def tracker_projection(
+    fields: Optional[List[Text]] = None, max_events: Optional[int] = None
+) -> Callable[[DialogueStateTracker], Dict[Text, Any]]:
+    """Serialize a tracker with only `fields` and its last `max_events`
+    events, instead of all of its events."""
+
+    def project(tracker: DialogueStateTracker) -> Dict[Text, Any]:
+        # the events are not serialized by `current_state` with NONE
+        state = tracker.current_state(EventVerbosity.NONE)
+        if fields is not None:
+            state = {field: state.get(field) for field in fields}
+        last_events = islice(reversed(tracker.events), max_events or 0)
+        state["events"] = [event.as_dict() for event in last_events][::-1]
+        return state
+
+    return project
+
+
+def serialize_tracker(
+    tracker: DialogueStateTracker,
+    projection: Optional[Callable[[DialogueStateTracker], Dict[Text, Any]]] = None,
+) -> Dict[Text, Any]:
+    if projection is not None:
+        return projection(tracker)
+    return tracker.current_state(EventVerbosity.ALL)
+
+
 def nlg_request_format(
     template_name: Text,
     tracker: DialogueStateTracker,
     output_channel: Text,
+    projection: Optional[Callable[[DialogueStateTracker], Dict[Text, Any]]] = None,
     **kwargs: Any,
 ) -> Dict[Text, Any]:
-    """Create the json body for the NLG json body for the request."""
+    """Create the json body for the NLG json body for the request.
 
-    tracker_state = tracker.current_state(EventVerbosity.ALL)
+    The tracker is serialized with all its events, or by `projection`."""
+
+    tracker_state = serialize_tracker(tracker, projection)
 
     return {
         "template": template_name,
@@ -101,102 +242,341 @@ def nlg_request_format(
     }
 
 
+def response_from_graphql(response: Dict[Text, Any]) -> Dict[Text, Any]:
+    """Turn a `getResponse` result into a Rasa bot message."""
+
+    if "customText" in response:
+        response["text"] = response.pop("customText")
+    if "customImage" in response:
+        response["image"] = response.pop("customImage")
+    if "customQuickReplies" in response:
+        response["quick_replies"] = response.pop("customQuickReplies")
+    if "customButtons" in response:
+        response["buttons"] = response.pop("customButtons")
+    if "customElements" in response:
+        response["elements"] = response.pop("customElements")
+    if "customAttachment" in response:
+        response["attachment"] = response.pop("customAttachment")
+    metadata = response.pop("metadata", {}) or {}
+    for key in metadata:
+        response[key] = metadata[key]
+    return response
+
+
+class ResponseBatch:
+    """Collects the NLG requests of a turn, to resolve them together in one
+    request (see `GraphQLNaturalLanguageGenerator.generate_many`).
+
+        async with nlg.batch(tracker, output_channel) as batch:
+            ask = batch.generate("utter_ask_name")
+            fallback = batch.generate("utter_fallback", language="fr")
+        messages = [ask.result(), fallback.result()]
+
+    `generate` returns a future, resolved when leaving the block or by
+    awaiting `resolve`."""
+
+    def __init__(
+        self,
+        nlg: "GraphQLNaturalLanguageGenerator",
+        tracker: DialogueStateTracker,
+        output_channel: Text,
+    ) -> None:
+        self.nlg = nlg
+        self.tracker = tracker
+        self.output_channel = output_channel
+        self._pending = []
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def generate(self, template_name: Text, **kwargs: Any) -> asyncio.Future:
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((template_name, kwargs, future))
+        return future
+
+    async def resolve(self) -> List[Optional[Dict[Text, Any]]]:
+        pending, self._pending = self._pending, []
+        if not pending:
+            return []
+        try:
+            responses = await self.nlg.generate_many(
+                [(template_name, kwargs) for template_name, kwargs, _ in pending],
+                self.tracker,
+                self.output_channel,
+            )
+        except Exception as e:
+            for _, _, future in pending:
+                future.set_exception(e)
+            raise
+        for (_, _, future), response in zip(pending, responses):
+            future.set_result(response)
+        return responses
+
+    async def __aenter__(self) -> "ResponseBatch":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.resolve()
+        else:
+            for _, _, future in self._pending:
+                future.cancel()
+            self._pending = []
+
+
 class GraphQLNaturalLanguageGenerator(NaturalLanguageGenerator):
     """Like Rasa's CallbackNLG, but queries Botfront's GraphQL endpoint"""
 
     def __init__(self, **kwargs) -> None:
         endpoint_config = kwargs.get("endpoint_config")
         self.nlg_endpoint = endpoint_config
+        # responses can be cached for `cache_ttl` seconds, keyed on the template,
+        # channel, arguments (language included) and `cache_key_slots` (default
+        # all slots). Exclude the templates with variations or conditions on
+        # anything else with `cache_exclude`.
+        options = endpoint_config.kwargs if endpoint_config else {}
+        self.cache = None
+        if options.get("cache_ttl"):
+            self.cache = ResponseCache(
+                options["cache_ttl"],
+                stale_ttl=options.get("cache_stale_ttl", 0),
+                max_entries=options.get("cache_max_entries", DEFAULT_MAX_ENTRIES),
+            )
+        self.cache_key_slots = options.get("cache_key_slots")
+        self.cache_exclude = set(options.get("cache_exclude") or [])
+        # responses are validated once, before being cached. Skip validating
+        # the responses of a trusted endpoint with `validate_responses: false`
+        self.validate_responses = options.get("validate_responses", True)
+        # `tracker_payload: slim` only sends `tracker_fields` (default
+        # `SLIM_TRACKER_FIELDS`) and the last `tracker_events` events
+        self.projection = None
+        if options.get("tracker_payload", "full") == "slim":
+            self.projection = tracker_projection(
+                options.get("tracker_fields", SLIM_TRACKER_FIELDS),
+                options.get("tracker_events", DEFAULT_SLIM_EVENTS),
+            )
+        # one keep-alive connection pool for all the requests, up to
+        # `max_connections` at a time, closed when the server stops (see
+        # `close_on_server_stop`)
+        self.graphql_endpoint = None
+        if endpoint_config and "graphql" in endpoint_config.url:
+            api_key = os.environ.get("API_KEY")
+            self.graphql_endpoint = AsyncHTTPEndpoint(
+                endpoint_config.url,
+                {"Authorization": api_key} if api_key else {},
+                timeout=options.get("timeout", DEFAULT_REQUEST_TIMEOUT),
+                pool_size=options.get("max_connections", DEFAULT_POOL_SIZE),
+                gzip_min_bytes=options.get("gzip_min_bytes"),
+            )
 
-    async def generate(
+    def _cache_key(self, template_name, tracker, output_channel, arguments):
+        slots = tracker.current_slot_values()
+        if self.cache_key_slots is not None:
+            slots = {name: slots.get(name) for name in self.cache_key_slots}
+        return (
+            template_name,
+            output_channel,
+            codec.dumps(sorted(arguments.items())),
+            codec.dumps(sorted(slots.items())),
+        )
+
+    async def _request(self, template_name: Text, body: Dict[Text, Any]) -> Any:
+        logger.debug(
+            "Requesting NLG for {} from {}."
+            "".format(template_name, self.nlg_endpoint.url)
+        )
+
+        if self.graphql_endpoint is None:
+            response = await self.nlg_endpoint.request(
+                method="post", json=body, timeout=DEFAULT_REQUEST_TIMEOUT
+            )
+            return response[0]  # legacy route, use first message in seq
+
+        response = await self.graphql_endpoint(NLG_QUERY, body)
+        if response.get("errors"):
+            raise urllib.error.URLError(
+                ", ".join([e.get("message") for e in response.get("errors")])
+            )
+        return response_from_graphql(response.get("data", {}).get("getResponse", {}))
+
+    async def _request_batch(
         self,
-        template_name: Text,
+        templates: List[Tuple[Text, Dict[Text, Any]]],
         tracker: DialogueStateTracker,
         output_channel: Text,
-        **kwargs: Any,
-    ) -> List[Dict[Text, Any]]:
+    ) -> List[Optional[Dict[Text, Any]]]:
+        """Resolve (template, arguments) pairs in one aliased query, None
+        for the ones that failed."""
 
+        logger.debug(
+            "Requesting NLG for {} from {}."
+            "".format(", ".join(t for t, _ in templates), self.nlg_endpoint.url)
+        )
+        variables = {
+            "tracker": serialize_tracker(tracker, self.projection),
+            "channel": {"name": output_channel},
+        }
+        for i, (template_name, arguments) in enumerate(templates):
+            variables[f"template{i}"] = template_name
+            variables[f"arguments{i}"] = arguments
+
+        try:
+            response = await self.graphql_endpoint(
+                batch_nlg_query(len(templates)), variables
+            )
+        except urllib.error.URLError as e:
+            response = {"errors": [{"message": str(e.reason)}]}
+        if response.get("errors"):
+            message = ", ".join([e.get("message") for e in response.get("errors")])
+            logger.error(f"NLG web endpoint at {self.nlg_endpoint.url} returned errors: {message}")
+        data = response.get("data") or {}
+        return [
+            response_from_graphql(data[f"t{i}"]) if data.get(f"t{i}") else None
+            for i in range(len(templates))
+        ]
+
+    @staticmethod
+    def _arguments(
+        tracker: DialogueStateTracker, kwargs: Dict[Text, Any]
+    ) -> Dict[Text, Any]:
         fallback_language_slot = tracker.slots.get("fallback_language")
         fallback_language = (
             fallback_language_slot.initial_value if fallback_language_slot else None
         )
         language = tracker.latest_message.metadata.get("language") or fallback_language
 
-        body = nlg_request_format(
-            template_name,
-            tracker,
-            output_channel,
+        return {
             **kwargs,
-            language=language,
-            projectId=os.environ.get("BF_PROJECT_ID"),
-        )
+            "language": language,
+            "projectId": os.environ.get("BF_PROJECT_ID"),
+        }
 
-        logger.debug(
-            "Requesting NLG for {} from {}."
-            "".format(template_name, self.nlg_endpoint.url)
-        )
+    def _is_cached(self, template_name: Text) -> bool:
+        return self.cache is not None and template_name not in self.cache_exclude
+
+    def _validated(self, template_name: Text, response: Any) -> Dict[Text, Any]:
+        if not self.validate_responses or self.validate_response(response):
+            return response
+        else:
+            logger.error(f"NLG web endpoint at {self.nlg_endpoint.url} returned an invalid response.")
+            return {"text": template_name}
+
+    def batch(
+        self, tracker: DialogueStateTracker, output_channel: Text
+    ) -> ResponseBatch:
+        """Collect NLG requests to resolve them together, see `ResponseBatch`."""
+
+        return ResponseBatch(self, tracker, output_channel)
+
+    async def generate_many(
+        self,
+        templates: List[Union[Text, Tuple[Text, Dict[Text, Any]]]],
+        tracker: DialogueStateTracker,
+        output_channel: Text,
+    ) -> List[Dict[Text, Any]]:
+        """Same as `generate` for several templates (names or (name, kwargs)
+        pairs), the ones not cached are resolved in a single request."""
+
+        requests = [
+            (template, {}) if isinstance(template, str) else template
+            for template in templates
+        ]
+        if self.graphql_endpoint is None:
+            # the legacy route has no batch query
+            return [
+                await self.generate(template_name, tracker, output_channel, **kwargs)
+                for template_name, kwargs in requests
+            ]
+
+        responses = [None] * len(requests)
+        missing = []
+        for i, (template_name, kwargs) in enumerate(requests):
+            arguments = self._arguments(tracker, kwargs)
+            key = None
+            if self._is_cached(template_name):
+                key = self._cache_key(template_name, tracker, output_channel, arguments)
+                responses[i] = self.cache.lookup(key)
+            if responses[i] is None:
+                missing.append((i, template_name, arguments, key))
+
+        if missing:
+            fetched = await self._request_batch(
+                [(name, arguments) for _, name, arguments, _ in missing],
+                tracker,
+                output_channel,
+            )
+            for (i, template_name, _, key), response in zip(missing, fetched):
+                if response is None:
+                    responses[i] = {"text": template_name}
+                    continue
+                responses[i] = self._validated(template_name, response)
+                if key is not None:
+                    self.cache.put(key, responses[i])
+
+        return responses
+
+    async def _fetch_validated(
+        self, template_name: Text, body: Dict[Text, Any]
+    ) -> Dict[Text, Any]:
+        response = await self._request(template_name, body)
+        return self._validated(template_name, response)
+
+    async def generate(
+        self,
+        template_name: Text,
+        tracker: DialogueStateTracker,
+        output_channel: Text,
+        **kwargs: Any,
+    ) -> List[Dict[Text, Any]]:
+
+        arguments = self._arguments(tracker, kwargs)
+
+        def request():
+            # the tracker is only serialized when the response is not fresh in
+            # the cache, as it is now: a stale response is refreshed for the
+            # state it was looked up with. Cached responses are not validated
+            # again
+            body = nlg_request_format(
+                template_name,
+                tracker,
+                output_channel,
+                projection=self.projection,
+                **arguments,
+            )
+            return self._fetch_validated(template_name, body)
 
         try:
-            if "graphql" in self.nlg_endpoint.url:
-                from sgqlc.endpoint.http import HTTPEndpoint
-
-                logging.getLogger("sgqlc.endpoint.http").setLevel(logging.WARNING)
-
-                api_key = os.environ.get("API_KEY")
-                headers = [{"Authorization": api_key}] if api_key else []
-                response = HTTPEndpoint(self.nlg_endpoint.url, *headers)(
-                    NLG_QUERY, body
-                )
-                if response.get("errors"):
-                    raise urllib.error.URLError(
-                        ", ".join([e.get("message") for e in response.get("errors")])
-                    )
-                response = response.get("data", {}).get("getResponse", {})
-                if "customText" in response:
-                    response["text"] = response.pop("customText")
-                if "customImage" in response:
-                    response["image"] = response.pop("customImage")
-                if "customQuickReplies" in response:
-                    response["quick_replies"] = response.pop("customQuickReplies")
-                if "customButtons" in response:
-                    response["buttons"] = response.pop("customButtons")
-                if "customElements" in response:
-                    response["elements"] = response.pop("customElements")
-                if "customAttachment" in response:
-                    response["attachment"] = response.pop("customAttachment")
-                metadata = response.pop("metadata", {}) or {}
-                for key in metadata:
-                    response[key] = metadata[key]
-            else:
-                response = await self.nlg_endpoint.request(
-                    method="post", json=body, timeout=DEFAULT_REQUEST_TIMEOUT
-                )
-                response = response[0]  # legacy route, use first message in seq
+            if self._is_cached(template_name):
+                key = self._cache_key(template_name, tracker, output_channel, arguments)
+                return await self.cache.get(key, request)
+            return await request()
         except urllib.error.URLError as e:
             message = e.reason
             logger.error(f"NLG web endpoint at {self.nlg_endpoint.url} returned errors: {message}")
             return {"text": template_name}
 
-        if self.validate_response(response):
-            return response
-        else:
-            logger.error(f"NLG web endpoint at {self.nlg_endpoint.url} returned an invalid response.")
-            return {"text": template_name}
+    async def close(self) -> None:
+        if self.graphql_endpoint is not None:
+            await self.graphql_endpoint.close()
 
     @staticmethod
     def validate_response(content: Optional[Dict[Text, Any]]) -> bool:
         """Validate the NLG response. Raises exception on failure."""
 
-        from jsonschema import validate
+        if content is None or content == "":
+            # means the endpoint did not want to respond with anything
+            return True
+        if is_valid_response(content):
+            return True
+
         from jsonschema import ValidationError
+        from jsonschema.exceptions import best_match
 
         try:
-            if content is None or content == "":
-                # means the endpoint did not want to respond with anything
-                return True
-            else:
-                validate(content, nlg_response_format_spec())
-                return True
+            error = best_match(response_validator().iter_errors(content))
+            if error is not None:
+                raise error
+            return True
         except ValidationError as e:
             e.message += (
                 ". Failed to validate NLG response from API, make sure your "
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import random
+import time
+import urllib.error
+from threading import Lock
+from typing import Text, Any, Dict, Callable, Awaitable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(urllib.error.URLError):
+    """Raised instead of calling a service while its circuit breaker is open."""
+
+
+def is_failed_response(response: Any) -> bool:
+    """A GraphQL response with errors and no data, e.g. an HTTP error."""
+
+    return (
+        isinstance(response, dict)
+        and bool(response.get("errors"))
+        and not response.get("data")
+    )
+
+
+def _as_url_error(error: OSError) -> urllib.error.URLError:
+    # e.g. socket timeouts, which urllib does not always wrap
+    if isinstance(error, urllib.error.URLError):
+        return error
+    return urllib.error.URLError(error)
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for a while.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    calls are rejected for `reset_timeout` seconds. Then a single trial call
+    is let through (half open): the breaker closes if it succeeds and opens
+    again otherwise."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_started_at = None
+        self._lock = Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                # a trial that never reported back, e.g. cancelled, times out
+                if (
+                    self._trial_started_at is not None
+                    and time.time() - self._trial_started_at < self.reset_timeout
+                ):
+                    self.rejected += 1
+                    return False
+                self._trial_started_at = time.time()
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Circuit breaker closed")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._trial_started_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_started_at = None
+            if (
+                self.state == HALF_OPEN
+                or self.consecutive_failures >= self.failure_threshold
+            ):
+                if self.state != OPEN:
+                    logger.warning(
+                        f"Circuit breaker opened after {self.consecutive_failures} "
+                        f"failure(s), retrying in {self.reset_timeout}s"
+                    )
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = time.time()
+
+
+class Resilience:
+    """Retries and circuit breaker around calls to a remote service.
+
+    Idempotent calls are retried up to `retries` times after a failure, with
+    exponential backoff starting at `backoff` seconds, capped at
+    `max_backoff` and fully jittered so that clients do not retry in step.
+    Blocking calls (`call`) are retried `blocking_retries` times instead if
+    set, as they block the calling thread, e.g. an event loop, while they
+    wait. Other calls are only attempted once. Every call goes through the same
+    `CircuitBreaker`, so while the service is down calls fail right away with
+    a `CircuitOpenError` instead of waiting for a timeout.
+
+    A call fails when it raises an `OSError` (re-raised as a `URLError`) or
+    when `is_failure` is true for its result."""
+
+    def __init__(
+        self,
+        retries: int = 2,
+        backoff: float = 0.1,
+        max_backoff: float = 2.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        is_failure: Callable[[Any], bool] = is_failed_response,
+        blocking_retries: Optional[int] = None,
+    ) -> None:
+        self.retries = retries
+        self.blocking_retries = (
+            retries if blocking_retries is None else blocking_retries
+        )
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.is_failure = is_failure
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.calls = 0
+        self.failures = 0
+        self.retried = 0
+
+    def _delays(self, idempotent: bool, retries: int) -> Iterator[float]:
+        for attempt in range(retries if idempotent else 0):
+            yield random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _before_attempt(self) -> None:
+        if not self.breaker.allow():
+            raise CircuitOpenError("circuit breaker is open")
+        self.calls += 1
+
+    def _after_attempt(self, result: Any, error: Optional[Exception]) -> bool:
+        """Record the outcome of an attempt, return whether it succeeded."""
+
+        if error is None and not self.is_failure(result):
+            self.breaker.record_success()
+            return True
+        self.failures += 1
+        self.breaker.record_failure()
+        return False
+
+    def call(self, fn: Callable[[], Any], idempotent: bool = False) -> Any:
+        delays = self._delays(idempotent, self.blocking_retries)
+        while True:
+            self._before_attempt()
+            result, error = None, None
+            try:
+                result = fn()
+            except OSError as e:
+                error = _as_url_error(e)
+            except Exception as e:
+                self._after_attempt(None, e)
+                raise
+            if self._after_attempt(result, error):
+                return result
+            delay = next(delays, None)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            self.retried += 1
+            time.sleep(delay)
+
+    async def call_async(
+        self, fn: Callable[[], Awaitable[Any]], idempotent: bool = False
+    ) -> Any:
+        delays = self._delays(idempotent, self.retries)
+        while True:
+            self._before_attempt()
+            result, error = None, None
+            try:
+                result = await fn()
+            except OSError as e:
+                error = _as_url_error(e)
+            except Exception as e:
+                self._after_attempt(None, e)
+                raise
+            if self._after_attempt(result, error):
+                return result
+            delay = next(delays, None)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            self.retried += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[Text, Any]:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "times_opened": self.breaker.times_opened,
+            "rejected": self.breaker.rejected,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retried,
+        }
@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+from bisect import bisect, insort
+from typing import Text, Any, Dict, Optional, List, Iterable
+
+import aiohttp
+from sanic import Sanic, response
+from sanic.request import Request
+from sanic.response import HTTPResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VIRTUAL_NODES = 100
+# hop-by-hop headers and headers recomputed by the client session
+SKIPPED_HEADERS = {
+    "connection",
+    "keep-alive",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+    "content-length",
+    "content-encoding",
+}
+CONVERSATION_PATH = re.compile(r"^/conversations/([^/]+)/")
+
+
+def _hash(key: Text) -> int:
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """Consistent hashing of keys (sender ids) to nodes (Rasa instances).
+
+    Each node is placed at `virtual_nodes` points of the ring, a key goes to
+    the first node after it. Adding or removing a node only moves the keys
+    of that node, about 1/n of them."""
+
+    def __init__(
+        self, nodes: Iterable[Text] = (), virtual_nodes: int = DEFAULT_VIRTUAL_NODES
+    ) -> None:
+        self.virtual_nodes = virtual_nodes
+        self._points = []  # sorted (hash, node)
+        self.nodes = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: Text) -> None:
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.virtual_nodes):
+            insort(self._points, (_hash(f"{node}#{i}"), node))
+
+    def remove(self, node: Text) -> None:
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        self._points = [point for point in self._points if point[1] != node]
+
+    def node_for(self, key: Text) -> Optional[Text]:
+        if not self._points:
+            return None
+        i = bisect(self._points, (_hash(key), "")) % len(self._points)
+        return self._points[i][1]
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+def extract_sender(path: Text, body: Optional[Dict[Text, Any]]) -> Optional[Text]:
+    """Sender id of a request to a Rasa instance, if it has one: the
+    `sender` of the REST channels, the sender of a Messenger webhook, or
+    the conversation id of the conversations API."""
+
+    match = CONVERSATION_PATH.match(path)
+    if match:
+        return match.group(1)
+    if not isinstance(body, dict):
+        return None
+    if body.get("sender") is not None:
+        return str(body["sender"])
+    try:
+        return str(body["entry"][0]["messaging"][0]["sender"]["id"])
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+class Router:
+    """Forwards the requests of each sender to the same Rasa instance.
+
+    Trackers are then only updated by one instance, whose tracker store can
+    trust its cache (see `freshness_window` and `version_probe` of
+    `BotfrontTrackerStore`). Requests without a sender id are routed by
+    client address.
+
+    Websocket upgrades (e.g. the socket.io webchat) are not proxied: connect
+    these clients to the instances directly, or through a proxy with sticky
+    sessions."""
+
+    def __init__(
+        self,
+        backends: Iterable[Text],
+        virtual_nodes: int = DEFAULT_VIRTUAL_NODES,
+        timeout: float = 60,
+    ) -> None:
+        self.ring = HashRing(
+            [b.rstrip("/") for b in backends], virtual_nodes=virtual_nodes
+        )
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    def backend_for(self, request: Request) -> Optional[Text]:
+        try:
+            body = json.loads(request.body) if request.body else None
+        except ValueError:
+            body = None
+        key = extract_sender(request.path, body) or request.ip
+        return self.ring.node_for(key)
+
+    async def forward(self, request: Request) -> HTTPResponse:
+        backend = self.backend_for(request)
+        if backend is None:
+            return response.json({"error": "no backend available"}, status=503)
+        url = backend + request.path
+        if request.query_string:
+            url += "?" + request.query_string
+        headers = {
+            k: v for k, v in request.headers.items() if k.lower() not in SKIPPED_HEADERS
+        }
+        try:
+            async with self._get_session().request(
+                request.method, url, headers=headers, data=request.body
+            ) as resp:
+                body = await resp.read()
+                resp_headers = {
+                    k: v
+                    for k, v in resp.headers.items()
+                    if k.lower() not in SKIPPED_HEADERS
+                }
+                return response.raw(body, status=resp.status, headers=resp_headers)
+        except aiohttp.ClientError as e:
+            logger.error(f"Could not forward request to {backend}: {e}")
+            return response.json({"error": f"{backend} unavailable"}, status=502)
+        except asyncio.TimeoutError:
+            # the session timeout, aiohttp does not wrap it in a ClientError
+            logger.error(f"Request to {backend} timed out")
+            return response.json({"error": f"{backend} timed out"}, status=504)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+def is_authorized(request: Request, token: Optional[Text]) -> bool:
+    """Whether a request carries `token` as a bearer token, never if there is
+    no token."""
+
+    if not token:
+        return False
+    authorization = request.headers.get("Authorization", "")
+    return hmac.compare_digest(authorization, f"Bearer {token}")
+
+
+def create_app(
+    backends: Iterable[Text],
+    virtual_nodes: int = DEFAULT_VIRTUAL_NODES,
+    timeout: float = 60,
+    admin_token: Optional[Text] = None,
+) -> Sanic:
+    """Sanic app routing Rasa requests by sender id.
+
+    `GET /routing/backends` lists the instances, `POST` and `DELETE` with a
+    `{"backend": url}` body add or remove one, which only moves the senders
+    of that instance. The front is public, so these requests must send
+    `admin_token` as a bearer token, and are refused when it is not set."""
+
+    app = Sanic(__name__)
+    router = Router(backends, virtual_nodes=virtual_nodes, timeout=timeout)
+    app.router_front = router
+
+    @app.route("/routing/backends", methods=["GET", "POST", "DELETE"])
+    async def backends_admin(request: Request) -> HTTPResponse:
+        if not is_authorized(request, admin_token):
+            return response.json({"error": "unauthorized"}, status=401)
+        if request.method == "GET":
+            return response.json({"backends": router.ring.nodes})
+        backend = (request.json or {}).get("backend")
+        if not backend:
+            return response.json({"error": "missing backend"}, status=400)
+        if request.method == "POST":
+            router.ring.add(backend.rstrip("/"))
+        else:
+            router.ring.remove(backend.rstrip("/"))
+        logger.info(f"Routing to {len(router.ring)} backend(s)")
+        return response.json({"backends": router.ring.nodes})
+
+    methods = ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"]
+
+    @app.route("/", methods=methods)
+    async def forward_root(request: Request) -> HTTPResponse:
+        return await router.forward(request)
+
+    @app.route("/<path:path>", methods=methods)
+    async def forward(request: Request, path: Text) -> HTTPResponse:
+        return await router.forward(request)
+
+    @app.listener("after_server_stop")
+    async def close_router(app, loop):
+        await router.close()
+
+    return app
+
+
+def main(args: Optional[List[Text]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Route Rasa requests to instances by sender id"
+    )
+    parser.add_argument(
+        "--backends", required=True, help="comma separated Rasa instance urls"
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--virtual-nodes", type=int, default=DEFAULT_VIRTUAL_NODES)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument(
+        "--admin-token",
+        default=os.environ.get("ROUTING_ADMIN_TOKEN"),
+        help="bearer token of the /routing/backends API, disabled if not set",
+    )
+    parsed = parser.parse_args(args)
+    app = create_app(
+        [b for b in parsed.backends.split(",") if b],
+        virtual_nodes=parsed.virtual_nodes,
+        timeout=parsed.timeout,
+        admin_token=parsed.admin_token,
+    )
+    app.run(host=parsed.host, port=parsed.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,48 @@
+import atexit
 import logging
 import jsonpickle
 import requests
 import time
 import os
-from threading import Thread
+from itertools import islice
+from threading import Lock, Thread
 
+from rasa.core.events import deserialise_events
 from rasa.core.tracker_store import TrackerStore
 from rasa.core.trackers import DialogueStateTracker, EventVerbosity
 
-from sgqlc.endpoint.http import HTTPEndpoint
 import urllib.error
 
+from rasa_addons.core.concurrency import KeyedLock, SingleFlight
+from rasa_addons.core.graphql_endpoint import AsyncHTTPEndpoint, HTTPEndpoint
+from rasa_addons.core.resilience import CircuitOpenError, Resilience
+from rasa_addons.core.tracker_stores.cache import TrackerCache
+from rasa_addons.core.tracker_stores.metrics import TrackerStoreMetrics
+from rasa_addons.core.tracker_stores.persistence import SqliteTrackerTier
+from rasa_addons.core.tracker_stores.snapshot import (
+    checkpoint_events,
+    has_user_message,
+    state_before,
+    take_snapshot,
+)
+from rasa_addons.core.tracker_stores.subscription import TrackerSubscription
+from rasa_addons.core.tracker_stores.window import (
+    DEFAULT_EVENTS_PER_TURN,
+    window_from_policy_config,
+)
+from rasa_addons.core.tracker_stores.write_ahead_log import WriteAheadLog
+from rasa_addons.core.tracker_stores.write_behind import WriteBehindQueue
+
 logger = logging.getLogger(__name__)
 logging.getLogger("sgqlc.endpoint.http").setLevel(logging.WARNING)
 
+# fetches are on the critical path of every turn, they fail sooner than saves
+DEFAULT_READ_TIMEOUT = 5
+
+# a tracker warmed by `warm` is served from the cache by the next `retrieve`
+# of its sender within this many seconds
+WARM_TTL = 10
+
 jsonpickle.set_preferred_backend("json")
 jsonpickle.set_encoder_options("json", ensure_ascii=False)
 
@@ -32,6 +61,16 @@ query trackerStore(
 }
 """
 
+# same as GET_TRACKER without the tracker, to check if it changed
+GET_TRACKER_HEAD = """
+query trackerStoreHead($senderId: String!, $projectId: String!) {
+    trackerStore(senderId: $senderId, projectId: $projectId) {
+        lastIndex
+        lastTimestamp
+    }
+}
+"""
+
 INSERT_TRACKER = """
 mutation insertTracker(
     $senderId: String!
@@ -61,87 +100,450 @@ mutation updateTracker(
 """
 
 
+def bulk_write_query(writes):
+    """Mutation writing several trackers at once, one alias (t0, t1...) per tracker.
+
+    `writes` is a list of (sender_id, tracker, insert) tuples, the matching
+    variables are built by `BotfrontTrackerStore._bulk_write_params`."""
+
+    variables = ["$projectId: String!", "$env: Environement"]
+    fields = []
+    for i, (_, _, insert) in enumerate(writes):
+        variables += [f"$senderId{i}: String!", f"$tracker{i}: Any"]
+        mutation = "insertTrackerStore" if insert else "updateTrackerStore"
+        fields.append(
+            f"t{i}: {mutation}(senderId: $senderId{i}, projectId: $projectId, "
+            f"tracker: $tracker{i}, env: $env) {{ lastIndex lastTimestamp }}"
+        )
+    return "mutation bulkWriteTrackers(\n    {}\n) {{\n    {}\n}}\n".format(
+        "\n    ".join(variables), "\n    ".join(fields)
+    )
+
+
+def bulk_fetch_query(count):
+    """Query fetching several trackers at once, one alias (t0, t1...) per tracker.
+
+    The matching variables are built by `BotfrontTrackerStore._bulk_fetch_params`."""
+
+    variables = ["$projectId: String!", "$maxEvents: Int"]
+    fields = []
+    for i in range(count):
+        variables += [f"$senderId{i}: String!", f"$after{i}: Int"]
+        fields.append(
+            f"t{i}: trackerStore(senderId: $senderId{i}, projectId: $projectId, "
+            f"after: $after{i}, maxEvents: $maxEvents) "
+            "{ tracker lastIndex lastTimestamp }"
+        )
+    return "query bulkFetchTrackers(\n    {}\n) {{\n    {}\n}}\n".format(
+        "\n    ".join(variables), "\n    ".join(fields)
+    )
+
+
+def warm_trackers(blueprint, on_new_message):
+    """Wrap the `on_new_message` of an input channel so that the tracker of
+    the sender is retrieved with `BotfrontTrackerStore.warm` first, when the
+    agent uses that store. Rasa then retrieves it from the cache, instead of
+    blocking the event loop on Botfront."""
+
+    server = {}
+
+    @blueprint.listener("before_server_start")
+    async def keep_app(app, loop):
+        server["app"] = app
+
+    async def handle_message(message):
+        agent = getattr(server.get("app"), "agent", None)
+        tracker_store = getattr(agent, "tracker_store", None)
+        if isinstance(tracker_store, BotfrontTrackerStore):
+            try:
+                await tracker_store.warm(message.sender_id)
+            except Exception:
+                # Rasa retrieves the tracker itself
+                logger.exception(f"Could not warm tracker for {message.sender_id}")
+        return await on_new_message(message)
+
+    return handle_message
+
+
 def _start_sweeper(tracker_store, break_time):
     while True:
         try:
             tracker_store.sweep()
+        except Exception:
+            # keep sweeping even if one sweep fails
+            logger.exception("SWEEPER: could not sweep trackers")
         finally:
             time.sleep(break_time)
 
 
+class _PreparedSave:
+    """Outcome of `BotfrontTrackerStore._prepare_save`: the tracker to cache,
+    the payload to send, whether it is an insert and the events to append to
+    the cached tracker (None if `tracker` replaces it)."""
+
+    __slots__ = ("tracker", "payload", "insert", "appended")
+
+    def __init__(self, tracker, payload, insert, appended=None):
+        self.tracker = tracker
+        self.payload = payload
+        self.insert = insert
+        self.appended = appended
+
+
 class BotfrontTrackerStore(TrackerStore):
     def __init__(self, domain, url, **kwargs):
 
         self.project_id = os.environ.get("BF_PROJECT_ID")
         self.tracker_persist_time = kwargs.get("tracker_persist_time", 3600)
         self.max_events = kwargs.get("max_events", 100)
-        self.trackers = {}
+        # only fetch the events the policies look at, see `backfill` for more
+        fetch_window = kwargs.get("fetch_window")
+        if fetch_window is None and kwargs.get("policy_config"):
+            fetch_window = window_from_policy_config(
+                kwargs["policy_config"],
+                kwargs.get("events_per_turn", DEFAULT_EVENTS_PER_TURN),
+            )
+        self.fetch_size = min(fetch_window or self.max_events, self.max_events)
+        # replace the old events of long trackers with a checkpoint
+        self.snapshot_every = kwargs.get("snapshot_every")
+        self.snapshot_tail = kwargs.get("snapshot_tail", self.fetch_size)
+        self._unsynced_snapshots = set()
+        # skip downloading the tracker when it did not change since the last sync
+        self.version_probe = kwargs.get("version_probe", False)
+        self.freshness_window = kwargs.get("freshness_window", 0)
+        self.write_behind = None
+        self.write_ahead_log = None
+        self.disk_tier = None
+        self.subscription = None
+        self.trackers = TrackerCache(
+            max_entries=kwargs.get("cache_max_entries"),
+            max_bytes=kwargs.get("cache_max_bytes"),
+            ttl=kwargs.get("cache_ttl"),
+            is_evictable=lambda sender_id: not self._has_pending_writes(sender_id),
+            on_evict=self._on_evict,
+            expires_at=self._expires_at,
+            compact=kwargs.get("compact_cache", False),
+        )
         self.trackers_info = (
-            {}
+            self.trackers.info
         )  # in this stucture we will keep the last index and the last timestamp of events in the db for a said tracker
-        self.sweeper = Thread(target=_start_sweeper, args=(self, 30))
+        self.metrics = TrackerStoreMetrics()
+        self.metrics.watch_cache(self.trackers)
+        self.sweeper = Thread(
+            target=_start_sweeper, args=(self, kwargs.get("sweep_interval", 30))
+        )
         self.sweeper.setDaemon(True)
         self.sweeper.start()
         api_key = os.environ.get("API_KEY")
-        headers = [{"Authorization": api_key}] if api_key else []
-        self.graphql_endpoint = HTTPEndpoint(url, *headers)
+        headers = {"Authorization": api_key} if api_key else {}
+        timeout = kwargs.get("timeout", 30)
+        self.read_timeout = kwargs.get(
+            "read_timeout", min(timeout, DEFAULT_READ_TIMEOUT)
+        )
+        # gzip the requests carrying long trackers, if Botfront accepts it
+        gzip_min_bytes = kwargs.get("gzip_min_bytes")
+        self.graphql_endpoint = HTTPEndpoint(
+            url,
+            headers,
+            timeout,
+            gzip_min_bytes=gzip_min_bytes,
+            on_transfer=self.metrics.record_transfer,
+        )
+        # pooled keep-alive transport used by the async retrieve/save path
+        self.async_graphql_endpoint = AsyncHTTPEndpoint(
+            url,
+            headers,
+            timeout=timeout,
+            pool_size=kwargs.get("pool_size", 100),
+            gzip_min_bytes=gzip_min_bytes,
+            on_transfer=self.metrics.record_transfer,
+        )
+        # only queries are retried, all calls share the circuit breaker. The
+        # blocking calls run on Rasa's event loop, they are not retried unless
+        # `blocking_retries` is set
+        self.resilience = Resilience(
+            retries=kwargs.get("retries", 2),
+            blocking_retries=kwargs.get("blocking_retries", 0),
+            backoff=kwargs.get("retry_backoff", 0.1),
+            max_backoff=kwargs.get("retry_max_backoff", 2),
+            failure_threshold=kwargs.get("breaker_failure_threshold", 5),
+            reset_timeout=kwargs.get("breaker_reset_timeout", 30),
+        )
+        # async path: one fetch per sender at a time, ordered with the saves
+        self._retrieves = SingleFlight()
+        self._sender_locks = KeyedLock()
+        self._warmed = {}  # sender_id -> time it was warmed
         self.url = url
         self.environement = os.environ.get("BOTFRONT_ENV", "development")
+        # write-behind: saves are queued and sent in bulk by a background
+        # thread. Rasa calls the blocking `save` on its event loop, without it
+        # every save blocks the loop until Botfront answers
+        if kwargs.get("write_behind", True):
+            self.write_behind = WriteBehindQueue(
+                self._send_writes,
+                self._store_tracker_info,
+                batch_size=kwargs.get("write_behind_batch_size", 50),
+                interval=kwargs.get("write_behind_interval", 1),
+            )
+            atexit.register(self.write_behind.close)
+        # failed writes are logged and replayed once Botfront is back. The log
+        # is opened by the first failed write, or right away when it is
+        # persisted, to replay the writes left by the last run
+        self._write_ahead_log_options = None
+        self._write_ahead_log_lock = Lock()
+        if kwargs.get("write_ahead_log", True):
+            self._write_ahead_log_options = dict(
+                directory=kwargs.get("persist_dir"),
+                project_id=self.project_id,
+                env=self.environement,
+                batch_size=kwargs.get("write_ahead_log_batch_size", 50),
+                interval=kwargs.get("write_ahead_log_interval", 5),
+                max_attempts=kwargs.get("write_ahead_log_max_attempts", 5),
+            )
+            if kwargs.get("persist_dir"):
+                self._open_write_ahead_log()
+        # optional on-disk copy of the cache, so a restart only fetches deltas
+        if kwargs.get("persist_dir"):
+            self.disk_tier = SqliteTrackerTier(
+                kwargs["persist_dir"], self.project_id, self.environement
+            )
+
+        # served from the cache until Botfront notifies of a change
+        if kwargs.get("subscribe_to_changes", False):
+            self.subscription = TrackerSubscription(
+                kwargs.get("subscription_url", url),
+                {"projectId": self.project_id, "env": self.environement},
+                self._get_last_index,
+                headers=headers,
+            )
+        # warm the cache in the background, e.g. after a deploy
+        sender_ids = list(kwargs.get("prefetch_sender_ids") or [])
+        if kwargs.get("prefetch_recent") and self.disk_tier is not None:
+            sender_ids += self.disk_tier.recent_sender_ids(
+                time.time() - kwargs["prefetch_recent"]
+            )
+        if sender_ids:
+            prefetcher = Thread(target=self.prefetch, args=(sender_ids,))
+            prefetcher.setDaemon(True)
+            prefetcher.start()
 
         super(BotfrontTrackerStore, self).__init__(domain)
         logger.debug("BotfrontTrackerStore tracker store created")
 
-    def _graphql_query(self, query, params):
+    def _handle_graphql_response(self, response, partial=False):
+        """Data of a GraphQL response. With `partial`, e.g. for the aliased
+        bulk requests, the data of a response with errors is kept: only the
+        fields that failed are null."""
+
+        if response.get("errors"):
+            message = ", ".join([e.get("message") for e in response.get("errors")])
+            if not partial or not response.get("data"):
+                raise urllib.error.URLError(message)
+            logger.error(f"Some requests to {self.url} failed: {message}")
+        return response.get("data") or {}
+
+    def _log_graphql_error(self, error):
+        message = error.reason
+        if isinstance(error, CircuitOpenError):
+            # the breaker already warned when it opened
+            logger.debug(f"Not calling {self.url}: {message}")
+            return
+        logger.error(
+            f"Something went wrong getting the tracker from {self.url}: {message}"
+        )
+
+    def _graphql_query(
+        self, query, params, idempotent=False, timeout=None, partial=False
+    ):
         try:
-            response = self.graphql_endpoint(query, params)
-            if response.get("errors"):
-                raise urllib.error.URLError(
-                    ", ".join([e.get("message") for e in response.get("errors")])
-                )
-            return response.get("data")
+            response = self.resilience.call(
+                lambda: self.graphql_endpoint(query, params, timeout=timeout),
+                idempotent=idempotent,
+            )
+            return self._handle_graphql_response(response, partial)
         except urllib.error.URLError as e:
-            message = e.reason
-            logger.error(
-                f"Something went wrong getting the tracker from {self.url}: {message}"
+            self._log_graphql_error(e)
+            return {}
+
+    async def _graphql_query_async(self, query, params, idempotent=False, timeout=None):
+        try:
+            response = await self.resilience.call_async(
+                lambda: self.async_graphql_endpoint(query, params, timeout=timeout),
+                idempotent=idempotent,
             )
+            return self._handle_graphql_response(response)
+        except urllib.error.URLError as e:
+            self._log_graphql_error(e)
             return {}
 
-    def _fetch_tracker(self, sender_id, lastIndex):
+    def _fetch_tracker_params(self, sender_id, lastIndex, max_events=None):
+        return {
+            "senderId": sender_id,
+            "projectId": self.project_id,
+            "after": lastIndex,
+            "maxEvents": max_events or self.fetch_size,
+        }
+
+    def _write_tracker_params(self, sender_id, tracker):
+        return {
+            "senderId": sender_id,
+            "projectId": self.project_id,
+            "tracker": tracker,
+            "env": self.environement,
+        }
+
+    def _fetch_tracker(self, sender_id, lastIndex, max_events=None):
         data = self._graphql_query(
             GET_TRACKER,
-            {
-                "senderId": sender_id,
-                "projectId": self.project_id,
-                "after": lastIndex,
-                "maxEvents": self.max_events,
-            },
+            self._fetch_tracker_params(sender_id, lastIndex, max_events),
+            idempotent=True,
+            timeout=self.read_timeout,
+        )
+        return data.get("trackerStore")
+
+    def _fetch_tracker_head(self, sender_id):
+        data = self._graphql_query(
+            GET_TRACKER_HEAD,
+            {"senderId": sender_id, "projectId": self.project_id},
+            idempotent=True,
+            timeout=self.read_timeout,
         )
         return data.get("trackerStore")
 
     def _insert_tracker_gql(self, sender_id, tracker):
         data = self._graphql_query(
-            INSERT_TRACKER,
-            {
-                "senderId": sender_id,
-                "projectId": self.project_id,
-                "tracker": tracker,
-                "env": self.environement,
-            },
+            INSERT_TRACKER, self._write_tracker_params(sender_id, tracker)
         )
         return data.get("insertTrackerStore")
 
     def _update_tracker_gql(self, sender_id, tracker):
         data = self._graphql_query(
-            UPDATE_TRACKER,
-            {
-                "senderId": sender_id,
-                "projectId": self.project_id,
-                "tracker": tracker,
-                "env": self.environement,
-            },
+            UPDATE_TRACKER, self._write_tracker_params(sender_id, tracker)
+        )
+        return data.get("updateTrackerStore")
+
+    async def _fetch_tracker_async(self, sender_id, lastIndex, max_events=None):
+        data = await self._graphql_query_async(
+            GET_TRACKER,
+            self._fetch_tracker_params(sender_id, lastIndex, max_events),
+            idempotent=True,
+            timeout=self.read_timeout,
+        )
+        return data.get("trackerStore")
+
+    async def _fetch_tracker_head_async(self, sender_id):
+        data = await self._graphql_query_async(
+            GET_TRACKER_HEAD,
+            {"senderId": sender_id, "projectId": self.project_id},
+            idempotent=True,
+            timeout=self.read_timeout,
+        )
+        return data.get("trackerStore")
+
+    async def _insert_tracker_gql_async(self, sender_id, tracker):
+        data = await self._graphql_query_async(
+            INSERT_TRACKER, self._write_tracker_params(sender_id, tracker)
+        )
+        return data.get("insertTrackerStore")
+
+    async def _update_tracker_gql_async(self, sender_id, tracker):
+        data = await self._graphql_query_async(
+            UPDATE_TRACKER, self._write_tracker_params(sender_id, tracker)
         )
         return data.get("updateTrackerStore")
 
+    def _bulk_write_params(self, writes):
+        params = {"projectId": self.project_id, "env": self.environement}
+        for i, (sender_id, tracker, _) in enumerate(writes):
+            params[f"senderId{i}"] = sender_id
+            params[f"tracker{i}"] = tracker
+        return params
+
+    def _bulk_write_gql(self, writes):
+        # one failed alias must not fail the writes of the other senders. The
+        # senders whose alias is missing were not sent, e.g. Botfront is down,
+        # those mapped to None were rejected (see `WriteAheadLog`)
+        data = self._graphql_query(
+            bulk_write_query(writes), self._bulk_write_params(writes), partial=True
+        )
+        return {
+            sender_id: data[f"t{i}"]
+            for i, (sender_id, _, _) in enumerate(writes)
+            if f"t{i}" in data
+        }
+
+    def _bulk_fetch_params(self, fetches):
+        params = {"projectId": self.project_id, "maxEvents": self.fetch_size}
+        for i, (sender_id, last_index) in enumerate(fetches):
+            params[f"senderId{i}"] = sender_id
+            params[f"after{i}"] = last_index
+        return params
+
+    def _bulk_fetch_gql(self, fetches):
+        data = self._graphql_query(
+            bulk_fetch_query(len(fetches)),
+            self._bulk_fetch_params(fetches),
+            idempotent=True,
+            timeout=self.read_timeout,
+        )
+        return {
+            sender_id: data.get(f"t{i}") for i, (sender_id, _) in enumerate(fetches)
+        }
+
+    def _has_logged_writes(self, sender_id):
+        return self.write_ahead_log is not None and self.write_ahead_log.has_pending(
+            sender_id
+        )
+
+    def _has_pending_writes(self, sender_id):
+        return self._has_logged_writes(sender_id) or (
+            self.write_behind is not None and self.write_behind.has_pending(sender_id)
+        )
+
+    def _open_write_ahead_log(self):
+        with self._write_ahead_log_lock:
+            if self.write_ahead_log is None and self._write_ahead_log_options:
+                self.write_ahead_log = WriteAheadLog(
+                    self._bulk_write_gql,
+                    self._store_tracker_info,
+                    **self._write_ahead_log_options,
+                )
+                atexit.register(self.write_ahead_log.close)
+            return self.write_ahead_log
+
+    def _log_failed_write(self, sender_id, payload, insert):
+        write_ahead_log = self._open_write_ahead_log()
+        if write_ahead_log is None:
+            logger.error(f"The tracker for user {sender_id} could not be saved")
+            return
+        write_ahead_log.append(sender_id, payload, insert)
+
+    def _send_writes(self, writes):
+        """Send the writes of the write-behind queue. The writes of senders
+        with logged writes are logged after them, to keep them in order."""
+
+        writes_to_send = []
+        for sender_id, payload, insert in writes:
+            if self._has_logged_writes(sender_id):
+                self.write_ahead_log.append(sender_id, payload, insert)
+            else:
+                writes_to_send.append((sender_id, payload, insert))
+        if not writes_to_send:
+            return {}
+        infos = self._bulk_write_gql(writes_to_send)
+        for sender_id, payload, insert in writes_to_send:
+            if infos.get(sender_id) is None:
+                self._log_failed_write(sender_id, payload, insert)
+        return infos
+
+    def _on_evict(self, sender_id):
+        self._unsynced_snapshots.discard(sender_id)
+        self._warmed.pop(sender_id, None)
+        if self.subscription is not None:
+            self.subscription.forget(sender_id)
+        if self.write_behind is not None:
+            self.write_behind.forget(sender_id)
+
     def _get_last_index(self, sender_id):
         info = self.trackers_info.get(sender_id, -1)
         if info == -1:
@@ -162,41 +564,207 @@ class BotfrontTrackerStore(TrackerStore):
 
     def _store_tracker_info(self, sender_id, tracker_info):
         if tracker_info is not None:
+            last_index = tracker_info["lastIndex"]
+            if last_index is not None and last_index < self._get_last_index(sender_id):
+                # a response older than the one we already have, e.g. a slow fetch
+                return
             self.trackers_info[sender_id] = {
                 "last_index": tracker_info["lastIndex"],
                 "last_timestamp": tracker_info["lastTimestamp"],
+                "synced_at": time.time(),
             }
+            if self.disk_tier is not None:
+                self.disk_tier.set_info(sender_id, self.trackers_info[sender_id])
 
-    def save(self, canonical_tracker):
+    def _load_from_disk(self, sender_id):
+        """Put the tracker persisted on disk in the cache if it is not there."""
+
+        if self.disk_tier is None or sender_id in self.trackers:
+            return
+        loaded = self.disk_tier.load(sender_id, max_age=self.tracker_persist_time)
+        if loaded is not None:
+            tracker, info = loaded
+            self.trackers[sender_id] = tracker
+            if info is not None:
+                self.trackers_info[sender_id] = info
 
-        # Fetch here just in case retrieve wasn't called first
+    @staticmethod
+    def _event_cursor(canonical_tracker):
+        events = canonical_tracker.events
+        return len(events), events[-1].timestamp if len(events) else None
+
+    def _serialize_new_events(self, sender_id, canonical_tracker):
+        """Serialize the events appended since the last sync.
+
+        The cursor holds the number of events of the tracker that are already
+        synced and the timestamp of the last one. Returns None when the
+        tracker does not continue the cached one."""
+
+        cursor = self.trackers.get_cursor(sender_id)
+        if cursor is None:
+            return None
+        count, timestamp = cursor
+        events = canonical_tracker.events
+        if len(events) < count or (
+            count and events[count - 1].timestamp != timestamp
+        ):
+            return None
+        # walk from the end so the cost only depends on the number of new events
+        new_events = list(islice(reversed(events), len(events) - count))
+        new_events.reverse()
+        return [e.as_dict() for e in new_events]
+
+    def _prepare_save(self, canonical_tracker):
         sender_id = canonical_tracker.sender_id
-        tracker = self.trackers.get(sender_id)
-        serialized_tracker = self._serialize_tracker_to_dict(canonical_tracker)
+        self._load_from_disk(sender_id)
 
-        if tracker is None:  # the tracker does not exist localy ( first save)
-            updated_info = self._insert_tracker_gql(sender_id, serialized_tracker)
-            self.trackers[sender_id] = serialized_tracker
-            # update the last index and last time stamp for future uses
-            self._store_tracker_info(sender_id, updated_info)
-            return serialized_tracker["events"]
-        else:  # the tracker  exist localy
-            # Insert only the new examples
-            last_timestamp = self._get_last_timestamp(sender_id)
-            new_events = list(
-                filter(
-                    lambda x: x["timestamp"] > last_timestamp,
-                    serialized_tracker["events"],
-                )
+        if not self.trackers.touch(
+            sender_id
+        ):  # the tracker does not exist localy ( first save)
+            serialized_tracker = self._serialize_tracker_to_dict(canonical_tracker)
+            payload = {
+                **serialized_tracker,
+                "events": list(serialized_tracker["events"]),
+            }
+            return _PreparedSave(serialized_tracker, payload, True)
+
+        # the tracker  exist localy
+        # Insert only the new examples
+        new_events = self._serialize_new_events(sender_id, canonical_tracker)
+        if new_events is not None:
+            # the history is not serialized again, only the summary and new events
+            payload = self._serialize_tracker_summary(canonical_tracker)
+            payload["events"] = new_events
+            if sender_id in self._unsynced_snapshots:
+                self._unsynced_snapshots.discard(sender_id)
+                snapshot = self.trackers.get_summary(sender_id).get("snapshot")
+                if snapshot is not None:
+                    payload["snapshot"] = snapshot
+            return _PreparedSave(payload, payload, False, appended=new_events)
+
+        # no usable cursor, find the new events by timestamp
+        serialized_tracker = self._serialize_tracker_to_dict(canonical_tracker)
+        last_timestamp = self._get_last_timestamp(sender_id)
+        if self.write_behind is not None:
+            # events already queued are not in the remote tracker yet
+            last_timestamp = max(
+                last_timestamp, self.write_behind.last_timestamp(sender_id)
+            )
+        if self.write_ahead_log is not None:
+            last_timestamp = max(
+                last_timestamp, self.write_ahead_log.last_timestamp(sender_id)
+            )
+        new_events = list(
+            filter(
+                lambda x: x["timestamp"] > last_timestamp,
+                serialized_tracker["events"],
             )
-            tracker_shallow_copy = {key: val for key, val in serialized_tracker.items()}
-            tracker_shallow_copy["events"] = new_events
-            # only send the new events to the remote tracker
-            updated_info = self._update_tracker_gql(sender_id, tracker_shallow_copy)
-            # update the last index and last time stamp for future uses
-            self._store_tracker_info(sender_id, updated_info)
-            self.trackers[sender_id] = serialized_tracker
-            return serialized_tracker["events"]
+        )
+        tracker_shallow_copy = {key: val for key, val in serialized_tracker.items()}
+        tracker_shallow_copy["events"] = new_events
+        # only send the new events to the remote tracker
+        return _PreparedSave(serialized_tracker, tracker_shallow_copy, False)
+
+    def _after_save(self, canonical_tracker, prepared, updated_info):
+        sender_id = canonical_tracker.sender_id
+        if prepared.appended is None:
+            self.trackers.set(sender_id, prepared.tracker)
+        else:
+            self.trackers.append(sender_id, prepared.tracker, prepared.appended)
+        self.trackers.set_cursor(sender_id, self._event_cursor(canonical_tracker))
+        self.trackers.set_live(sender_id, canonical_tracker)
+        self._persist(sender_id, prepared.tracker, prepared.appended)
+        # update the last index and last time stamp for future uses
+        self._store_tracker_info(sender_id, updated_info)
+        self._snapshot_if_needed(sender_id)
+
+    def _snapshot_if_needed(self, sender_id):
+        """Snapshot a cached tracker with more than `snapshot_every` events.
+
+        The tracker object is dropped, the next retrieve rebuilds it from the
+        checkpoint and the last `snapshot_tail` events. The snapshot is sent
+        to Botfront with the next save."""
+
+        if (
+            not self.snapshot_every
+            or self.trackers.event_count(sender_id) <= self.snapshot_every
+        ):
+            return
+        tracker = self.trackers.peek(sender_id)
+        snapshot = take_snapshot(tracker, self.snapshot_tail)
+        if snapshot is tracker:
+            return
+        logger.debug(f"Snapshotting tracker for user {sender_id}")
+        self.trackers.set(sender_id, snapshot)
+        self.trackers.set_live(sender_id, None)
+        self._persist(sender_id, snapshot, None)
+        self._unsynced_snapshots.add(sender_id)
+
+    def _persist(self, sender_id, tracker, appended):
+        if self.disk_tier is None:
+            return
+        if appended is None:
+            self.disk_tier.replace(sender_id, tracker)
+        else:
+            self.disk_tier.append(sender_id, tracker, appended)
+
+    def save(self, canonical_tracker):
+        sender_id = canonical_tracker.sender_id
+        with self.metrics.save_serialize.time():
+            prepared = self._prepare_save(canonical_tracker)
+        if self.write_behind is not None:
+            self.write_behind.put(sender_id, prepared.payload, prepared.insert)
+            self._after_save(canonical_tracker, prepared, None)
+            return
+        if self._has_logged_writes(sender_id):
+            # sent after the writes that failed before it
+            self.write_ahead_log.append(sender_id, prepared.payload, prepared.insert)
+            self._after_save(canonical_tracker, prepared, None)
+            return
+        generation = self._subscription_generation()
+        with self.metrics.save_network.time():
+            if prepared.insert:
+                updated_info = self._insert_tracker_gql(sender_id, prepared.payload)
+            else:
+                updated_info = self._update_tracker_gql(sender_id, prepared.payload)
+        if updated_info is None:
+            self._log_failed_write(sender_id, prepared.payload, prepared.insert)
+        self._after_save(canonical_tracker, prepared, updated_info)
+        self._mark_synced(sender_id, generation, updated_info is not None)
+
+    async def save_async(self, canonical_tracker):
+        """Same as `save`, without blocking the event loop on the request.
+
+        Rasa saves trackers with `save`, this is for the callers running
+        their own event loop (e.g. the benchmark)."""
+
+        sender_id = canonical_tracker.sender_id
+        async with self._sender_locks(sender_id):
+            with self.metrics.save_serialize.time():
+                prepared = self._prepare_save(canonical_tracker)
+            payload = prepared.payload
+            if self.write_behind is not None:
+                self.write_behind.put(sender_id, payload, prepared.insert)
+                self._after_save(canonical_tracker, prepared, None)
+                return
+            if self._has_logged_writes(sender_id):
+                self.write_ahead_log.append(sender_id, payload, prepared.insert)
+                self._after_save(canonical_tracker, prepared, None)
+                return
+            generation = self._subscription_generation()
+            with self.metrics.save_network.time():
+                if prepared.insert:
+                    updated_info = await self._insert_tracker_gql_async(
+                        sender_id, payload
+                    )
+                else:
+                    updated_info = await self._update_tracker_gql_async(
+                        sender_id, payload
+                    )
+            if updated_info is None:
+                self._log_failed_write(sender_id, payload, prepared.insert)
+            self._after_save(canonical_tracker, prepared, updated_info)
+            self._mark_synced(sender_id, generation, updated_info is not None)
 
     def _convert_tracker(self, sender_id, tracker):
         if self.domain:
@@ -211,63 +779,349 @@ class BotfrontTrackerStore(TrackerStore):
             )
             return None
 
-    def _update_tracker(self, sender_id, remote_tracker):
-        old_tracker = self.trackers.get(sender_id)
-        if old_tracker is not None:
-            events = old_tracker.get("events")
-            remote_events = remote_tracker.get("events")
-            # if we recieve max event it means that the we skiped some events
-            # as we take only the last max events, so we remplace the local copy with the remote data
-            if len(remote_events) == self.max_events:
-                new_events = remote_events
-            else:
-                new_events = [*events, *remote_events]
-            new_tracker = {**old_tracker, **remote_tracker}
-            new_tracker["events"] = new_events
-            self.trackers[sender_id] = new_tracker
-            return new_tracker
+    def _update_tracker(self, sender_id, remote_tracker, reset):
+        if reset:
+            # the local snapshot is replaced along with the events
+            self._unsynced_snapshots.discard(sender_id)
+            self.trackers.set(sender_id, remote_tracker)
         else:
-            self.trackers[sender_id] = remote_tracker
-            return remote_tracker
+            self.trackers.append(sender_id, remote_tracker, remote_tracker["events"])
+        self._persist(
+            sender_id, remote_tracker, None if reset else remote_tracker["events"]
+        )
+        self._snapshot_if_needed(sender_id)
 
-    def retrieve(self, sender_id):
-        last_index = self._get_last_index(sender_id)
-        # retreive all new info since the last sync (given by last index)
-        new_tracker_info = self._fetch_tracker(sender_id, last_index)
-        current_tracker = self.trackers.get(sender_id)
+    def _load_tracker(self, sender_id, new_events):
+        """Return the tracker object of a sender.
+
+        The cached tracker object is reused and `new_events` (serialized) are
+        applied to it. It is only rebuilt from all the cached events when
+        there is none, when it changed since it was last synced, or when
+        `new_events` is None (the remote window was reset)."""
+
+        live = self.trackers.get_live(sender_id)
+        if (
+            live is not None
+            and new_events is not None
+            and self.trackers.get_cursor(sender_id) == self._event_cursor(live)
+        ):
+            for event in deserialise_events(new_events):
+                live.update(event)
+            if new_events:
+                # counts the new events in the size of the cache
+                self.trackers.set_live(sender_id, live)
+            return self._track_cursor(sender_id, live)
+
+        live = self._convert_tracker(sender_id, self.trackers.peek(sender_id))
+        self.trackers.set_live(sender_id, live)
+        return self._track_cursor(sender_id, live)
+
+    def _apply_remote(self, sender_id, new_tracker_info):
+        """Add the remote events to the cached tracker, return them or None if
+        the cached tracker was replaced by the remote one."""
+
+        exists_locally = self.trackers.touch(sender_id)
+        self._store_tracker_info(sender_id, new_tracker_info)
+        remote_tracker = new_tracker_info.get("tracker")
+        remote_events = remote_tracker.get("events")
+        # if we recieve max event it means that the we skiped some events
+        # as we take only the last max events, so we remplace the local copy with the remote data
+        self.metrics.fetched_events.observe(len(remote_events))
+        truncated = len(remote_events) == self.fetch_size
+        reset = not exists_locally or truncated
+        if exists_locally and reset:
+            self.metrics.window_resets.inc()
+        if truncated and self.fetch_size < self.max_events and remote_events:
+            # events before the window are missing, keep the state they lead
+            # to, as far as the window does not change it
+            restored = checkpoint_events(
+                state_before(remote_tracker, remote_events),
+                remote_events[0]["timestamp"],
+                with_user_message=not has_user_message(remote_events),
+            )
+            remote_tracker = {**remote_tracker, "events": restored + remote_events}
+        self._update_tracker(sender_id, remote_tracker, reset)
+        return None if reset else remote_events
+
+    def _sync_token(self, sender_id):
+        """The state of a cached tracker a fetch starts from: the last synced
+        index and the version of the cached tracker, see `_apply_fetched`."""
+
+        with self.trackers.lock:
+            return self._get_last_index(sender_id), self.trackers.version(sender_id)
+
+    def _apply_fetched(self, sender_id, new_tracker_info, token):
+        """`_apply_remote`, unless the cached tracker changed since `token` was
+        read, e.g. it was saved while the fetch was awaited: the fetched
+        events may then already be cached. Returns whether the fetched
+        tracker was applied, and the new events."""
+
+        with self.trackers.lock:
+            if token is not None and self._sync_token(sender_id) != token:
+                logger.debug(f"Tracker for user {sender_id} changed while fetched")
+                return False, []
+            return True, self._apply_remote(sender_id, new_tracker_info)
+
+    def _retrieve_from(self, sender_id, new_tracker_info, token=None):
         # do not chane the order of these ifs
         # ortherwise you will get synchornication issues when working with multiple rasa instances
         # the tracker exist on the remote and may exist locally
         if new_tracker_info is not None:
-            self._store_tracker_info(sender_id, new_tracker_info)
-            tracker = self._update_tracker(sender_id, new_tracker_info.get("tracker"))
-            return self._convert_tracker(sender_id, tracker)
+            applied, new_events = self._apply_fetched(
+                sender_id, new_tracker_info, token
+            )
+            if applied:
+                return self._load_tracker(sender_id, new_events)
 
         # the tracker do not exist yet
-        if current_tracker is None:
+        if not self.trackers.touch(sender_id):
             return None
 
         # the tracker exist localy an there is no new infos
-        return self._convert_tracker(sender_id, current_tracker)
+        return self._load_tracker(sender_id, [])
+
+    def _deserialize(self, sender_id, new_tracker_info, token=None):
+        with self.metrics.retrieve_deserialize.time():
+            return self._retrieve_from(sender_id, new_tracker_info, token)
+
+    def _track_cursor(self, sender_id, canonical_tracker):
+        # every event of a tracker rebuilt from the cache is already synced
+        if canonical_tracker is not None:
+            self.trackers.set_cursor(sender_id, self._event_cursor(canonical_tracker))
+        return canonical_tracker
+
+    def _is_fresh(self, sender_id):
+        """Whether the cached tracker can be served without asking Botfront:
+        it is known to be in sync (see `TrackerSubscription`) or was synced
+        less than `freshness_window` seconds ago."""
+
+        if sender_id not in self.trackers:
+            return False
+        if self.subscription is not None and self.subscription.is_synced(sender_id):
+            return True
+        if not self.freshness_window:
+            return False
+        synced_at = (self.trackers_info.get(sender_id) or {}).get("synced_at")
+        return synced_at is not None and time.time() - synced_at < self.freshness_window
+
+    def _subscription_generation(self):
+        # read before a request, see `TrackerSubscription.mark_synced`
+        return self.subscription.generation if self.subscription is not None else None
+
+    def _mark_synced(self, sender_id, generation, synced=True):
+        if synced and self.subscription is not None:
+            self.subscription.mark_synced(sender_id, generation)
+
+    def _should_probe(self, sender_id):
+        return (
+            self.version_probe
+            and sender_id in self.trackers
+            and sender_id in self.trackers_info
+        )
+
+    def _is_unchanged(self, sender_id, head):
+        """Whether the remote tracker is still at the index and timestamp of
+        the last sync. A failed probe counts as unchanged, as a failed fetch
+        would also leave the cached tracker as is."""
+
+        if head is None:
+            return True
+        return (head["lastIndex"], head["lastTimestamp"]) == (
+            self._get_last_index(sender_id),
+            self._get_last_timestamp(sender_id),
+        )
+
+    def _take_warmed(self, sender_id):
+        warmed_at = self._warmed.pop(sender_id, None)
+        return warmed_at is not None and time.time() - warmed_at < WARM_TTL
+
+    def retrieve(self, sender_id):
+        self._load_from_disk(sender_id)
+        if (
+            self._take_warmed(sender_id)
+            or self._has_pending_writes(sender_id)
+            or self._is_fresh(sender_id)
+        ):
+            # the tracker was just fetched by `warm`, the local copy is ahead
+            # of the remote one until it is flushed, or was synced recently
+            # enough to be served as is
+            return self._deserialize(sender_id, None)
+        generation = self._subscription_generation()
+        if self._should_probe(sender_id):
+            with self.metrics.retrieve_network.time():
+                head = self._fetch_tracker_head(sender_id)
+            if self._is_unchanged(sender_id, head):
+                self._mark_synced(sender_id, generation, head is not None)
+                return self._deserialize(sender_id, None)
+        token = self._sync_token(sender_id)
+        # retreive all new info since the last sync (given by last index)
+        with self.metrics.retrieve_network.time():
+            new_tracker_info = self._fetch_tracker(sender_id, token[0])
+        synced = new_tracker_info is not None and self._sync_token(sender_id) == token
+        tracker = self._deserialize(sender_id, new_tracker_info, token)
+        self._mark_synced(sender_id, generation, synced)
+        return tracker
+
+    def _replace_from(self, sender_id, new_tracker_info, token=None):
+        with self.trackers.lock:
+            replaced = new_tracker_info is not None and (
+                token is None or self._sync_token(sender_id) == token
+            )
+            if replaced:
+                self._store_tracker_info(sender_id, new_tracker_info)
+                self._update_tracker(
+                    sender_id, new_tracker_info["tracker"], reset=True
+                )
+        if not replaced:
+            return self._retrieve_from(sender_id, None)
+        return self._load_tracker(sender_id, None)
+
+    def backfill(self, sender_id):
+        """Retrieve a tracker with up to `max_events` events, for the actions
+        needing more history than the policies (see `fetch_window`)."""
+
+        if self._has_pending_writes(sender_id):
+            # the remote tracker misses the pending events
+            return self.retrieve(sender_id)
+        new_tracker_info = self._fetch_tracker(sender_id, -1, self.max_events)
+        return self._replace_from(sender_id, new_tracker_info)
+
+    async def backfill_async(self, sender_id):
+        async with self._sender_locks(sender_id):
+            if self._has_pending_writes(sender_id):
+                return self._retrieve_from(sender_id, None)
+            token = self._sync_token(sender_id)
+            new_tracker_info = await self._fetch_tracker_async(
+                sender_id, -1, self.max_events
+            )
+            return self._replace_from(sender_id, new_tracker_info, token)
+
+    def prefetch(self, sender_ids, batch_size=50):
+        """Load the trackers of `sender_ids` in the cache, fetching up to
+        `batch_size` of them per request. Only the serialized trackers are
+        cached, the tracker objects are built on the first retrieve.
+
+        Returns the number of trackers fetched."""
+
+        tokens = {}
+        for sender_id in dict.fromkeys(sender_ids):
+            self._load_from_disk(sender_id)
+            if not self._has_pending_writes(sender_id):
+                tokens[sender_id] = self._sync_token(sender_id)
+        fetches = [(sender_id, token[0]) for sender_id, token in tokens.items()]
+
+        fetched = 0
+        for start in range(0, len(fetches), batch_size):
+            batch = fetches[start : start + batch_size]
+            infos = self._bulk_fetch_gql(batch)
+            for sender_id, _ in batch:
+                info = infos.get(sender_id)
+                if info is None:
+                    continue
+                # skip the trackers synced or saved in the meantime. A retrieve
+                # cannot run between the check, the update and dropping the
+                # cached tracker object, which misses the new events
+                with self.trackers.lock:
+                    applied, _ = self._apply_fetched(sender_id, info, tokens[sender_id])
+                    if not applied:
+                        continue
+                    self.trackers.set_live(sender_id, None)
+                fetched += 1
+        logger.debug(f"Prefetched {fetched} tracker(s)")
+        return fetched
+
+    async def warm(self, sender_id):
+        """Retrieve a tracker without blocking the event loop, so that the
+        next `retrieve` of its sender is served from the cache. Rasa calls
+        the blocking `retrieve` when it handles a message, input channels
+        warm the tracker before (see `warm_trackers`)."""
+
+        await self.retrieve_async(sender_id)
+        self._warmed[sender_id] = time.time()
+
+    async def retrieve_async(self, sender_id):
+        """Same as `retrieve`, without blocking the event loop on the request.
+
+        Concurrent retrieves of a sender share a single fetch, which waits for
+        the saves of that sender already started (see `save_async`)."""
+
+        return await self._retrieves.do(
+            sender_id, lambda: self._retrieve_async(sender_id)
+        )
+
+    async def _retrieve_async(self, sender_id):
+        async with self._sender_locks(sender_id):
+            self._load_from_disk(sender_id)
+            if self._has_pending_writes(sender_id) or self._is_fresh(sender_id):
+                return self._deserialize(sender_id, None)
+            generation = self._subscription_generation()
+            if self._should_probe(sender_id):
+                with self.metrics.retrieve_network.time():
+                    head = await self._fetch_tracker_head_async(sender_id)
+                if self._is_unchanged(sender_id, head):
+                    self._mark_synced(sender_id, generation, head is not None)
+                    return self._deserialize(sender_id, None)
+            # the blocking `save` cannot wait for the sender lock, a tracker it
+            # saved during the fetch is detected with the sync token instead
+            token = self._sync_token(sender_id)
+            with self.metrics.retrieve_network.time():
+                new_tracker_info = await self._fetch_tracker_async(
+                    sender_id, token[0]
+                )
+            synced = (
+                new_tracker_info is not None and self._sync_token(sender_id) == token
+            )
+            tracker = self._deserialize(sender_id, new_tracker_info, token)
+            self._mark_synced(sender_id, generation, synced)
+            return tracker
+
+    async def close(self):
+        if self.write_behind is not None:
+            self.write_behind.close()
+        if self.write_ahead_log is not None:
+            self.write_ahead_log.close()
+        if self.subscription is not None:
+            self.subscription.close()
+        if self.disk_tier is not None:
+            self.disk_tier.close()
+        await self.async_graphql_endpoint.close()
+
+    def stats(self):
+        stats = {"cache": self.trackers.stats(), "graphql": self.resilience.stats()}
+        if self.subscription is not None:
+            stats["subscription"] = {
+                "connected": self.subscription.is_connected,
+                "changes": self.subscription.changes,
+            }
+        return stats
+
+    def _expires_at(self, tracker):
+        latest_event = tracker.get("latest_event_time")
+        if latest_event is None:
+            return None
+        return latest_event + self.tracker_persist_time
 
     def sweep(self):
-        try:  ## wraped in a try block so if and exception occurs it does not stopp the sweep mechanism
-            for key in list(
-                self.trackers.keys()
-            ):  # Iterate over list of keys to prevent runtime errors when deleting elements
-                tracker = self.trackers.get(key)
-                max_event_time = time.time() - self.tracker_persist_time
-                latest_event = tracker.get("latest_event_time", float("inf"))
-                if latest_event is None:
-                    latest_event = float("inf")
-                if tracker is not None and (latest_event < max_event_time):
-                    logger.debug("SWEEPER: Removing tracker for user {}".format(key))
-                    del self.trackers[key]
-                    del self.trackers_info[key]
-        except Exception as e:
-            print(e)
-            pass
+        """Remove the trackers without events for `tracker_persist_time`.
+
+        Only the expired trackers are visited, see `TrackerCache.expire`."""
+
+        with self.metrics.sweep.time():
+            self._sweep()
+
+    def _sweep(self):
+        for key in self.trackers.expire():
+            logger.debug("SWEEPER: Removing tracker for user {}".format(key))
+            if self.disk_tier is not None:
+                self.disk_tier.delete(key)
+        if self.disk_tier is not None:
+            self.disk_tier.delete_older_than(time.time() - self.tracker_persist_time)
 
     @staticmethod
     def _serialize_tracker_to_dict(canonical_tracker):
         return canonical_tracker.current_state(EventVerbosity.ALL)
+
+    @staticmethod
+    def _serialize_tracker_summary(canonical_tracker):
+        # slots, latest message etc. without going through the events
+        return canonical_tracker.current_state(EventVerbosity.NONE)
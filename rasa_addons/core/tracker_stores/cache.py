@@ -0,0 +1,446 @@
+import heapq
+import logging
+import sys
+import time
+from collections import OrderedDict
+from threading import RLock
+from typing import Text, Any, Dict, Optional, List, Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# rough footprint of a deserialized event, parse data included
+LIVE_EVENT_BYTES = 1024
+
+
+def approximate_live_size(tracker: Any) -> int:
+    """Rough memory footprint in bytes of a tracker object."""
+
+    return len(getattr(tracker, "events", None) or []) * LIVE_EVENT_BYTES
+
+
+def approximate_size(obj: Any) -> int:
+    """Rough memory footprint in bytes of a json-like structure."""
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += approximate_size(key) + approximate_size(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            size += approximate_size(value)
+    return size
+
+
+class _CacheEntry:
+    __slots__ = (
+        "tracker",
+        "info",
+        "cursor",
+        "live",
+        "size",
+        "live_size",
+        "version",
+        "accessed_at",
+        "expires_at",
+    )
+
+    def __init__(self):
+        self.tracker = None
+        self.info = None
+        self.cursor = None
+        self.live = None
+        self.size = 0
+        self.live_size = 0
+        self.version = 0
+        self.accessed_at = time.time()
+        self.expires_at = None
+
+
+class _InfoView:
+    """Dict-like access to the sync info (last index and timestamp) of the
+    cached trackers. It shares its entries with the cache, so evicting a
+    tracker drops its info with it."""
+
+    def __init__(self, cache: "TrackerCache") -> None:
+        self._cache = cache
+
+    def get(self, sender_id: Text, default: Any = None) -> Any:
+        with self._cache.lock:
+            entry = self._cache._entries.get(sender_id)
+            if entry is None or entry.info is None:
+                return default
+            return entry.info
+
+    def __getitem__(self, sender_id: Text) -> Dict[Text, Any]:
+        info = self.get(sender_id)
+        if info is None:
+            raise KeyError(sender_id)
+        return info
+
+    def __setitem__(self, sender_id: Text, info: Dict[Text, Any]) -> None:
+        with self._cache.lock:
+            self._cache._entry(sender_id).info = info
+
+    def __contains__(self, sender_id: Text) -> bool:
+        return self.get(sender_id) is not None
+
+    def pop(self, sender_id: Text, default: Any = None) -> Any:
+        with self._cache.lock:
+            entry = self._cache._entries.get(sender_id)
+            if entry is None or entry.info is None:
+                return default
+            info, entry.info = entry.info, None
+            return info
+
+
+class TrackerCache:
+    """Bounded LRU cache of serialized trackers.
+
+    The cache holds at most `max_entries` trackers and roughly `max_bytes`
+    bytes, evicting the least recently used ones first. Entries not accessed
+    for `ttl` seconds are dropped on the next access or call to `expire`, and
+    so are the entries past the deadline `expires_at(tracker)` returns when
+    they are set. Deadlines are kept in a min-heap, so `expire` only looks at
+    the entries that are due.
+    `is_evictable` can veto the eviction of a sender, e.g. while it still has
+    writes to send, and `on_evict` is called for every evicted sender. Both
+    are called while holding the cache lock: they may take other locks, but
+    those must never be held while calling back into the cache. The
+    tracker sync info lives in the same entries and is exposed through
+    `info`.
+
+    The tracker objects kept with `set_live` count towards `max_bytes`, with
+    the size `live_size` estimates.
+
+    With `compact`, trackers are stored as `CompactTracker` and only decoded
+    by `get` and `peek`; `append` and `get_summary` work on the encoded form.
+    No tracker object is kept, they would cost more than the encoded trackers
+    save."""
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        is_evictable: Optional[Callable[[Text], bool]] = None,
+        on_evict: Optional[Callable[[Text], None]] = None,
+        expires_at: Optional[Callable[[Dict[Text, Any]], Optional[float]]] = None,
+        compact: bool = False,
+        live_size: Callable[[Any], int] = approximate_live_size,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.is_evictable = is_evictable or (lambda sender_id: True)
+        self.on_evict = on_evict
+        self.expires_at = expires_at
+        self.compact = compact
+        self.live_size = live_size
+        if compact:
+            from rasa_addons.core.tracker_stores.compact import CompactTracker
+
+            self._compact_tracker = CompactTracker
+        self.lock = RLock()
+        self._entries = OrderedDict()
+        # (deadline, sender_id), stale items are skipped when popped
+        self._deadlines = []
+        self.size_bytes = 0
+        # bumped whenever a tracker is stored, see `version`
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.info = _InfoView(self)
+
+    def _entry(self, sender_id: Text) -> _CacheEntry:
+        entry = self._entries.get(sender_id)
+        if entry is None:
+            entry = self._entries[sender_id] = _CacheEntry()
+        return entry
+
+    def _is_expired(self, entry: _CacheEntry, now: float) -> bool:
+        return self.ttl is not None and entry.accessed_at + self.ttl < now
+
+    def _drop(self, sender_id: Text) -> None:
+        entry = self._entries.pop(sender_id)
+        self.size_bytes -= entry.size + entry.live_size
+
+    def _evict(self, sender_id: Text) -> None:
+        logger.debug(f"Evicting tracker for user {sender_id} from cache")
+        self._drop(sender_id)
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(sender_id)
+
+    def _enforce_limits(self, keep: Text) -> None:
+        def over_limits():
+            return (
+                self.max_entries is not None and len(self._entries) > self.max_entries
+            ) or (self.max_bytes is not None and self.size_bytes > self.max_bytes)
+
+        # least recently used first, the entries that cannot be evicted yet
+        # are moved to the end so the next ones are looked at
+        skipped = 0
+        while over_limits() and skipped < len(self._entries):
+            sender_id = next(iter(self._entries))
+            if sender_id != keep and self.is_evictable(sender_id):
+                self._evict(sender_id)
+            else:
+                self._entries.move_to_end(sender_id)
+                skipped += 1
+
+    def _access(self, sender_id: Text) -> Optional[_CacheEntry]:
+        entry = self._entries.get(sender_id)
+        now = time.time()
+        if entry is not None and self._is_expired(entry, now):
+            if self.is_evictable(sender_id):
+                self._evict(sender_id)
+                entry = None
+        if entry is None or entry.tracker is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry.accessed_at = now
+        self._entries.move_to_end(sender_id)
+        return entry
+
+    def _decode(self, tracker: Any) -> Dict[Text, Any]:
+        return tracker.to_dict() if self.compact else tracker
+
+    def get(self, sender_id: Text, default: Any = None) -> Any:
+        with self.lock:
+            entry = self._access(sender_id)
+            return self._decode(entry.tracker) if entry is not None else default
+
+    def touch(self, sender_id: Text) -> bool:
+        """Same as `get` without returning (and decoding) the tracker."""
+
+        with self.lock:
+            return self._access(sender_id) is not None
+
+    def _store(
+        self,
+        sender_id: Text,
+        entry: _CacheEntry,
+        tracker: Any,
+        size: int,
+        summary: Dict[Text, Any],
+    ) -> None:
+        self.size_bytes += size - entry.size
+        self._version += 1
+        entry.tracker = tracker
+        entry.size = size
+        entry.version = self._version
+        entry.accessed_at = time.time()
+        self._entries.move_to_end(sender_id)
+        if self.expires_at is not None:
+            self._set_deadline(sender_id, entry, self.expires_at(summary))
+        self._enforce_limits(keep=sender_id)
+
+    def set(self, sender_id: Text, tracker: Dict[Text, Any]) -> None:
+        with self.lock:
+            entry = self._entry(sender_id)
+            if self.compact:
+                stored = self._compact_tracker(tracker)
+                size = stored.nbytes
+            else:
+                # own events list, `append` extends it in place
+                stored = {**tracker, "events": list(tracker.get("events") or [])}
+                size = approximate_size(stored)
+            self._store(sender_id, entry, stored, size, tracker)
+
+    def append(
+        self,
+        sender_id: Text,
+        tracker: Dict[Text, Any],
+        events: List[Dict[Text, Any]],
+    ) -> None:
+        """Add `events` to a cached tracker and update its other fields with
+        those of `tracker`. The events already cached are not copied."""
+
+        with self.lock:
+            entry = self._entries.get(sender_id)
+            if entry is None or entry.tracker is None:
+                self.set(sender_id, {**tracker, "events": events})
+                return
+            summary = {key: val for key, val in tracker.items() if key != "events"}
+            if self.compact:
+                stored = entry.tracker
+                stored.update(summary, events)
+                size = stored.nbytes
+            else:
+                stored = {**entry.tracker, **summary}
+                stored["events"] = entry.tracker["events"]
+                stored["events"].extend(events)
+                size = entry.size + approximate_size(events)
+            self._store(sender_id, entry, stored, size, summary)
+
+    def _set_deadline(
+        self, sender_id: Text, entry: _CacheEntry, deadline: Optional[float]
+    ) -> None:
+        if deadline == entry.expires_at:
+            return
+        entry.expires_at = deadline
+        if deadline is None:
+            return
+        heapq.heappush(self._deadlines, (deadline, sender_id))
+        if len(self._deadlines) > 2 * len(self._entries) + 1024:
+            # too many stale items, rebuild the heap from the live deadlines
+            self._deadlines = [
+                (e.expires_at, key)
+                for key, e in self._entries.items()
+                if e.expires_at is not None
+            ]
+            heapq.heapify(self._deadlines)
+
+    def __getitem__(self, sender_id: Text) -> Dict[Text, Any]:
+        tracker = self.get(sender_id)
+        if tracker is None:
+            raise KeyError(sender_id)
+        return tracker
+
+    def __setitem__(self, sender_id: Text, tracker: Dict[Text, Any]) -> None:
+        self.set(sender_id, tracker)
+
+    def __delitem__(self, sender_id: Text) -> None:
+        with self.lock:
+            self._drop(sender_id)
+
+    def __contains__(self, sender_id: Text) -> bool:
+        with self.lock:
+            entry = self._entries.get(sender_id)
+            return entry is not None and entry.tracker is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[Text]:
+        return iter(self.keys())
+
+    def keys(self):
+        with self.lock:
+            return list(self._entries.keys())
+
+    def peek(self, sender_id: Text) -> Optional[Dict[Text, Any]]:
+        """Return a tracker without counting it as an access."""
+
+        with self.lock:
+            entry = self._entries.get(sender_id)
+            if entry is None or entry.tracker is None:
+                return None
+            return self._decode(entry.tracker)
+
+    def get_summary(self, sender_id: Text) -> Optional[Dict[Text, Any]]:
+        """Return a tracker without its events, without decoding them."""
+
+        with self.lock:
+            entry = self._entries.get(sender_id)
+            if entry is None or entry.tracker is None:
+                return None
+            if self.compact:
+                return dict(entry.tracker.summary)
+            return {k: v for k, v in entry.tracker.items() if k != "events"}
+
+    def event_count(self, sender_id: Text) -> int:
+        with self.lock:
+            entry = self._entries.get(sender_id)
+            return self._count_events(entry.tracker) if entry is not None else 0
+
+    def version(self, sender_id: Text) -> Optional[int]:
+        """Changes every time the tracker of a sender is set or appended to,
+        None if it is not cached."""
+
+        with self.lock:
+            entry = self._entries.get(sender_id)
+            if entry is None or entry.tracker is None:
+                return None
+            return entry.version
+
+    def get_cursor(self, sender_id: Text) -> Any:
+        """Local event cursor of a tracker, see `BotfrontTrackerStore`."""
+
+        with self.lock:
+            entry = self._entries.get(sender_id)
+            return entry.cursor if entry is not None else None
+
+    def set_cursor(self, sender_id: Text, cursor: Any) -> None:
+        with self.lock:
+            entry = self._entries.get(sender_id)
+            if entry is not None:
+                entry.cursor = cursor
+
+    def get_live(self, sender_id: Text) -> Any:
+        """Deserialized tracker object kept alongside the serialized one."""
+
+        with self.lock:
+            entry = self._entries.get(sender_id)
+            return entry.live if entry is not None else None
+
+    def set_live(self, sender_id: Text, tracker: Any) -> None:
+        """Keep a tracker object, or update the size of the one kept after
+        events were added to it."""
+
+        with self.lock:
+            entry = self._entries.get(sender_id)
+            if entry is None:
+                return
+            if self.compact:
+                tracker = None
+            live_size = self.live_size(tracker) if tracker is not None else 0
+            self.size_bytes += live_size - entry.live_size
+            entry.live = tracker
+            entry.live_size = live_size
+            self._enforce_limits(keep=sender_id)
+
+    def expire(self, retry_delay: float = 1.0) -> List[Text]:
+        """Drop the entries idle for longer than `ttl` or past their deadline,
+        and return the sender ids of the latter. The cost depends on the
+        number of expired entries, not on the size of the cache. Entries that
+        cannot be evicted yet are looked at again after `retry_delay` seconds."""
+
+        now = time.time()
+        expired = []
+        with self.lock:
+            if self.ttl is not None:
+                # entries are ordered by last access, oldest first
+                idle = []
+                for sender_id, entry in self._entries.items():
+                    if not self._is_expired(entry, now):
+                        break
+                    idle.append(sender_id)
+                for sender_id in idle:
+                    if self.is_evictable(sender_id):
+                        self._evict(sender_id)
+
+            while self._deadlines and self._deadlines[0][0] <= now:
+                deadline, sender_id = heapq.heappop(self._deadlines)
+                entry = self._entries.get(sender_id)
+                if entry is None or entry.expires_at != deadline:
+                    continue
+                if self.is_evictable(sender_id):
+                    self._evict(sender_id)
+                    expired.append(sender_id)
+                else:
+                    entry.expires_at = None
+                    self._set_deadline(sender_id, entry, now + retry_delay)
+        return expired
+
+    def _count_events(self, tracker: Any) -> int:
+        if tracker is None:
+            return 0
+        if self.compact:
+            return tracker.n_events
+        return len(tracker.get("events") or [])
+
+    def stats(self) -> Dict[Text, Any]:
+        with self.lock:
+            events = sum(self._count_events(e.tracker) for e in self._entries.values())
+        return {
+            "entries": len(self._entries),
+            "events": events,
+            "bytes": self.size_bytes,
+            "bytes_per_event": self.size_bytes / events if events else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,112 @@
+import sys
+import zlib
+from typing import Text, Any, Dict, List
+
+from rasa_addons.core import codec
+from rasa_addons.core.tracker_stores.cache import approximate_size
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Strings found in most serialized events. Used as a preset dictionary, so
+# that even the couple of events saved at each turn compress well.
+ZDICT = (
+    b'{"event":"action","timestamp":,"name":"action_listen","policy":'
+    b'"confidence":null,"event":"user","text":"parse_data":{"intent":'
+    b'{"name":"confidence":},"entities":[],"intent_ranking":[{"name":'
+    b'"confidence":"language":"input_channel":"message_id":"metadata":{}'
+    b'"event":"bot","data":{"elements":null,"quick_replies":null,"buttons":'
+    b'null,"attachment":null,"image":null,"custom":null},"event":"slot",'
+    b'"value":"event":"form","event":"action_execution_rejected"'
+    b'"policy_0_MemoizationPolicy","policy_1_KerasPolicy"'
+)
+
+# values worth sharing between trackers, e.g. intent and action names
+INTERNED_VALUES = {"event", "name", "policy", "input_channel", "entity", "language"}
+
+MAX_CHUNKS = 32
+
+
+def _pack(events: List[Dict[Text, Any]]) -> bytes:
+    if msgpack is not None:
+        return msgpack.packb(events, use_bin_type=True)
+    return codec.dumps(events)
+
+
+def _unpack(data: bytes) -> List[Dict[Text, Any]]:
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False)
+    return codec.loads(data)
+
+
+def compress_events(events: List[Dict[Text, Any]]) -> bytes:
+    compressor = zlib.compressobj(
+        6, zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, 0, ZDICT
+    )
+    return compressor.compress(_pack(events)) + compressor.flush()
+
+
+def decompress_events(blob: bytes) -> List[Dict[Text, Any]]:
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS, ZDICT)
+    return _unpack(decompressor.decompress(blob) + decompressor.flush())
+
+
+def intern_strings(obj: Any, key: Text = None) -> Any:
+    """Intern the keys of a json-like structure and its common values."""
+
+    if isinstance(obj, dict):
+        return {
+            sys.intern(k) if isinstance(k, str) else k: intern_strings(v, k)
+            for k, v in obj.items()
+        }
+    if isinstance(obj, list):
+        return [intern_strings(v, key) for v in obj]
+    if isinstance(obj, str) and key in INTERNED_VALUES:
+        return sys.intern(obj)
+    return obj
+
+
+class CompactTracker:
+    """Serialized tracker with its events kept as compressed blobs.
+
+    The summary (slots, latest message...) stays decoded. Events are
+    appended as one blob per call to `update`, and only decoded when the
+    whole tracker is needed, see `to_dict`. When there are more than
+    `MAX_CHUNKS` blobs, the most recent half is merged into one."""
+
+    __slots__ = ("summary", "chunks", "n_events", "nbytes")
+
+    def __init__(self, tracker: Dict[Text, Any]) -> None:
+        self.summary = {}
+        self.chunks = []
+        self.n_events = 0
+        self.nbytes = 0
+        self.update(tracker, tracker.get("events") or [])
+
+    def update(
+        self, tracker: Dict[Text, Any], events: List[Dict[Text, Any]]
+    ) -> None:
+        summary = {key: val for key, val in tracker.items() if key != "events"}
+        self.summary = {**self.summary, **intern_strings(summary)}
+        if events:
+            self.chunks.append(compress_events(events))
+            self.n_events += len(events)
+        if len(self.chunks) > MAX_CHUNKS:
+            half = len(self.chunks) // 2
+            merged = [
+                event
+                for chunk in self.chunks[half:]
+                for event in decompress_events(chunk)
+            ]
+            self.chunks[half:] = [compress_events(merged)]
+        self.nbytes = approximate_size(self.summary) + sum(
+            sys.getsizeof(chunk) for chunk in self.chunks
+        )
+
+    def events(self) -> List[Dict[Text, Any]]:
+        return [event for chunk in self.chunks for event in decompress_events(chunk)]
+
+    def to_dict(self) -> Dict[Text, Any]:
+        return {**self.summary, "events": self.events()}
@@ -0,0 +1,62 @@
+from rasa_addons.core.metrics import REGISTRY, MetricsRegistry
+
+PREFIX = "botfront_tracker_store_"
+EVENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTE_BUCKETS = tuple(2 ** i for i in range(8, 24, 2))  # 256B to 4MB
+
+
+class TrackerStoreMetrics:
+    """Hot-path metrics of `BotfrontTrackerStore`.
+
+    Retrieves are split between the `network` phase (requests to Botfront)
+    and the `deserialize` phase (applying the fetched events to the cached
+    tracker or rebuilding it), saves between `serialize` and `network`.
+    The values used on every turn are resolved once here, so recording
+    them is a lock and an addition."""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY) -> None:
+        retrieve = registry.histogram(
+            PREFIX + "retrieve_seconds", "Time spent retrieving trackers", ["phase"]
+        )
+        self.retrieve_network = retrieve.labels("network")
+        self.retrieve_deserialize = retrieve.labels("deserialize")
+        save = registry.histogram(
+            PREFIX + "save_seconds", "Time spent saving trackers", ["phase"]
+        )
+        self.save_serialize = save.labels("serialize")
+        self.save_network = save.labels("network")
+        self.fetched_events = registry.histogram(
+            PREFIX + "fetched_events",
+            "Events fetched from Botfront per tracker",
+            buckets=EVENT_BUCKETS,
+        ).labels()
+        payload = registry.histogram(
+            PREFIX + "payload_bytes",
+            "Size of the GraphQL requests and responses",
+            ["direction"],
+            buckets=BYTE_BUCKETS,
+        )
+        self.payload_sent = payload.labels("sent")
+        self.payload_received = payload.labels("received")
+        self.window_resets = registry.counter(
+            PREFIX + "window_resets_total",
+            "Fetches of a full window of events, replacing the cached tracker",
+        ).labels()
+        self.sweep = registry.histogram(
+            PREFIX + "sweep_seconds", "Time spent sweeping expired trackers"
+        ).labels()
+        self.cache_entries = registry.gauge(
+            PREFIX + "cache_entries", "Trackers in the cache"
+        ).labels()
+        self.cache_bytes = registry.gauge(
+            PREFIX + "cache_bytes", "Approximate size of the cached trackers"
+        ).labels()
+
+    def record_transfer(self, sent: int, received: int) -> None:
+        self.payload_sent.observe(sent)
+        self.payload_received.observe(received)
+
+    def watch_cache(self, cache) -> None:
+        # computed on scrape, nothing to update on the hot path
+        self.cache_entries.set_function(lambda: len(cache))
+        self.cache_bytes.set_function(lambda: cache.size_bytes)
@@ -0,0 +1,170 @@
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Text, Any, Dict, Optional, List, Tuple
+
+from rasa_addons.core import codec
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS trackers (
+        sender_id TEXT PRIMARY KEY,
+        summary TEXT,
+        last_index INTEGER,
+        last_timestamp REAL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        sender_id TEXT NOT NULL,
+        event TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS events_sender ON events (sender_id, seq)",
+    "CREATE INDEX IF NOT EXISTS trackers_updated_at ON trackers (updated_at)",
+]
+
+
+class SqliteTrackerTier:
+    """On-disk copy of the trackers cached by `BotfrontTrackerStore`.
+
+    Events are stored one row each and only ever appended, unless the
+    tracker is replaced, so a save costs a few small inserts. The database
+    lives in `directory`, one file per project and environment, and survives
+    restarts: a tracker loaded from it only needs the events added to
+    Botfront after its last index."""
+
+    def __init__(
+        self, directory: Text, project_id: Optional[Text] = None, env: Text = ""
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        name = "-".join(p for p in ["trackers", project_id, env] if p)
+        self.path = os.path.join(directory, f"{name}.db")
+        self._lock = Lock()
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        logger.debug(f"Persisting trackers to {self.path}")
+
+    def _touch(self, sender_id: Text) -> None:
+        self._conn.execute(
+            "INSERT OR IGNORE INTO trackers (sender_id, updated_at) VALUES (?, ?)",
+            (sender_id, time.time()),
+        )
+
+    def _write_summary(self, sender_id: Text, tracker: Dict[Text, Any]) -> None:
+        summary = {key: val for key, val in tracker.items() if key != "events"}
+        self._touch(sender_id)
+        self._conn.execute(
+            "UPDATE trackers SET summary = ?, updated_at = ? WHERE sender_id = ?",
+            (codec.dumps(summary), time.time(), sender_id),
+        )
+
+    def _insert_events(self, sender_id: Text, events: List[Dict[Text, Any]]) -> None:
+        self._conn.executemany(
+            "INSERT INTO events (sender_id, event) VALUES (?, ?)",
+            [(sender_id, codec.dumps(event)) for event in events],
+        )
+
+    def append(
+        self,
+        sender_id: Text,
+        tracker: Dict[Text, Any],
+        events: List[Dict[Text, Any]],
+    ) -> None:
+        """Add `events` to a tracker and replace its summary (slots, latest
+        message...) with the one of `tracker`."""
+
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._insert_events(sender_id, events)
+            self._write_summary(sender_id, tracker)
+
+    def replace(self, sender_id: Text, tracker: Dict[Text, Any]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM events WHERE sender_id = ?", (sender_id,))
+            self._insert_events(sender_id, tracker.get("events") or [])
+            self._write_summary(sender_id, tracker)
+
+    def set_info(self, sender_id: Text, info: Dict[Text, Any]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._touch(sender_id)
+            self._conn.execute(
+                "UPDATE trackers SET last_index = ?, last_timestamp = ? "
+                "WHERE sender_id = ?",
+                (info.get("last_index"), info.get("last_timestamp"), sender_id),
+            )
+
+    def load(
+        self, sender_id: Text, max_age: Optional[float] = None
+    ) -> Optional[Tuple[Dict[Text, Any], Optional[Dict[Text, Any]]]]:
+        """Return the tracker of a sender and its sync info, if it was stored
+        less than `max_age` seconds ago."""
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, last_index, last_timestamp, updated_at "
+                "FROM trackers WHERE sender_id = ?",
+                (sender_id,),
+            ).fetchone()
+            if row is None or row[0] is None:
+                return None
+            summary, last_index, last_timestamp, updated_at = row
+            if max_age is not None and updated_at < time.time() - max_age:
+                return None
+            events = self._conn.execute(
+                "SELECT event FROM events WHERE sender_id = ? ORDER BY seq",
+                (sender_id,),
+            ).fetchall()
+
+        tracker = codec.loads(summary)
+        tracker["events"] = [codec.loads(event) for (event,) in events]
+        info = None
+        if last_index is not None:
+            info = {"last_index": last_index, "last_timestamp": last_timestamp}
+        return tracker, info
+
+    def recent_sender_ids(self, since: float, limit: int = 1000) -> List[Text]:
+        """Sender ids of the trackers stored after `since`, latest first."""
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sender_id FROM trackers WHERE updated_at >= ? "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (since, limit),
+            ).fetchall()
+        return [sender_id for (sender_id,) in rows]
+
+    def delete(self, sender_id: Text) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM events WHERE sender_id = ?", (sender_id,))
+            self._conn.execute("DELETE FROM trackers WHERE sender_id = ?", (sender_id,))
+
+    def delete_older_than(self, timestamp: float) -> int:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "DELETE FROM events WHERE sender_id IN "
+                "(SELECT sender_id FROM trackers WHERE updated_at < ?)",
+                (timestamp,),
+            )
+            return self._conn.execute(
+                "DELETE FROM trackers WHERE updated_at < ?", (timestamp,)
+            ).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
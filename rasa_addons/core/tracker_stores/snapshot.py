@@ -0,0 +1,152 @@
+from typing import Text, Any, Dict, List
+
+# fields of a serialized tracker that replaying its events would restore
+CHECKPOINT_FIELDS = ["slots", "active_form", "latest_message", "paused"]
+
+
+def checkpoint(tracker: Dict[Text, Any]) -> Dict[Text, Any]:
+    return {field: tracker.get(field) for field in CHECKPOINT_FIELDS}
+
+
+def checkpoint_events(
+    state: Dict[Text, Any], timestamp: float, with_user_message: bool = True
+) -> List[Dict[Text, Any]]:
+    """Events restoring the checkpoint fields of `state` (e.g. a serialized
+    tracker), to prepend to a tail of events. The latest message is only
+    restored with `with_user_message`, i.e. when the tail has none."""
+
+    events = [
+        {"event": "slot", "timestamp": timestamp, "name": name, "value": value}
+        for name, value in (state.get("slots") or {}).items()
+    ]
+    active_form = state.get("active_form") or {}
+    if active_form.get("name"):
+        events.append(
+            {"event": "form", "timestamp": timestamp, "name": active_form["name"]}
+        )
+        if active_form.get("validate") is False:
+            events.append(
+                {"event": "form_validation", "timestamp": timestamp, "validate": False}
+            )
+    latest_message = state.get("latest_message") or {}
+    if with_user_message and latest_message.get("text") is not None:
+        events.append(
+            {
+                "event": "user",
+                "timestamp": timestamp,
+                "text": latest_message["text"],
+                "parse_data": latest_message,
+                "input_channel": state.get("latest_input_channel"),
+            }
+        )
+    if state.get("paused"):
+        events.append({"event": "pause", "timestamp": timestamp})
+    return events
+
+
+def replay_state(events: List[Dict[Text, Any]]) -> Dict[Text, Any]:
+    """The checkpoint fields `events` lead to, from the last event setting
+    each of them: slots, active form, paused state and latest message."""
+
+    def initial_state():
+        return {
+            "slots": {},
+            "active_form": {},
+            "latest_message": None,
+            "paused": False,
+        }
+
+    state = initial_state()
+    for event in events:
+        kind = event.get("event")
+        if kind == "slot":
+            state["slots"][event.get("name")] = event.get("value")
+        elif kind == "reset_slots":
+            state["slots"] = {}
+        elif kind == "restart":
+            state = initial_state()
+        elif kind == "form":
+            name = event.get("name")
+            state["active_form"] = {"name": name, "validate": True} if name else {}
+        elif kind == "form_validation" and state["active_form"]:
+            state["active_form"]["validate"] = event.get("validate")
+        elif kind == "pause":
+            state["paused"] = True
+        elif kind == "resume":
+            state["paused"] = False
+        elif kind == "user":
+            parse_data = event.get("parse_data") or {}
+            state["latest_message"] = {**parse_data, "text": event.get("text")}
+            state["latest_input_channel"] = event.get("input_channel")
+    return state
+
+
+def state_before(
+    state: Dict[Text, Any], events: List[Dict[Text, Any]]
+) -> Dict[Text, Any]:
+    """The checkpoint fields of `state` (e.g. a remote tracker) that already
+    held before its last `events`, i.e. that these events do not change: the
+    slots they do not set, the active form and paused state if they have no
+    form or pause events. Nothing is kept if they restart the conversation."""
+
+    kinds = {event.get("event") for event in events}
+    if "restart" in kinds:
+        return {}
+    before = dict(state)
+    if "reset_slots" in kinds:
+        before["slots"] = {}
+    else:
+        set_in_events = {e.get("name") for e in events if e.get("event") == "slot"}
+        before["slots"] = {
+            name: value
+            for name, value in (state.get("slots") or {}).items()
+            if name not in set_in_events
+        }
+    if kinds & {"form", "form_validation"}:
+        before["active_form"] = None
+    if kinds & {"pause", "resume"}:
+        before["paused"] = None
+    return before
+
+
+def _tail_start(events: List[Dict[Text, Any]], tail: int, floor: int) -> int:
+    # start the tail at a user message after `floor`, so it holds whole turns
+    start = max(len(events) - tail, 0)
+    for i in range(start, floor, -1):
+        if events[i].get("event") == "user":
+            return i
+    return start
+
+
+def has_user_message(events: List[Dict[Text, Any]]) -> bool:
+    return any(event.get("event") == "user" for event in events)
+
+
+def take_snapshot(tracker: Dict[Text, Any], tail: int) -> Dict[Text, Any]:
+    """Replace the events of a serialized tracker older than its last `tail`
+    ones with a checkpoint of the state they lead to, replayed from them.
+
+    The checkpoint is kept under `snapshot`, with the number of events it
+    replaces, the number of events restoring it and the timestamp of the
+    last replaced event."""
+
+    events = tracker.get("events") or []
+    previous = tracker.get("snapshot") or {}
+    restoring = previous.get("restoring_events", 0)
+    start = _tail_start(events, tail, restoring)
+    if start <= restoring:
+        return tracker
+    tail_events = events[start:]
+    timestamp = events[start - 1]["timestamp"]
+    # not the current state of the tracker, the tail changes it again
+    state = replay_state(events[:start])
+    restored = checkpoint_events(
+        state, timestamp, with_user_message=not has_user_message(tail_events)
+    )
+    snapshot = {
+        **checkpoint(state),
+        "events": previous.get("events", 0) + start - restoring,
+        "restoring_events": len(restored),
+        "timestamp": timestamp,
+    }
+    return {**tracker, "events": restored + tail_events, "snapshot": snapshot}
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from threading import Event, Lock, Thread
+from typing import Text, Any, Dict, Optional, Callable
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+TRACKER_CHANGED = """
+subscription trackerChanged($projectId: String!, $env: Environement) {
+    trackerChanged(projectId: $projectId, env: $env) {
+        senderId
+        lastIndex
+        lastTimestamp
+    }
+}
+"""
+
+
+def websocket_url(url: Text) -> Text:
+    if url.startswith("https://"):
+        return "wss://" + url[len("https://") :]
+    if url.startswith("http://"):
+        return "ws://" + url[len("http://") :]
+    return url
+
+
+class TrackerSubscription:
+    """Keeps track of the cached trackers that are in sync with Botfront.
+
+    A tracker is marked as synced (`mark_synced`) once fetched or saved, and
+    stays so until Botfront publishes a change with a later index than the
+    one `last_index` returns for it, i.e. a write from another instance.
+    Synced trackers can be served from the cache without any request.
+
+    Changes come from the `trackerChanged` subscription, run over a
+    websocket with the graphql-ws protocol in a thread with its own event
+    loop. The connection is reopened after `reconnect_delay` seconds when
+    it drops, doubling up to `max_reconnect_delay`. Changes published while
+    disconnected are lost, so no tracker is synced until reconnected and
+    synced again: `generation` changes on every (dis)connection and is
+    checked by `mark_synced`."""
+
+    def __init__(
+        self,
+        url: Text,
+        variables: Dict[Text, Any],
+        last_index: Callable[[Text], int],
+        headers: Optional[Dict[Text, Text]] = None,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+    ) -> None:
+        self.url = websocket_url(url)
+        self.variables = variables
+        self.last_index = last_index
+        self.headers = headers or {}
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.generation = 0
+        self.connected = Event()
+        self.changes = 0
+        self._synced = set()
+        self._notified_index = {}  # latest published index of known trackers
+        self._lock = Lock()
+        self._closed = False
+        self._loop = asyncio.new_event_loop()
+        self._task = None
+        self._thread = Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    @property
+    def is_connected(self) -> bool:
+        return self.connected.is_set()
+
+    def is_synced(self, sender_id: Text) -> bool:
+        with self._lock:
+            return sender_id in self._synced
+
+    def mark_synced(self, sender_id: Text, generation: int) -> None:
+        """Mark a tracker as synced, if no change was missed since
+        `generation` was read and it is not behind a published change."""
+
+        with self._lock:
+            if not self.is_connected or generation != self.generation:
+                return
+            if self.last_index(sender_id) >= self._notified_index.get(sender_id, -1):
+                self._synced.add(sender_id)
+
+    def forget(self, sender_id: Text) -> None:
+        # not locked: called on cache evictions, under the cache lock, which
+        # `last_index` takes under this lock
+        self._synced.discard(sender_id)
+        self._notified_index.pop(sender_id, None)
+
+    def _on_change(self, change: Dict[Text, Any]) -> None:
+        sender_id = change.get("senderId")
+        last_index = change.get("lastIndex")
+        if last_index is None:
+            return
+        with self._lock:
+            self.changes += 1
+            local_index = self.last_index(sender_id)
+            if local_index < 0:
+                # not a tracker of this instance
+                return
+            if last_index > self._notified_index.get(sender_id, -1):
+                self._notified_index[sender_id] = last_index
+            if sender_id in self._synced and last_index > local_index:
+                logger.debug(f"Tracker for user {sender_id} changed remotely")
+                self._synced.discard(sender_id)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._task = self._loop.create_task(self._listen_forever())
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    async def _listen_forever(self):
+        delay = self.reconnect_delay
+        async with aiohttp.ClientSession() as session:
+            while not self._closed:
+                try:
+                    await self._listen(session)
+                    delay = self.reconnect_delay
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    logger.warning(f"Tracker subscription to {self.url} failed: {e}")
+                finally:
+                    self._set_disconnected()
+                if not self._closed:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _listen(self, session: aiohttp.ClientSession):
+        async with session.ws_connect(self.url, protocols=["graphql-ws"]) as ws:
+            await ws.send_json({"type": "connection_init", "payload": self.headers})
+            await ws.send_json(
+                {
+                    "id": "1",
+                    "type": "start",
+                    "payload": {
+                        "query": TRACKER_CHANGED,
+                        "variables": self.variables,
+                    },
+                }
+            )
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                self._handle(message.json())
+
+    def _handle(self, message: Dict[Text, Any]):
+        kind = message.get("type")
+        if kind == "connection_ack":
+            with self._lock:
+                self.generation += 1
+                self.connected.set()
+            logger.debug(f"Subscribed to tracker changes on {self.url}")
+        elif kind == "data":
+            payload = message.get("payload") or {}
+            change = (payload.get("data") or {}).get("trackerChanged")
+            if change:
+                self._on_change(change)
+        elif kind in ["error", "connection_error"]:
+            raise ValueError(message.get("payload"))
+        elif kind == "complete":
+            raise ValueError("subscription completed by the server")
+
+    def _set_disconnected(self):
+        if not self.connected.is_set():
+            return
+        with self._lock:
+            self.connected.clear()
+            self.generation += 1
+            self._synced.clear()
+            self._notified_index.clear()
+
+    def close(self) -> None:
+        self._closed = True
+        if self._task is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        self._thread.join(timeout=5)
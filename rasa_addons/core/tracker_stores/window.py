@@ -0,0 +1,42 @@
+import logging
+from typing import Text, Any, Dict, Optional
+
+from rasa.utils.io import read_config_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EVENTS_PER_TURN = 10
+
+# max_history of the policies that do not set it in the config
+DEFAULT_MAX_HISTORY = {
+    "MemoizationPolicy": 5,
+    "AugmentedMemoizationPolicy": 5,
+    "FormPolicy": 2,
+    "MappingPolicy": 1,
+    "FallbackPolicy": 1,
+    "TwoStageFallbackPolicy": 1,
+    "BotfrontMappingPolicy": 1,
+    "BotfrontDisambiguationPolicy": 1,
+}
+
+
+def _policy_max_history(policy: Dict[Text, Any]) -> Optional[int]:
+    if policy.get("max_history") is not None:
+        return policy["max_history"]
+    name = policy.get("name", "").split(".")[-1]
+    return DEFAULT_MAX_HISTORY.get(name)
+
+
+def window_from_policy_config(
+    config_file: Text, events_per_turn: int = DEFAULT_EVENTS_PER_TURN
+) -> Optional[int]:
+    """Number of events the policies of `config_file` need, or None if one of
+    them may look at the whole conversation (e.g. no max_history)."""
+
+    policies = read_config_file(config_file).get("policies") or []
+    max_histories = [_policy_max_history(policy) for policy in policies]
+    if not max_histories or None in max_histories:
+        logger.debug(f"Policies in {config_file} need the full tracker history")
+        return None
+    return max(max_histories) * events_per_turn
+
@@ -0,0 +1,241 @@
+import logging
+import os
+import sqlite3
+from threading import Condition, Thread
+from typing import Text, Any, Dict, Optional, List, Callable, Set, Tuple
+
+from rasa_addons.core import codec
+from rasa_addons.core.tracker_stores.write_behind import PendingWrite
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS writes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        sender_id TEXT NOT NULL,
+        tracker TEXT NOT NULL,
+        is_insert INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS writes_sender ON writes (sender_id, seq)",
+    """
+    CREATE TABLE IF NOT EXISTS dead_letters (
+        seq INTEGER PRIMARY KEY,
+        sender_id TEXT NOT NULL,
+        tracker TEXT NOT NULL,
+        is_insert INTEGER NOT NULL
+    )
+    """,
+]
+
+
+class WriteAheadLog:
+    """Tracker writes that could not be sent to Botfront, kept to be replayed.
+
+    Writes are logged in order and a replay thread sends them every
+    `interval` seconds, up to `batch_size` senders at a time. All the logged
+    writes of a sender are merged (events appended) and sent at once, so
+    they reach Botfront in order. A write is only dropped from the log once
+    Botfront acknowledged it. While a sender has logged writes, its new
+    writes must be logged too, see `has_pending`.
+
+    The writes Botfront rejected `max_attempts` times in a row are moved to
+    the `dead_letters` table, so a sender whose writes cannot be applied
+    does not stay pending forever. `flush` maps the senders it could not
+    send at all (e.g. Botfront is down) to nothing, those rejected to None:
+    only rejections count as attempts.
+
+    The log is an SQLite database: in `directory` if given, so it survives
+    restarts, in memory otherwise. `flush` and `on_flushed` work as for
+    `WriteBehindQueue`, and are called without holding the log's lock: the
+    tracker cache calls `has_pending` while holding its own lock, so the
+    cache lock is always taken first."""
+
+    def __init__(
+        self,
+        flush: Callable[[List[PendingWrite]], Dict[Text, Any]],
+        on_flushed: Callable[[Text, Optional[Dict[Text, Any]]], None],
+        directory: Optional[Text] = None,
+        project_id: Optional[Text] = None,
+        env: Text = "",
+        batch_size: int = 50,
+        interval: float = 5.0,
+        max_attempts: int = 5,
+    ) -> None:
+        self._flush = flush
+        self._on_flushed = on_flushed
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.path = ":memory:"
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            name = "-".join(p for p in ["write-ahead-log", project_id, env] if p)
+            self.path = os.path.join(directory, f"{name}.db")
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._pending = {}  # sender_id -> number of logged writes
+        self._attempts = {}  # sender_id -> number of rejected replays
+        self._last_timestamps = {}
+        for sender_id, count in self._conn.execute(
+            "SELECT sender_id, COUNT(*) FROM writes GROUP BY sender_id"
+        ):
+            self._pending[sender_id] = count
+        if self._pending:
+            logger.info(f"Replaying the logged writes of {len(self)} tracker(s)")
+        self._closed = False
+        self._condition = Condition()
+        self._replayer = Thread(target=self._run)
+        self._replayer.setDaemon(True)
+        self._replayer.start()
+
+    def append(self, sender_id: Text, tracker: Dict[Text, Any], insert: bool) -> None:
+        events = tracker.get("events") or []
+        with self._condition:
+            self._conn.execute(
+                "INSERT INTO writes (sender_id, tracker, is_insert) VALUES (?, ?, ?)",
+                (sender_id, codec.dumps(tracker), int(insert)),
+            )
+            self._pending[sender_id] = self._pending.get(sender_id, 0) + 1
+            if events:
+                self._last_timestamps[sender_id] = events[-1]["timestamp"]
+        logger.debug(f"Logged a write of the tracker for user {sender_id}")
+
+    def has_pending(self, sender_id: Text) -> bool:
+        with self._condition:
+            return sender_id in self._pending
+
+    def last_timestamp(self, sender_id: Text) -> float:
+        """Timestamp of the last event logged for this sender."""
+
+        return self._last_timestamps.get(sender_id, 0)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _take_batch(self, skipped: Set[Text]) -> List[Tuple[int, PendingWrite]]:
+        """Merge the logged writes of the first `batch_size` senders not in
+        `skipped`, and return them with the sequence number of their last
+        write."""
+
+        senders = []
+        for (sender_id,) in self._conn.execute(
+            "SELECT sender_id FROM writes GROUP BY sender_id ORDER BY MIN(seq)"
+        ):
+            if len(senders) >= self.batch_size:
+                break
+            if sender_id not in skipped:
+                senders.append(sender_id)
+        batch = []
+        for sender_id in senders:
+            rows = self._conn.execute(
+                "SELECT seq, tracker, is_insert FROM writes "
+                "WHERE sender_id = ? ORDER BY seq",
+                (sender_id,),
+            ).fetchall()
+            merged, events = {}, []
+            for _, tracker, _ in rows:
+                tracker = codec.loads(tracker)
+                events.extend(tracker.get("events") or [])
+                merged = tracker
+            merged["events"] = events
+            batch.append((rows[-1][0], (sender_id, merged, bool(rows[0][2]))))
+        return batch
+
+    def _acknowledge(self, sender_id: Text, last_seq: int) -> None:
+        self._attempts.pop(sender_id, None)
+        self._conn.execute(
+            "DELETE FROM writes WHERE sender_id = ? AND seq <= ?",
+            (sender_id, last_seq),
+        )
+        left = self._conn.execute(
+            "SELECT COUNT(*) FROM writes WHERE sender_id = ?", (sender_id,)
+        ).fetchone()[0]
+        if left:
+            self._pending[sender_id] = left
+        else:
+            self._pending.pop(sender_id, None)
+            self._last_timestamps.pop(sender_id, None)
+
+    def _reject(self, sender_id: Text, last_seq: int) -> None:
+        attempts = self._attempts.get(sender_id, 0) + 1
+        if attempts < self.max_attempts:
+            self._attempts[sender_id] = attempts
+            return
+        self._conn.execute(
+            "INSERT INTO dead_letters SELECT seq, sender_id, tracker, is_insert "
+            "FROM writes WHERE sender_id = ? AND seq <= ?",
+            (sender_id, last_seq),
+        )
+        self._acknowledge(sender_id, last_seq)
+        logger.error(
+            f"Botfront rejected the logged writes of the tracker for user "
+            f"{sender_id} {attempts} times, they were moved to the dead letters"
+        )
+
+    def _replay_batch(self, batch: List[Tuple[int, PendingWrite]]) -> Set[Text]:
+        """Send a batch of merged writes, return the senders not sent."""
+
+        writes = [write for _, write in batch]
+        try:
+            infos = self._flush(writes) or {}
+        except Exception as e:
+            logger.error(f"Could not replay {len(writes)} tracker write(s): {e}")
+            infos = {}
+        sent = [
+            (last_seq, sender_id, infos[sender_id])
+            for last_seq, (sender_id, _, _) in batch
+            if infos.get(sender_id) is not None
+        ]
+        # called without holding the condition, see the class docstring, and
+        # before the senders stop being reported as pending
+        for _, sender_id, info in sent:
+            self._on_flushed(sender_id, info)
+        with self._condition:
+            for last_seq, sender_id, _ in sent:
+                self._acknowledge(sender_id, last_seq)
+            for last_seq, (sender_id, _, _) in batch:
+                if sender_id in infos and infos[sender_id] is None:
+                    self._reject(sender_id, last_seq)
+        if sent:
+            logger.info(f"Replayed the logged writes of {len(sent)} tracker(s)")
+        return {sender_id for _, (sender_id, _, _) in batch} - {
+            sender_id for _, sender_id, _ in sent
+        }
+
+    def replay(self) -> bool:
+        """Send all the logged writes, one batch at a time, and return whether
+        all were sent. The senders whose writes fail are skipped until the
+        next replay, so they do not hold back the others."""
+
+        failed = set()
+        while True:
+            with self._condition:
+                batch = self._take_batch(failed)
+            if not batch:
+                return not failed
+            failed |= self._replay_batch(batch)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait(self.interval)
+                if self._closed:
+                    return
+            if self._pending:
+                self.replay()
+
+    def close(self) -> None:
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._replayer.join()
+        if self._pending:
+            self.replay()
+        self._conn.close()
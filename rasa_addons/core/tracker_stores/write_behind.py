@@ -0,0 +1,147 @@
+import logging
+import time
+from collections import OrderedDict
+from threading import Condition, Thread
+from typing import Text, Any, Dict, Optional, List, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (sender_id, tracker payload, whether it must be inserted)
+PendingWrite = Tuple[Text, Dict[Text, Any], bool]
+
+
+class WriteBehindQueue:
+    """Buffers tracker writes and sends them to Botfront in the background.
+
+    Writes are kept in one ordered slot per sender: successive saves of the
+    same conversation are merged (events appended) so a conversation never
+    has more than one pending write. A flusher thread hands up to
+    `batch_size` senders at a time to `flush`, either as soon as that many
+    senders are waiting or every `interval` seconds.
+
+    `flush` receives a list of `PendingWrite` and returns the remote tracker
+    info keyed by sender id; `on_flushed` is called with each of them before
+    the sender stops being reported as pending.
+
+    `flush` and `on_flushed` are called without holding the queue's lock: the
+    tracker cache calls `has_pending` and `forget` while holding its own
+    lock, so the cache lock is always taken first."""
+
+    def __init__(
+        self,
+        flush: Callable[[List[PendingWrite]], Dict[Text, Any]],
+        on_flushed: Callable[[Text, Optional[Dict[Text, Any]]], None],
+        batch_size: int = 50,
+        interval: float = 1.0,
+    ) -> None:
+        self._flush = flush
+        self._on_flushed = on_flushed
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pending = OrderedDict()
+        self._in_flight = set()
+        self._last_timestamps = {}
+        self._closed = False
+        self._condition = Condition()
+        self._flusher = Thread(target=self._run)
+        self._flusher.setDaemon(True)
+        self._flusher.start()
+
+    def put(self, sender_id: Text, tracker: Dict[Text, Any], insert: bool) -> None:
+        events = tracker.get("events") or []
+        with self._condition:
+            pending = self._pending.get(sender_id)
+            if pending is None:
+                self._pending[sender_id] = (dict(tracker), insert)
+            else:
+                # keep the latest summary, append the events to the pending ones
+                pending_tracker, pending_insert = pending
+                merged = dict(tracker)
+                merged["events"] = [*pending_tracker.get("events", []), *events]
+                self._pending[sender_id] = (merged, pending_insert)
+            if events:
+                self._last_timestamps[sender_id] = events[-1]["timestamp"]
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def has_pending(self, sender_id: Text) -> bool:
+        with self._condition:
+            return sender_id in self._pending or sender_id in self._in_flight
+
+    def last_timestamp(self, sender_id: Text) -> float:
+        """Timestamp of the last event queued for this sender."""
+
+        return self._last_timestamps.get(sender_id, 0)
+
+    def forget(self, sender_id: Text) -> None:
+        with self._condition:
+            if sender_id not in self._pending and sender_id not in self._in_flight:
+                self._last_timestamps.pop(sender_id, None)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _take_batch(self) -> List[PendingWrite]:
+        # a sender being flushed must be done before its next write is sent
+        senders = []
+        for sender_id in self._pending:
+            if len(senders) >= self.batch_size:
+                break
+            if sender_id not in self._in_flight:
+                senders.append(sender_id)
+        batch = []
+        for sender_id in senders:
+            tracker, insert = self._pending.pop(sender_id)
+            self._in_flight.add(sender_id)
+            batch.append((sender_id, tracker, insert))
+        return batch
+
+    def _send(self, batch: List[PendingWrite]) -> None:
+        try:
+            infos = self._flush(batch) or {}
+        except Exception as e:
+            logger.error(f"Could not flush {len(batch)} tracker(s): {e}")
+            infos = {}
+        # called without holding the condition, see the class docstring
+        for sender_id, _, _ in batch:
+            self._on_flushed(sender_id, infos.get(sender_id))
+        with self._condition:
+            for sender_id, _, _ in batch:
+                self._in_flight.discard(sender_id)
+            self._condition.notify_all()
+
+    def _run(self):
+        deadline = time.time() + self.interval
+        while True:
+            with self._condition:
+                while not self._closed and len(self._pending) < self.batch_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._closed:
+                    return
+                batch = self._take_batch()
+            deadline = time.time() + self.interval
+            if batch:
+                self._send(batch)
+
+    def flush(self) -> None:
+        """Send everything that is pending, blocking until it is done."""
+
+        while True:
+            with self._condition:
+                batch = self._take_batch()
+                while not batch and (self._pending or self._in_flight):
+                    self._condition.wait()
+                    batch = self._take_batch()
+            if not batch:
+                return
+            self._send(batch)
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._flusher.join()
+        self.flush()
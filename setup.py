@@ -20,8 +20,9 @@ setup(
         "fuzzy_matcher",
         "fbmessenger",
         "sgqlc",
+        "aiohttp",
     ],
-    packages=find_packages(exclude=["tests"]),
+    packages=find_packages(exclude=["tests", "benchmarks", "benchmarks.*"]),
     licence="Apache 2.0",
     url="https://botfront.io",
     author_email="hi@botfront.io",
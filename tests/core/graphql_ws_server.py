@@ -0,0 +1,69 @@
+import asyncio
+from threading import Event, Thread
+
+from aiohttp import web
+
+
+class SubscriptionServer:
+    """Stand-in for the Botfront GraphQL websocket endpoint, speaking the
+    graphql-ws protocol. Changes passed to `publish` are sent to every
+    started subscription."""
+
+    def __init__(self):
+        self.subscriptions = []
+        self._loop = asyncio.new_event_loop()
+        self._started = Event()
+        self._runner = None
+        self.port = None
+        Thread(target=self._run, daemon=True).start()
+        self._started.wait(5)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/graphql"
+
+    async def _handle(self, request):
+        ws = web.WebSocketResponse(protocols=["graphql-ws"])
+        await ws.prepare(request)
+        async for message in ws:
+            data = message.json()
+            if data["type"] == "connection_init":
+                await ws.send_json({"type": "connection_ack"})
+            elif data["type"] == "start":
+                self.subscriptions.append((ws, data["id"]))
+        return ws
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get("/graphql", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start())
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _publish(self, change):
+        for ws, subscription_id in self.subscriptions:
+            await ws.send_json(
+                {
+                    "type": "data",
+                    "id": subscription_id,
+                    "payload": {"data": {"trackerChanged": change}},
+                }
+            )
+
+    def publish(self, change):
+        asyncio.run_coroutine_threadsafe(self._publish(change), self._loop).result(5)
+
+    def stop(self):
+        async def cleanup():
+            await self._runner.cleanup()
+
+        asyncio.run_coroutine_threadsafe(cleanup(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
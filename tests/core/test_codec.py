@@ -0,0 +1,68 @@
+import gzip
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+
+import pytest
+
+from rasa_addons.core import codec
+from rasa_addons.core.graphql_endpoint import HTTPEndpoint
+
+tracker = {
+    "sender_id": "test",
+    "slots": {"name": "Zoë", "count": 2},
+    "events": [{"event": "user", "timestamp": 1.5, "text": "bonjour ✨"}] * 50,
+}
+
+
+@pytest.mark.parametrize("name", codec.available_codecs())
+def test_codecs_should_round_trip(name):
+    selected = codec.CODECS[name]
+    assert selected.loads(selected.dumps(tracker)) == tracker
+    # what the codec cannot encode goes through the standard library
+    assert selected.loads(selected.dumps({"big": 2 ** 70})) == {"big": 2 ** 70}
+
+
+def test_should_gzip_large_bodies():
+    data, headers = codec.encode_body(tracker, gzip_min_bytes=100)
+    assert headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(data)) == tracker
+    assert codec.decode_body(data, "gzip") == tracker
+
+    data, headers = codec.encode_body({"small": True}, gzip_min_bytes=100)
+    assert "Content-Encoding" not in headers
+    assert codec.decode_body(data) == {"small": True}
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        variables = json.loads(body)["variables"]
+        content = gzip.compress(json.dumps({"data": variables}).encode())
+        self.send_response(200)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_endpoint_should_send_and_receive_gzipped_json():
+    server = HTTPServer(("127.0.0.1", 0), EchoHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    transfers = []
+    endpoint = HTTPEndpoint(
+        f"http://127.0.0.1:{server.server_port}/graphql",
+        gzip_min_bytes=100,
+        on_transfer=lambda sent, received: transfers.append((sent, received)),
+    )
+    try:
+        response = endpoint("query { tracker }", {"tracker": tracker})
+    finally:
+        server.shutdown()
+    assert response == {"data": {"tracker": tracker}}
+    assert len(transfers) == 1 and transfers[0][0] < len(json.dumps(tracker))
@@ -0,0 +1,35 @@
+import pytest
+
+from rasa_addons.core.metrics import MetricsRegistry
+
+
+def test_should_expose_metrics_in_prometheus_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ["status"])
+    requests.labels("ok").inc()
+    requests.labels("ok").inc(2)
+    registry.gauge("entries", "Entries").set_function(lambda: 7)
+    latency = registry.histogram("latency_seconds", "Latency", buckets=[0.1, 1])
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    lines = registry.exposition().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{status="ok"} 3' in lines
+    assert "entries 7" in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "latency_seconds_sum 5.55" in lines
+    assert "latency_seconds_count 3" in lines
+
+
+def test_should_share_metrics_registered_twice():
+    registry = MetricsRegistry()
+    counter = registry.counter("calls_total", "Calls")
+    assert registry.counter("calls_total", "Calls") is counter
+    with pytest.raises(ValueError):
+        registry.gauge("calls_total", "Calls")
+    with pytest.raises(ValueError):
+        registry.counter("labelled_total", "Labelled", ["a"]).labels("x", "y")
@@ -0,0 +1,99 @@
+import asyncio
+import urllib.error
+
+import pytest
+
+from rasa_addons.core.nlg.cache import ResponseCache
+
+
+class FakeNLG:
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.calls = 0
+        self.fail = False
+
+    async def fetch(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise urllib.error.URLError("down")
+        return {"text": f"hello {self.calls}"}
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_concurrent_misses_should_share_request():
+    cache, nlg = ResponseCache(ttl=60), FakeNLG()
+
+    async def generate():
+        responses = await asyncio.gather(
+            *[cache.get("utter_greet", nlg.fetch) for _ in range(10)]
+        )
+        responses[0]["text"] = "modified"
+        return responses, await cache.get("utter_greet", nlg.fetch)
+
+    responses, cached = run(generate())
+    assert nlg.calls == 1
+    assert all(r == {"text": "hello 1"} for r in responses[1:])
+    assert cached == {"text": "hello 1"}
+    assert cache.stats()["hits"] == 1
+
+
+def test_should_serve_stale_response_while_refreshing():
+    cache, nlg = ResponseCache(ttl=0.05, stale_ttl=60), FakeNLG()
+
+    async def generate():
+        await cache.get("utter_greet", nlg.fetch)
+        await asyncio.sleep(0.06)
+        stale = await cache.get("utter_greet", nlg.fetch)
+        await asyncio.sleep(0.05)
+        return stale, await cache.get("utter_greet", nlg.fetch)
+
+    stale, refreshed = run(generate())
+    assert stale == {"text": "hello 1"}
+    assert refreshed == {"text": "hello 2"}
+    assert nlg.calls == 2
+
+
+def test_should_refresh_with_request_built_on_lookup():
+    cache, state = ResponseCache(ttl=0.05, stale_ttl=60), {"text": "hello 1"}
+
+    def fetch():
+        body = dict(state)
+
+        async def send():
+            await asyncio.sleep(0.01)
+            return body
+
+        return send()
+
+    async def generate():
+        await cache.get("utter_greet", fetch)
+        await asyncio.sleep(0.06)
+        state["text"] = "hello 2"
+        await cache.get("utter_greet", fetch)
+        # e.g. the tracker is updated before the refresh is sent
+        state["text"] = "hello 3"
+        await asyncio.sleep(0.05)
+        return await cache.get("utter_greet", fetch)
+
+    assert run(generate()) == {"text": "hello 2"}
+
+
+def test_should_not_cache_errors():
+    cache, nlg = ResponseCache(ttl=60, max_entries=1), FakeNLG()
+    nlg.fail = True
+    with pytest.raises(urllib.error.URLError):
+        run(cache.get("utter_greet", nlg.fetch))
+    assert len(cache) == 0
+
+    nlg.fail = False
+    run(cache.get("utter_greet", nlg.fetch))
+    run(cache.get("utter_bye", nlg.fetch))
+    assert len(cache) == 1
@@ -0,0 +1,199 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from jsonschema import ValidationError, validate
+from rasa.core.trackers import EventVerbosity
+from rasa.utils.endpoints import EndpointConfig
+
+from rasa_addons.core.nlg.graphql import (
+    GraphQLNaturalLanguageGenerator,
+    is_valid_response,
+    nlg_request_format,
+    nlg_response_format_spec,
+    tracker_projection,
+)
+
+
+class FakeMessage:
+    metadata = {"language": "en"}
+
+
+class FakeEvent:
+    def __init__(self, i):
+        self.i = i
+
+    def as_dict(self):
+        return {"event": "user", "text": f"message {self.i}"}
+
+
+class FakeTracker:
+    slots = {}
+    latest_message = FakeMessage()
+
+    def __init__(self, events=0):
+        self.events = [FakeEvent(i) for i in range(events)]
+
+    def current_slot_values(self):
+        return {}
+
+    def current_state(self, verbosity):
+        events = None
+        if verbosity == EventVerbosity.ALL:
+            events = [event.as_dict() for event in self.events]
+        return {"sender_id": "test", "slots": {"name": "Zoë"}, "events": events}
+
+
+def response_for(template):
+    return {"customText": template, "metadata": None}
+
+
+async def start_server(connections, requests=None):
+    async def handle(request):
+        connections.add(request.transport.get_extra_info("peername"))
+        variables = (await request.json())["variables"]
+        if requests is not None:
+            requests.append(variables)
+        if "template" in variables:
+            data = {"getResponse": response_for(variables["template"])}
+        else:
+            # aliased batch query, unknown templates fail
+            data = {
+                f"t{i}": response_for(variables[f"template{i}"])
+                if variables[f"template{i}"] != "utter_unknown"
+                else None
+                for i in range(len(variables) // 2 - 1)
+            }
+        return web.json_response({"data": data})
+
+    app = web.Application()
+    app.router.add_post("/graphql", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+# utterances of a turn reuse one keep-alive connection
+def test_generate_should_reuse_connection():
+    connections = set()
+
+    async def generate():
+        runner, port = await start_server(connections)
+        nlg = GraphQLNaturalLanguageGenerator(
+            endpoint_config=EndpointConfig(f"http://127.0.0.1:{port}/graphql")
+        )
+        responses = []
+        for template in ["utter_greet", "utter_ask_name", "utter_bye"]:
+            responses.append(await nlg.generate(template, FakeTracker(), "rest"))
+        await nlg.close()
+        await runner.cleanup()
+        return responses
+
+    loop = asyncio.new_event_loop()
+    responses = loop.run_until_complete(generate())
+    loop.close()
+    templates = [response["text"] for response in responses]
+    assert templates == ["utter_greet", "utter_ask_name", "utter_bye"]
+    assert len(connections) == 1
+
+
+def test_slim_payload_should_only_send_last_events():
+    tracker = FakeTracker(events=100)
+    body = nlg_request_format(
+        "utter_greet", tracker, "rest", projection=tracker_projection(None, 2)
+    )
+    assert body["tracker"]["slots"] == {"name": "Zoë"}
+    assert body["tracker"]["events"] == [
+        {"event": "user", "text": "message 98"},
+        {"event": "user", "text": "message 99"},
+    ]
+
+    projection = tracker_projection(["sender_id"], 0)
+    body = nlg_request_format("utter_greet", tracker, "rest", projection=projection)
+    assert body["tracker"] == {"sender_id": "test", "events": []}
+    body = nlg_request_format("utter_greet", tracker, "rest")
+    assert len(body["tracker"]["events"]) == 100
+
+
+# the utterances of a turn are resolved in one request, skipping cached ones
+def test_batch_should_resolve_templates_in_one_request():
+    requests = []
+
+    async def generate():
+        runner, port = await start_server(set(), requests)
+        nlg = GraphQLNaturalLanguageGenerator(
+            endpoint_config=EndpointConfig(
+                f"http://127.0.0.1:{port}/graphql", cache_ttl=60
+            )
+        )
+        await nlg.generate("utter_greet", FakeTracker(), "rest")
+        async with nlg.batch(FakeTracker(), "rest") as batch:
+            futures = [
+                batch.generate("utter_greet"),
+                batch.generate("utter_ask_name", form="user_form"),
+                batch.generate("utter_unknown"),
+            ]
+        await nlg.close()
+        await runner.cleanup()
+        return [future.result() for future in futures]
+
+    loop = asyncio.new_event_loop()
+    responses = loop.run_until_complete(generate())
+    loop.close()
+    assert [r["text"] for r in responses] == [
+        "utter_greet",
+        "utter_ask_name",
+        "utter_unknown",
+    ]
+    assert len(requests) == 2
+    assert requests[1]["template0"] == "utter_ask_name"
+    assert requests[1]["arguments0"]["form"] == "user_form"
+    assert requests[1]["template1"] == "utter_unknown"
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        {"text": "hello", "buttons": [{"title": "yes"}], "image": None},
+        {"custom": {"anything": True}, "elements": None},
+        {"text": 1},
+        {"buttons": ["yes"]},
+        {"attachment": []},
+        [],
+    ],
+)
+def test_compiled_check_should_agree_with_jsonschema(response):
+    try:
+        validate(response, nlg_response_format_spec())
+        valid = True
+    except ValidationError:
+        valid = False
+    assert is_valid_response(response) == valid
+    if not valid:
+        with pytest.raises(ValidationError, match="Failed to validate NLG"):
+            GraphQLNaturalLanguageGenerator.validate_response(response)
+
+
+def test_cached_responses_should_not_be_validated_again():
+    validated = []
+
+    async def generate():
+        runner, port = await start_server(set())
+        nlg = GraphQLNaturalLanguageGenerator(
+            endpoint_config=EndpointConfig(
+                f"http://127.0.0.1:{port}/graphql", cache_ttl=60
+            )
+        )
+        nlg.validate_response = lambda response: validated.append(response) or True
+        for _ in range(3):
+            await nlg.generate("utter_greet", FakeTracker(), "rest")
+        await nlg.generate_many(["utter_greet", "utter_bye"], FakeTracker(), "rest")
+        await nlg.close()
+        await runner.cleanup()
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(generate())
+    loop.close()
+    assert [r["text"] for r in validated] == ["utter_greet", "utter_bye"]
@@ -0,0 +1,89 @@
+import asyncio
+import urllib.error
+
+import pytest
+
+from rasa_addons.core.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitOpenError,
+    Resilience,
+)
+
+
+def failing(calls):
+    def fn():
+        calls.append(1)
+        raise urllib.error.URLError("down")
+
+    return fn
+
+
+def test_should_retry_idempotent_calls_only():
+    resilience = Resilience(retries=2, backoff=0)
+    calls = []
+    with pytest.raises(urllib.error.URLError):
+        resilience.call(failing(calls), idempotent=True)
+    assert len(calls) == 3
+
+    calls = []
+    with pytest.raises(urllib.error.URLError):
+        resilience.call(failing(calls))
+    assert len(calls) == 1
+    assert resilience.stats()["retries"] == 2
+
+
+def test_blocking_calls_should_use_blocking_retries():
+    resilience = Resilience(retries=2, backoff=0, blocking_retries=0)
+    calls = []
+    with pytest.raises(urllib.error.URLError):
+        resilience.call(failing(calls), idempotent=True)
+    assert len(calls) == 1
+
+    async def fail_async():
+        failing(calls)()
+
+    calls = []
+    loop = asyncio.new_event_loop()
+    with pytest.raises(urllib.error.URLError):
+        loop.run_until_complete(resilience.call_async(fail_async, idempotent=True))
+    loop.close()
+    assert len(calls) == 3
+
+
+def test_should_treat_error_responses_as_failures():
+    resilience = Resilience(retries=1, backoff=0)
+    responses = [{"data": None, "errors": [{"message": "HTTP 502"}]}, {"data": {}}]
+    assert resilience.call(lambda: responses.pop(0), idempotent=True) == {"data": {}}
+    assert resilience.stats()["failures"] == 1
+
+
+def test_breaker_should_fail_fast_while_open():
+    resilience = Resilience(retries=0, failure_threshold=2, reset_timeout=60)
+    calls = []
+    for _ in range(2):
+        with pytest.raises(urllib.error.URLError):
+            resilience.call(failing(calls))
+    assert resilience.breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        resilience.call(failing(calls))
+    assert len(calls) == 2
+    assert resilience.stats()["rejected"] == 1
+
+
+def test_breaker_should_close_after_successful_trial():
+    resilience = Resilience(retries=0, failure_threshold=1, reset_timeout=0)
+    with pytest.raises(urllib.error.URLError):
+        resilience.call(failing([]))
+    assert resilience.breaker.state == OPEN
+
+    async def ok():
+        assert resilience.breaker.state == HALF_OPEN
+        return {"data": {}}
+
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(resilience.call_async(ok)) == {"data": {}}
+    loop.close()
+    assert resilience.breaker.state == CLOSED
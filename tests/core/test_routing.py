@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+from rasa_addons.core.routing import HashRing, Router, create_app, extract_sender
+
+
+def test_ring_should_route_senders_consistently():
+    ring = HashRing(["http://rasa1", "http://rasa2", "http://rasa3"])
+    senders = [f"sender{i}" for i in range(1000)]
+    routes = {sender: ring.node_for(sender) for sender in senders}
+    assert set(routes.values()) == set(ring.nodes)
+    assert routes == {sender: ring.node_for(sender) for sender in senders}
+
+
+def test_ring_should_only_move_senders_of_changed_node():
+    ring = HashRing(["http://rasa1", "http://rasa2", "http://rasa3"])
+    senders = [f"sender{i}" for i in range(1000)]
+    before = {sender: ring.node_for(sender) for sender in senders}
+
+    ring.remove("http://rasa2")
+    after = {sender: ring.node_for(sender) for sender in senders}
+    moved = [s for s in senders if before[s] != after[s]]
+    assert all(before[s] == "http://rasa2" for s in moved)
+
+    ring.add("http://rasa2")
+    assert before == {sender: ring.node_for(sender) for sender in senders}
+
+
+def test_should_extract_sender():
+    assert extract_sender("/webhooks/rest/webhook", {"sender": "a"}) == "a"
+    assert extract_sender("/conversations/b/tracker/events", None) == "b"
+    messenger = {"entry": [{"messaging": [{"sender": {"id": "c"}}]}]}
+    assert extract_sender("/webhooks/facebook/webhook", messenger) == "c"
+    assert extract_sender("/", {"text": "hi"}) is None
+
+
+def test_backends_admin_should_require_token():
+    app = create_app(["http://rasa1"], admin_token="secret")
+    body = {"backend": "http://attacker"}
+    _, resp = app.test_client.post("/routing/backends", json=body)
+    assert resp.status == 401
+    headers = {"Authorization": "Bearer wrong"}
+    _, resp = app.test_client.post("/routing/backends", json=body, headers=headers)
+    assert resp.status == 401
+    assert app.router_front.ring.nodes == ["http://rasa1"]
+
+    headers = {"Authorization": "Bearer secret"}
+    _, resp = app.test_client.post("/routing/backends", json=body, headers=headers)
+    assert resp.status == 200
+    assert "http://attacker" in app.router_front.ring.nodes
+
+    # without a token, the backends cannot be changed at all
+    app = create_app(["http://rasa1"])
+    _, resp = app.test_client.get("/routing/backends")
+    assert resp.status == 401
+
+
+def test_forward_should_answer_gateway_timeout():
+    class SlowSession:
+        closed = False
+
+        def request(self, *args, **kwargs):
+            return self
+
+        async def __aenter__(self):
+            raise asyncio.TimeoutError()
+
+        async def __aexit__(self, *args):
+            pass
+
+    router = Router(["http://rasa1"], timeout=1)
+    router._session = SlowSession()
+    request = SimpleNamespace(
+        method="POST",
+        path="/webhooks/rest/webhook",
+        query_string="",
+        headers={},
+        body=b'{"sender": "a"}',
+        ip="127.0.0.1",
+    )
+    loop = asyncio.new_event_loop()
+    resp = loop.run_until_complete(router.forward(request))
+    loop.close()
+    assert resp.status == 504
@@ -0,0 +1,114 @@
+import time
+
+from rasa_addons.core.tracker_stores.cache import TrackerCache
+
+
+def _tracker(n_events):
+    return {"events": [{"event": "action", "timestamp": i} for i in range(n_events)]}
+
+
+def test_should_evict_least_recently_used():
+    cache = TrackerCache(max_entries=2)
+    cache["a"] = _tracker(1)
+    cache["b"] = _tracker(1)
+    cache.get("a")
+    cache["c"] = _tracker(1)
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_should_evict_info_with_tracker():
+    cache = TrackerCache(max_entries=1)
+    cache.info["a"] = {"last_index": 3, "last_timestamp": 1}
+    cache["a"] = _tracker(1)
+    cache["b"] = _tracker(1)
+    assert cache.info.get("a", -1) == -1
+    assert cache.get("a") is None
+
+
+def test_should_respect_max_bytes():
+    cache = TrackerCache(max_bytes=10000)
+    for sender_id in range(20):
+        cache[str(sender_id)] = _tracker(10)
+    assert cache.size_bytes <= 10000
+    assert len(cache) < 20
+
+
+def test_should_count_tracker_objects_in_max_bytes():
+    cache = TrackerCache(max_bytes=10000, live_size=lambda tracker: 6000)
+    for sender_id in ["a", "b", "c"]:
+        cache[sender_id] = _tracker(1)
+    cache.set_live("a", object())
+    cache.set_live("b", object())
+    assert cache.size_bytes <= 10000
+    assert "a" not in cache and "b" in cache
+
+    cache.set_live("b", None)
+    cache.set_live("c", object())
+    assert "b" in cache and "c" in cache
+
+
+def test_should_not_evict_protected_entries():
+    cache = TrackerCache(max_entries=1, is_evictable=lambda sender_id: sender_id != "a")
+    cache["a"] = _tracker(1)
+    cache["b"] = _tracker(1)
+    cache["c"] = _tracker(1)
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+
+
+def test_should_expire_idle_entries():
+    evicted = []
+    cache = TrackerCache(ttl=0.01, on_evict=evicted.append)
+    cache["a"] = _tracker(1)
+    time.sleep(0.02)
+    cache["b"] = _tracker(1)
+    cache.expire()
+    assert evicted == ["a"]
+    assert cache.get("b") is not None
+    assert cache.stats()["hits"] == 1
+
+
+def test_should_expire_entries_past_their_deadline():
+    now = time.time()
+    cache = TrackerCache(expires_at=lambda tracker: tracker.get("latest_event_time"))
+    cache["old"] = {"latest_event_time": now - 10, "events": []}
+    cache["recent"] = {"latest_event_time": now + 60, "events": []}
+    cache["updated"] = {"latest_event_time": now - 10, "events": []}
+    cache["updated"] = {"latest_event_time": now + 60, "events": []}
+    cache["idle"] = {"latest_event_time": None, "events": []}
+    assert cache.expire() == ["old"]
+    assert "recent" in cache and "updated" in cache and "idle" in cache
+
+
+def test_compact_cache_should_roundtrip_and_use_less_memory():
+    def user_event(i):
+        return {
+            "event": "user",
+            "timestamp": i,
+            "text": "hello",
+            "parse_data": {
+                "intent": {"name": "greet", "confidence": 0.9},
+                "intent_ranking": [
+                    {"name": "greet", "confidence": 0.9},
+                    {"name": "bye", "confidence": 0.1},
+                ],
+                "entities": [],
+            },
+        }
+
+    tracker = {"sender_id": "a", "slots": {}, "events": [user_event(0)]}
+    plain, compact = TrackerCache(), TrackerCache(compact=True)
+    for cache in [plain, compact]:
+        cache["a"] = tracker
+        for i in range(1, 100):
+            cache.append("a", {"latest_event_time": i}, [user_event(i)])
+
+    assert compact["a"] == plain["a"]
+    assert compact.get_summary("a")["latest_event_time"] == 99
+    assert compact.stats()["events"] == 100
+    assert compact.stats()["bytes_per_event"] < plain.stats()["bytes_per_event"] / 4
+
+    compact.set_live("a", object())
+    assert compact.get_live("a") is None
@@ -0,0 +1,71 @@
+from rasa_addons.core.tracker_stores.snapshot import take_snapshot
+
+
+def turn(i):
+    return [
+        {"event": "user", "timestamp": i, "text": f"hi {i}", "parse_data": {}},
+        {"event": "action", "timestamp": i + 0.5, "name": "utter_hi"},
+    ]
+
+
+def tracker_with_turns(count):
+    events = [e for i in range(count) for e in turn(i)]
+    events[1:1] = [
+        {"event": "slot", "timestamp": 0.1, "name": "name", "value": "bob"},
+        {"event": "form", "timestamp": 0.2, "name": "my_form"},
+        {"event": "form_validation", "timestamp": 0.3, "validate": False},
+    ]
+    return {
+        "sender_id": "test",
+        "slots": {"name": "bob"},
+        "active_form": {"name": "my_form", "validate": False},
+        "latest_message": {"text": f"hi {count - 1}"},
+        "paused": False,
+        "events": events,
+    }
+
+
+def test_should_keep_checkpoint_and_tail():
+    snapshot = take_snapshot(tracker_with_turns(10), tail=3)
+    events = snapshot["events"]
+    assert [e["event"] for e in events[:3]] == ["slot", "form", "form_validation"]
+    # the tail starts at a user message
+    assert events[3:] == turn(8) + turn(9)
+    assert snapshot["snapshot"]["slots"] == {"name": "bob"}
+    assert snapshot["snapshot"]["events"] == 19
+
+
+def test_should_count_events_across_snapshots():
+    snapshot = take_snapshot(tracker_with_turns(10), tail=4)
+    snapshot["events"] += turn(10) + turn(11)
+    snapshot = take_snapshot(snapshot, tail=4)
+    assert snapshot["events"][3:] == turn(10) + turn(11)
+    assert snapshot["snapshot"]["events"] == 23
+
+
+def test_should_not_snapshot_short_trackers():
+    tracker = tracker_with_turns(2)
+    assert take_snapshot(tracker, tail=8) is tracker
+
+
+# the checkpoint is the state before the tail, not the current one
+def test_checkpoint_should_hold_state_before_tail():
+    tracker = tracker_with_turns(10)
+    tracker["slots"]["email"] = "b@x.com"
+    tracker["active_form"] = {}
+    tracker["events"][-1:-1] = [
+        {"event": "slot", "timestamp": 9.2, "name": "email", "value": "b@x.com"},
+        {"event": "form", "timestamp": 9.3, "name": None},
+    ]
+    snapshot = take_snapshot(tracker, tail=3)
+    events = snapshot["events"]
+    assert [e["event"] for e in events[:3]] == ["slot", "form", "form_validation"]
+    assert events[0] == {
+        "event": "slot",
+        "timestamp": 8.5,
+        "name": "name",
+        "value": "bob",
+    }
+    assert events[3:] == tracker["events"][-4:]
+    assert snapshot["snapshot"]["slots"] == {"name": "bob"}
+    assert snapshot["snapshot"]["active_form"]["name"] == "my_form"
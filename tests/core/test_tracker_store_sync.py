@@ -1,7 +1,31 @@
 from rasa_addons.core.tracker_stores.botfront import BotfrontTrackerStore
+from rasa.core.trackers import EventVerbosity
+from rasa_addons.core.metrics import REGISTRY
 from unittest.mock import MagicMock
 from test_tracker_store_sync_data import *
 
+
+class FakeEvent:
+    def __init__(self, event):
+        self.event = event
+        self.timestamp = event["timestamp"]
+
+    def as_dict(self):
+        return self.event
+
+
+class FakeTracker:
+    def __init__(self, sender_id, state):
+        self.sender_id = sender_id
+        self.state = state
+        self.events = [FakeEvent(e) for e in state["events"]]
+        self.verbosities = []
+
+    def current_state(self, verbosity):
+        self.verbosities.append(verbosity)
+        events = list(self.state["events"]) if verbosity == EventVerbosity.ALL else None
+        return {**self.state, "events": events}
+
 # case where a client connect to a different rasa instance in between ( eg:rasa1, rasa2, rasa1 )
 # the local data should be updated
 def test_should_properly_update_tracker():
@@ -34,3 +58,572 @@ def test_should_not_update_events():
     assert (
             testTrackerStore.trackers['test'] == merged_tracker_2
         ) 
+
+
+# same as above, going through the non blocking path
+def test_should_properly_update_tracker_async():
+    import asyncio
+
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test')
+
+    def fetch_returning(value):
+        async def fetch(sender_id, last_index):
+            return value
+        return fetch
+
+    loop = asyncio.new_event_loop()
+    testTrackerStore._fetch_tracker_async = fetch_returning(tracker1)
+    loop.run_until_complete(testTrackerStore.retrieve_async('test'))
+
+    testTrackerStore._fetch_tracker_async = fetch_returning(tracker2)
+    loop.run_until_complete(testTrackerStore.retrieve_async('test'))
+    loop.close()
+    assert (
+            testTrackerStore.trackers['test'] == merged_tracker_1
+        )
+
+
+# a tracker warmed by the input channel is not fetched again by Rasa
+def test_retrieve_should_serve_warmed_tracker():
+    import asyncio
+
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test')
+
+    async def fetch(sender_id, last_index):
+        return tracker1
+
+    testTrackerStore._fetch_tracker_async = fetch
+    testTrackerStore._fetch_tracker = MagicMock(return_value=None)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(testTrackerStore.warm('test'))
+    loop.close()
+    testTrackerStore.retrieve('test')
+    testTrackerStore._fetch_tracker.assert_not_called()
+    assert testTrackerStore.trackers['test'] == tracker1['tracker']
+
+    # only the next retrieve
+    testTrackerStore.retrieve('test')
+    testTrackerStore._fetch_tracker.assert_called_once()
+
+
+# a save while a tracker is warmed must not get its events applied twice
+def test_warm_should_drop_fetch_overtaken_by_save():
+    import asyncio
+
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test', write_behind=False)
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'insertTrackerStore': {'lastIndex': 0, 'lastTimestamp': 1584646733.9250839}}
+    )
+    testTrackerStore.save(FakeTracker('test', tracker1['tracker']))
+
+    async def fetch(sender_id, last_index):
+        # Rasa saves the tracker while the request is awaited
+        testTrackerStore._graphql_query = MagicMock(
+            return_value={'updateTrackerStore': {'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}}
+        )
+        testTrackerStore.save(FakeTracker('test', merged_tracker_1))
+        return tracker2
+
+    testTrackerStore._fetch_tracker_async = fetch
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(testTrackerStore.warm('test'))
+    loop.close()
+    assert testTrackerStore.trackers['test']['events'] == merged_tracker_1['events']
+
+
+# with write-behind, successive saves of a conversation are sent together
+def test_write_behind_should_merge_saves():
+
+    testTrackerStore = BotfrontTrackerStore(
+        domain=None, url='test', write_behind=True, write_behind_interval=60
+    )
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'t0': {'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}}
+    )
+    testTrackerStore.save(FakeTracker('test', tracker1['tracker']))
+    testTrackerStore.save(FakeTracker('test', merged_tracker_1))
+    assert testTrackerStore._graphql_query.call_count == 0
+
+    testTrackerStore.write_behind.flush()
+    assert testTrackerStore._graphql_query.call_count == 1
+    params = testTrackerStore._graphql_query.call_args[0][1]
+    assert params['tracker0']['events'] == merged_tracker_1['events']
+    assert testTrackerStore.trackers_info['test']['last_index'] == 1
+
+
+# a failed alias of a bulk write only fails the write of its sender
+def test_bulk_write_should_keep_successful_aliases():
+
+    testTrackerStore = BotfrontTrackerStore(
+        domain=None, url='test', write_behind=True, write_behind_interval=60
+    )
+    testTrackerStore.graphql_endpoint = MagicMock(
+        return_value={
+            'data': {'t0': {'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}, 't1': None},
+            'errors': [{'message': 'could not write t1'}],
+        }
+    )
+    testTrackerStore.save(FakeTracker('test', tracker1['tracker']))
+    testTrackerStore.save(FakeTracker('other', tracker1['tracker']))
+    testTrackerStore.write_behind.flush()
+    assert testTrackerStore.trackers_info['test']['last_index'] == 1
+    assert not testTrackerStore.write_ahead_log.has_pending('test')
+    assert 'other' not in testTrackerStore.trackers_info
+    assert testTrackerStore.write_ahead_log.has_pending('other')
+
+
+# once a tracker is synced, only the events appended after it are serialized
+def test_should_only_serialize_new_events():
+
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test', write_behind=False)
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'insertTrackerStore': {'lastIndex': 0, 'lastTimestamp': 1584646733.9250839}}
+    )
+    testTrackerStore.save(FakeTracker('test', tracker1['tracker']))
+
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'updateTrackerStore': {'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}}
+    )
+    canonical_tracker = FakeTracker('test', merged_tracker_1)
+    testTrackerStore.save(canonical_tracker)
+    assert canonical_tracker.verbosities == [EventVerbosity.NONE]
+    params = testTrackerStore._graphql_query.call_args[0][1]
+    assert params['tracker']['events'] == merged_tracker_1['events'][1:]
+    assert testTrackerStore.trackers['test']['events'] == merged_tracker_1['events']
+
+
+# the tracker object is kept between turns, remote events are applied to it
+def test_should_apply_remote_events_to_cached_tracker():
+    from unittest.mock import patch
+    from rasa.core.domain import Domain
+    from rasa.core.events import ActionExecuted
+    from rasa.core.trackers import DialogueStateTracker
+
+    def remote(event, last_index):
+        return {
+            'tracker': {'sender_id': 'test', 'events': [event]},
+            'lastIndex': last_index,
+            'lastTimestamp': event['timestamp'],
+        }
+
+    testTrackerStore = BotfrontTrackerStore(domain=Domain.empty(), url='test', write_behind=False)
+    testTrackerStore._fetch_tracker = MagicMock(
+        return_value=remote(ActionExecuted('action_listen', timestamp=1).as_dict(), 0)
+    )
+    tracker = testTrackerStore.retrieve('test')
+
+    testTrackerStore._fetch_tracker = MagicMock(
+        return_value=remote(ActionExecuted('utter_greet', timestamp=2).as_dict(), 1)
+    )
+    with patch.object(DialogueStateTracker, 'from_dict') as from_dict:
+        updated_tracker = testTrackerStore.retrieve('test')
+    from_dict.assert_not_called()
+    assert updated_tracker is tracker
+    assert len(updated_tracker.events) == 2
+    assert updated_tracker.latest_action_name == 'utter_greet'
+
+
+# concurrent retrieves of a conversation share the same request
+def test_concurrent_retrieves_should_share_fetch():
+    import asyncio
+
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test')
+    calls = []
+
+    async def fetch(sender_id, last_index):
+        calls.append(last_index)
+        await asyncio.sleep(0.01)
+        return tracker1
+
+    async def retrieve_concurrently():
+        await asyncio.gather(
+            *[testTrackerStore.retrieve_async('test') for _ in range(3)]
+        )
+
+    testTrackerStore._fetch_tracker_async = fetch
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(retrieve_concurrently())
+    loop.close()
+    assert calls == [-1]
+    assert testTrackerStore.trackers_info['test']['last_index'] == 0
+
+
+# after a restart, trackers persisted on disk only need the new remote events
+def test_should_load_persisted_tracker(tmp_path):
+
+    testTrackerStore = BotfrontTrackerStore(
+        domain=None, url='test', persist_dir=str(tmp_path)
+    )
+    testTrackerStore._fetch_tracker = MagicMock(return_value=tracker1)
+    testTrackerStore.retrieve('test')
+
+    restartedTrackerStore = BotfrontTrackerStore(
+        domain=None, url='test', persist_dir=str(tmp_path)
+    )
+    restartedTrackerStore._fetch_tracker = MagicMock(return_value=tracker2)
+    restartedTrackerStore.retrieve('test')
+    restartedTrackerStore._fetch_tracker.assert_called_once_with(
+        'test', tracker1['lastIndex']
+    )
+    assert restartedTrackerStore.trackers['test'] == merged_tracker_1
+
+
+# the tracker is only downloaded when its remote version changed
+def test_version_probe_should_skip_unchanged_tracker():
+
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test', version_probe=True)
+    testTrackerStore._fetch_tracker = MagicMock(return_value=tracker1)
+    testTrackerStore.retrieve('test')
+
+    testTrackerStore._fetch_tracker_head = MagicMock(
+        return_value={'lastIndex': tracker1['lastIndex'], 'lastTimestamp': tracker1['lastTimestamp']}
+    )
+    testTrackerStore.retrieve('test')
+    testTrackerStore._fetch_tracker.assert_called_once()
+
+    testTrackerStore._fetch_tracker_head = MagicMock(
+        return_value={'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}
+    )
+    testTrackerStore._fetch_tracker = MagicMock(return_value=tracker2)
+    testTrackerStore.retrieve('test')
+    testTrackerStore._fetch_tracker.assert_called_once_with('test', tracker1['lastIndex'])
+    assert testTrackerStore.trackers['test'] == merged_tracker_1
+
+
+# within the freshness window, the cached tracker is served without any request
+def test_should_serve_fresh_tracker_without_request():
+
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test', freshness_window=60)
+    testTrackerStore._fetch_tracker = MagicMock(return_value=tracker1)
+    testTrackerStore.retrieve('test')
+    testTrackerStore.retrieve('test')
+    testTrackerStore._fetch_tracker.assert_called_once()
+
+
+# retrieves are timed per phase, with the number of events fetched
+def test_should_record_retrieve_metrics():
+
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test')
+    metrics = testTrackerStore.metrics
+    network, deserialize = metrics.retrieve_network, metrics.retrieve_deserialize
+    counts = network.counts[:], deserialize.counts[:], metrics.fetched_events.sum
+    testTrackerStore._fetch_tracker = MagicMock(return_value=tracker1)
+    testTrackerStore.retrieve('test')
+    assert sum(network.counts) == sum(counts[0]) + 1
+    assert sum(deserialize.counts) == sum(counts[1]) + 1
+    assert metrics.fetched_events.sum == counts[2] + len(tracker1['tracker']['events'])
+    assert 'botfront_tracker_store_cache_entries' in REGISTRY.exposition()
+
+
+# writes that fail while Botfront is down are logged, then replayed in order
+def test_should_replay_failed_writes():
+
+    testTrackerStore = BotfrontTrackerStore(
+        domain=None, url='test', write_behind=False, write_ahead_log_interval=60
+    )
+    testTrackerStore._graphql_query = MagicMock(return_value={})
+    testTrackerStore.save(FakeTracker('test', tracker1['tracker']))
+    testTrackerStore.save(FakeTracker('test', merged_tracker_1))
+    assert testTrackerStore._graphql_query.call_count == 1
+    assert testTrackerStore.write_ahead_log.has_pending('test')
+
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'t0': {'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}}
+    )
+    assert testTrackerStore.write_ahead_log.replay()
+    params = testTrackerStore._graphql_query.call_args[0][1]
+    assert params['tracker0']['events'] == merged_tracker_1['events']
+    assert 'insertTrackerStore' in testTrackerStore._graphql_query.call_args[0][0]
+    assert not testTrackerStore.write_ahead_log.has_pending('test')
+    assert testTrackerStore.trackers_info['test']['last_index'] == 1
+
+
+# the log is only opened by the first failed write, and can be closed twice
+def test_write_ahead_log_should_open_on_failure():
+
+    testTrackerStore = BotfrontTrackerStore(
+        domain=None, url='test', write_behind=False, write_ahead_log_interval=60
+    )
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'insertTrackerStore': {'lastIndex': 0, 'lastTimestamp': 1584646733.9250839}}
+    )
+    testTrackerStore.save(FakeTracker('test', tracker1['tracker']))
+    assert testTrackerStore.write_ahead_log is None
+
+    testTrackerStore._graphql_query = MagicMock(return_value={})
+    testTrackerStore.save(FakeTracker('test', merged_tracker_1))
+    assert testTrackerStore.write_ahead_log.has_pending('test')
+    testTrackerStore.write_ahead_log.close()
+    testTrackerStore.write_ahead_log.close()
+
+
+# failed writes are logged with the codec of the requests, e.g. numpy values
+def test_should_log_writes_with_numpy_values():
+    from rasa_addons.core.tracker_stores.write_ahead_log import WriteAheadLog
+
+    class Confidence:
+        # like numpy.float32, which the json module cannot encode
+        def __init__(self, value):
+            self.value = value
+
+        def tolist(self):
+            return self.value
+
+    flushed = []
+    log = WriteAheadLog(flushed.extend, lambda *args: None, interval=60)
+    event = {'event': 'user', 'timestamp': 1, 'parse_data': {'confidence': Confidence(0.5)}}
+    log.append('test', {'events': [event]}, True)
+    log.replay()
+    log.close()
+    assert flushed[0][1]['events'][0]['parse_data']['confidence'] == 0.5
+
+
+# a rejected write does not hold back the others, and is dropped after a while
+def test_replay_should_skip_then_drop_rejected_writes():
+    from rasa_addons.core.tracker_stores.write_ahead_log import WriteAheadLog
+
+    info = {'lastIndex': 0, 'lastTimestamp': 1}
+    flushed = []
+
+    def flush(writes):
+        flushed.extend(sender_id for sender_id, _, _ in writes)
+        return {sender_id: None if sender_id == 'bad' else info for sender_id, _, _ in writes}
+
+    log = WriteAheadLog(flush, lambda *args: None, batch_size=1, interval=60, max_attempts=2)
+    log.append('bad', {'events': []}, True)
+    log.append('good', {'events': []}, True)
+    assert not log.replay()
+    assert flushed == ['bad', 'good']
+    assert log.has_pending('bad') and not log.has_pending('good')
+
+    log.replay()
+    assert not log.has_pending('bad')
+    dead_letters = log._conn.execute('SELECT sender_id FROM dead_letters').fetchall()
+    assert dead_letters == [('bad',)]
+    log.close()
+
+
+def hold_cache_lock_while_flushing(testTrackerStore, queue, flush):
+    """Flush `queue` while another thread holds the cache lock, as the sweeper
+    does, and return whether `has_pending` could still be called."""
+    from threading import Event, Thread
+
+    on_flushed, flushing = queue._on_flushed, Event()
+
+    def notify_then_store(sender_id, info):
+        flushing.set()
+        on_flushed(sender_id, info)
+
+    queue._on_flushed = notify_then_store
+    with testTrackerStore.trackers.lock:
+        flusher = Thread(target=flush, daemon=True)
+        flusher.start()
+        assert flushing.wait(5)
+        checker = Thread(target=queue.has_pending, args=('test',), daemon=True)
+        checker.start()
+        checker.join(5)
+        checked = not checker.is_alive()
+    flusher.join(5)
+    return checked
+
+
+# the replay does not hold the log's lock while it updates the cache
+def test_replay_should_not_deadlock_with_cache():
+
+    testTrackerStore = BotfrontTrackerStore(
+        domain=None, url='test', write_behind=False, write_ahead_log_interval=60
+    )
+    testTrackerStore._graphql_query = MagicMock(return_value={})
+    testTrackerStore.save(FakeTracker('test', tracker1['tracker']))
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'t0': {'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}}
+    )
+    log = testTrackerStore.write_ahead_log
+    assert hold_cache_lock_while_flushing(testTrackerStore, log, log.replay)
+    assert not log.has_pending('test')
+    assert testTrackerStore.trackers_info['test']['last_index'] == 1
+
+
+# nor does the write-behind flush
+def test_write_behind_should_not_deadlock_with_cache():
+
+    testTrackerStore = BotfrontTrackerStore(
+        domain=None, url='test', write_behind=True, write_behind_interval=60
+    )
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'t0': {'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}}
+    )
+    testTrackerStore.save(FakeTracker('test', tracker1['tracker']))
+    queue = testTrackerStore.write_behind
+    assert hold_cache_lock_while_flushing(testTrackerStore, queue, queue.flush)
+    assert not queue.has_pending('test')
+    assert testTrackerStore.trackers_info['test']['last_index'] == 1
+
+
+# trackers can be loaded in the cache in bulk before their first message
+def test_should_prefetch_trackers():
+
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test')
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'t0': tracker1, 't1': None}
+    )
+    assert testTrackerStore.prefetch(['test', 'unknown']) == 1
+    assert testTrackerStore._graphql_query.call_count == 1
+    params = testTrackerStore._graphql_query.call_args[0][1]
+    assert params['senderId0'] == 'test' and params['after0'] == -1
+    assert testTrackerStore.trackers['test'] == tracker1['tracker']
+    assert 'unknown' not in testTrackerStore.trackers
+
+    testTrackerStore._fetch_tracker = MagicMock(return_value=tracker2)
+    testTrackerStore.retrieve('test')
+    testTrackerStore._fetch_tracker.assert_called_once_with('test', tracker1['lastIndex'])
+
+
+# a tracker saved while it is prefetched keeps its saved events only
+def test_prefetch_should_skip_trackers_saved_meanwhile():
+
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test', write_behind_interval=60)
+    testTrackerStore._fetch_tracker = MagicMock(return_value=tracker1)
+    testTrackerStore.retrieve('test')
+
+    def bulk_fetch(fetches):
+        testTrackerStore.save(FakeTracker('test', merged_tracker_1))
+        return {'test': tracker2}
+
+    testTrackerStore._bulk_fetch_gql = bulk_fetch
+    assert testTrackerStore.prefetch(['test']) == 0
+    assert testTrackerStore.trackers['test']['events'] == merged_tracker_1['events']
+
+
+# with a fetch window, the slots set before the window are restored from the snapshot
+def test_windowed_fetch_should_restore_slots():
+
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test', fetch_window=1)
+    testTrackerStore._graphql_query = MagicMock(return_value={'trackerStore': tracker1})
+    testTrackerStore.retrieve('test')
+    assert testTrackerStore._graphql_query.call_args[0][1]['maxEvents'] == 1
+    events = testTrackerStore.trackers['test']['events']
+    assert events[-1] == tracker1['tracker']['events'][0]
+    slots = {e['name']: e['value'] for e in events if e['event'] == 'slot'}
+    assert slots == tracker1['tracker']['slots']
+
+    testTrackerStore.backfill('test')
+    assert testTrackerStore._graphql_query.call_args[0][1]['maxEvents'] == 100
+    assert testTrackerStore.trackers['test'] == tracker1['tracker']
+
+
+# only the slots not set in a truncated window are restored, before it
+def test_windowed_fetch_should_only_restore_slots_set_before_window():
+
+    remote = {
+        'tracker': {
+            **tracker1['tracker'],
+            'slots': {'name': 'bob', 'fallback_language': 'en'},
+            'events': [
+                {'event': 'user', 'timestamp': 2, 'text': 'bob', 'parse_data': {}},
+                {'event': 'slot', 'timestamp': 3, 'name': 'name', 'value': 'bob'},
+            ],
+        },
+        'lastIndex': 2,
+        'lastTimestamp': 3,
+    }
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test', fetch_window=2)
+    testTrackerStore._graphql_query = MagicMock(return_value={'trackerStore': remote})
+    testTrackerStore.retrieve('test')
+    events = testTrackerStore.trackers['test']['events']
+    assert events[0] == {
+        'event': 'slot', 'timestamp': 2, 'name': 'fallback_language', 'value': 'en'
+    }
+    assert events[1:] == remote['tracker']['events']
+
+    # a window that is not truncated holds the whole conversation
+    testTrackerStore = BotfrontTrackerStore(domain=None, url='test', fetch_window=3)
+    testTrackerStore._graphql_query = MagicMock(return_value={'trackerStore': remote})
+    testTrackerStore.retrieve('test')
+    assert testTrackerStore.trackers['test']['events'] == remote['tracker']['events']
+
+
+# long trackers are replaced by a checkpoint and their last events
+def test_should_snapshot_long_trackers():
+
+    testTrackerStore = BotfrontTrackerStore(
+        domain=None, url='test', write_behind=False, snapshot_every=1, snapshot_tail=1
+    )
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'insertTrackerStore': {'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}}
+    )
+    testTrackerStore.save(FakeTracker('test', merged_tracker_1))
+    events = testTrackerStore.trackers['test']['events']
+    assert events[-1] == merged_tracker_1['events'][-1]
+    # no slot is set by the replaced events, so none is restored
+    assert events == merged_tracker_1['events'][-1:]
+    assert testTrackerStore.trackers_info['test']['last_index'] == 1
+
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'updateTrackerStore': {'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}}
+    )
+    testTrackerStore.save(FakeTracker('test', merged_tracker_1))
+    params = testTrackerStore._graphql_query.call_args[0][1]
+    assert params['tracker']['snapshot']['events'] == 1
+
+
+# a snapshot replaced by the remote tracker is not sent
+def test_should_not_send_snapshot_dropped_by_reset():
+
+    testTrackerStore = BotfrontTrackerStore(
+        domain=None,
+        url='test',
+        write_behind=False,
+        snapshot_every=1,
+        snapshot_tail=1,
+        max_events=1,
+    )
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'insertTrackerStore': {'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}}
+    )
+    testTrackerStore.save(FakeTracker('test', merged_tracker_1))
+
+    # the remote window is full, the cached tracker is replaced
+    testTrackerStore._fetch_tracker = MagicMock(return_value=tracker2)
+    testTrackerStore.retrieve('test')
+    testTrackerStore._graphql_query = MagicMock(
+        return_value={'updateTrackerStore': {'lastIndex': 1, 'lastTimestamp': 1684646733.9250839}}
+    )
+    testTrackerStore.save(FakeTracker('test', merged_tracker_1))
+    params = testTrackerStore._graphql_query.call_args[0][1]
+    assert 'snapshot' not in params['tracker']
+
+
+def wait_for(condition, timeout=5):
+    import time
+
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+# with a subscription, trackers are only fetched again when changed by another instance
+def test_subscription_should_invalidate_changed_trackers():
+    from graphql_ws_server import SubscriptionServer
+
+    server = SubscriptionServer()
+    testTrackerStore = BotfrontTrackerStore(
+        domain=None, url='test', subscribe_to_changes=True, subscription_url=server.url
+    )
+    subscription = testTrackerStore.subscription
+    wait_for(lambda: subscription.is_connected and server.subscriptions)
+
+    testTrackerStore._fetch_tracker = MagicMock(return_value=tracker1)
+    testTrackerStore.retrieve('test')
+    testTrackerStore.retrieve('test')
+    testTrackerStore._fetch_tracker.assert_called_once()
+
+    server.publish({'senderId': 'test', 'lastIndex': 1, 'lastTimestamp': 1684646733.9250839})
+    wait_for(lambda: not subscription.is_synced('test'))
+    testTrackerStore._fetch_tracker = MagicMock(return_value=tracker2)
+    testTrackerStore.retrieve('test')
+    testTrackerStore._fetch_tracker.assert_called_once_with('test', tracker1['lastIndex'])
+
+    subscription.close()
+    server.stop()